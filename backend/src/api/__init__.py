@@ -1,5 +1,7 @@
 from .arxiv import router as arxiv_router
+from .cache import router as cache_router
+from .metrics import router as metrics_router
 from .queries import router as queries_router
 from .results import router as results_router
 
-__all__ = ["arxiv_router", "queries_router", "results_router"]
+__all__ = ["arxiv_router", "cache_router", "metrics_router", "queries_router", "results_router"]
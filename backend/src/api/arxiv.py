@@ -1,93 +1,272 @@
 import logging
-import os
-from urllib.parse import urlencode
+import math
+from typing import Awaitable, Callable, Optional
 
-import feedparser
-import requests
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query
+from fastapi.responses import JSONResponse
+from httpx import AsyncClient, HTTPError
+from sqlalchemy import update
 from sqlalchemy.exc import SQLAlchemyError
-from sqlalchemy.orm import Session
-from tenacity import retry, stop_after_attempt, wait_exponential
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 
-from .utils import get_db
-from ..models import ArxivQuery, ArxivResult
-from ..schemas import ArxivSearchParams
+from .results import load_results_page
+from .utils import (embed_page, get_arxiv_breaker, get_arxiv_client, get_db, get_response_cache, get_search_cache,
+                    get_search_flights, get_search_jobs, get_session_factory)
+from ..arxiv_client import ARXIV_MAX_PAGE_SIZE, build_arxiv_url, build_search_query, open_arxiv_stream
+from ..atom import AtomStreamParser
+from ..breaker import CIRCUIT_CLOSED, CIRCUIT_OPEN, CircuitBreaker, CircuitOpen
+from ..cache import CachedSearch, ResponseCache, SearchCache, StoredSearch, fetch_stored_search, search_key
+from ..harvest import HARVEST_COMPLETE, claim_harvest, harvest_progress, run_harvest, start_harvest
+from ..jobs import JobQueue, QueueFull
+from ..metrics import STALE_RESPONSES
+from ..models import ArxivQuery
+from ..pagination import MAX_ITEMS_PER_PAGE
+from ..ratelimit import PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE, RateLimited
+from ..schemas import ArxivSearchParams, HarvestResponse, JobResponse
+from ..singleflight import SingleFlight
+from ..storage import insert_query, store_feed
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
 
-@retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10))
-def fetch_arxiv_data(url):
-    response = requests.get(url)
-    response.raise_for_status()
-    return response.content
+async def search_and_store(params: ArxivSearchParams, key: str, session_factory: async_sessionmaker,
+                           client: AsyncClient, cache: SearchCache, pages: ResponseCache,
+                           priority: int = PRIORITY_INTERACTIVE) -> CachedSearch:
+    limit = min(params.max_results, ARXIV_MAX_PAGE_SIZE)
+    url = build_arxiv_url(build_search_query(params), 0, limit)
+    logger.info(f"Querying arXiv API with URL: {url}")
+
+    parser = AtomStreamParser()
+    response = await open_arxiv_stream(client, url, priority)
+    try:
+        async with session_factory() as db, db.begin():
+            query_id = await insert_query(db, query="", search_key=key, status=200, num_results=0)
+            # What was stored, not the feed's opensearch total: a short feed must not promise pages it lacks.
+            stored = await store_feed(db, query_id, response, parser, limit)
+            await db.execute(update(ArxivQuery).where(ArxivQuery.id == query_id).values(
+                query=parser.title,
+                num_results=stored
+            ))
+    finally:
+        await response.aclose()
+    pages.invalidate()
+    logger.info(f"Received {stored} of {parser.total_results} results from arXiv API")
+
+    cached = CachedSearch(query_id, stored)
+    cache.set(key, cached)
+    logger.info(f"Stored query with id: {query_id}, num_results: {stored}")
+    return cached
 
 
-@router.post("/arxiv", response_model=dict, tags=["arXiv"])
-async def arxiv_endpoint(params: ArxivSearchParams, db: Session = Depends(get_db)):
+async def run_search(params: ArxivSearchParams, session_factory: async_sessionmaker, client: AsyncClient,
+                     cache: SearchCache, pages: ResponseCache, flights: SingleFlight,
+                     priority: int = PRIORITY_INTERACTIVE) -> CachedSearch:
+    key = search_key(params)
+    async with session_factory() as db:
+        cached = await cache.get(db, key)
+    if cached is not None:
+        return cached
+    return await flights.do(key, lambda: search_and_store(params, key, session_factory, client, cache, pages,
+                                                          priority))
+
+
+@router.post("/arxiv", response_model=dict, tags=["arXiv"], responses={202: {"model": JobResponse}})
+async def arxiv_endpoint(
+        params: ArxivSearchParams,
+        background_tasks: BackgroundTasks,
+        mode: str = Query("sync", pattern="^(sync|async)$",
+                          description="'async' queues the search and answers 202 with a job id"),
+        results_per_page: Optional[int] = Query(None, ge=1, le=MAX_ITEMS_PER_PAGE,
+                                                description="Also answer with the first page of results, "
+                                                            "this many items long"),
+        db: AsyncSession = Depends(get_db),
+        session_factory: async_sessionmaker = Depends(get_session_factory),
+        client: AsyncClient = Depends(get_arxiv_client),
+        cache: SearchCache = Depends(get_search_cache),
+        pages: ResponseCache = Depends(get_response_cache),
+        flights: SingleFlight = Depends(get_search_flights),
+        jobs: JobQueue = Depends(get_search_jobs),
+        breaker: CircuitBreaker = Depends(get_arxiv_breaker)
+):
     logger.info(f"Received arXiv request: {params}")
 
     if not any([params.author, params.title, params.journal]):
         raise HTTPException(status_code=400, detail="At least one of author, title, or journal must be provided")
 
+    key = search_key(params)
     try:
-        query_parts = []
-        if params.author:
-            query_parts.append(f"au:{params.author}")
-        if params.title:
-            query_parts.append(f"ti:{params.title}")
-        if params.journal:
-            query_parts.append(f"jr:{params.journal}")
-
-        query = "+AND+".join(query_parts)
-
-        query_params = {
-            'search_query': query,
-            'start': 0,
-            'max_results': params.max_results,
-            'sortBy': 'relevance',
-            'sortOrder': 'descending'
-        }
-
-        base_url = os.getenv('ARXIV_API_URL', 'https://export.arxiv.org/api/query')
-        url = f"{base_url}?{urlencode(query_params)}"
-
-        logger.info(f"Querying arXiv API with URL: {url}")
-
-        content = fetch_arxiv_data(url)
-        feed = feedparser.parse(content)
-        logger.info(f"Received {len(feed.entries)} results from arXiv API")
-
-        query = ArxivQuery(
-            query=feed.get("feed", {}).get("title", ""),
-            status=200,  # Assuming success since we got past the request
-            num_results=min(int(feed.get("feed", {}).get("opensearch_totalresults", 0)), 100)
-        )
-        db.add(query)
-        db.commit()
-        db.refresh(query)
-
-        for entry in feed.entries[:100]:
-            result = ArxivResult(
-                query_id=query.id,
-                author=", ".join([author.get("name", "") for author in entry.get("authors", [])]),
-                title=entry.get("title", ""),
-                journal=entry.get("arxiv_journal_ref", "")
-            )
-            db.add(result)
-        db.commit()
-        logger.info(f"Stored query with id: {query.id}, num_results: {query.num_results}")
-
-        return {"message": "Query results stored successfully", "query_id": query.id, "num_results": query.num_results}
-    except requests.RequestException as error:
+        cached = await cache.get(db, key)
+        if cached is not None:
+            logger.info(f"Serving query {cached.query_id} from the search cache")
+            return await search_response(db, pages, "Query results served from cache", cached, results_per_page)
+
+        if mode == "async":
+            return await enqueue_search(params, jobs)
+
+        def search(priority: int = PRIORITY_INTERACTIVE):
+            return search_and_store(params, key, session_factory, client, cache, pages, priority)
+
+        # While arXiv is down, an older copy of the same search beats waiting. Once the circuit is half open, the
+        # copy is refreshed in the background; with the circuit closed, identical searches share one flight instead.
+        if breaker.state != CIRCUIT_CLOSED:
+            stale = await find_stale_search(session_factory, key)
+            if stale is not None:
+                if breaker.state != CIRCUIT_OPEN and key not in flights:
+                    background_tasks.add_task(refresh_search, flights, key, search)
+                return await stale_response(db, pages, stale, results_per_page)
+            breaker.check()
+
+        try:
+            stored = await flights.do(key, search)
+        except (HTTPError, CircuitOpen, RateLimited):
+            stale = await find_stale_search(session_factory, key)
+            if stale is None:
+                raise
+            return await stale_response(db, pages, stale, results_per_page)
+
+        return await search_response(db, pages, "Query results stored successfully", stored, results_per_page)
+    except HTTPException:
+        raise
+    except CircuitOpen as error:
+        logger.warning(f"Failing arXiv search fast: {str(error)}")
+        raise HTTPException(status_code=503, detail="arXiv is unavailable, try again later",
+                            headers={"Retry-After": str(math.ceil(error.retry_after))})
+    except RateLimited as error:
+        logger.warning(f"Refused arXiv search: {str(error)}")
+        raise HTTPException(status_code=503, detail="Too many arXiv searches queued, try again later",
+                            headers={"Retry-After": str(math.ceil(error.retry_after))})
+    except HTTPError as error:
         logger.error(f"Error querying arXiv API: {str(error)}")
         raise HTTPException(status_code=503, detail="Error connecting to arXiv API")
     except SQLAlchemyError as error:
         logger.error(f"Database error: {str(error)}")
-        db.rollback()
         raise HTTPException(status_code=500, detail="Database error occurred")
     except Exception as error:
         logger.error(f"Unexpected error in arxiv_endpoint: {str(error)}")
-        db.rollback()
         raise HTTPException(status_code=500, detail="An unexpected error occurred")
+
+
+async def search_response(db: AsyncSession, pages: ResponseCache, message: str, search: CachedSearch,
+                          results_per_page: Optional[int], **extra):
+    payload = {"message": message, "query_id": search.query_id, "num_results": search.num_results, **extra}
+    if results_per_page is None:
+        return payload
+    # The first page goes through the response cache, so paging back to it later is a hit.
+    first_page = await load_results_page(db, pages, search.query_id, 0, results_per_page)
+    return embed_page(payload, "results", first_page)
+
+
+async def find_stale_search(session_factory: async_sessionmaker, key: str) -> Optional[StoredSearch]:
+    # A session of its own: coalesced requests look for a stale copy while the flight holds theirs.
+    async with session_factory() as db:
+        return await fetch_stored_search(db, key)
+
+
+async def stale_response(db: AsyncSession, pages: ResponseCache, stale: StoredSearch,
+                         results_per_page: Optional[int]):
+    STALE_RESPONSES.inc()
+    logger.info(f"Serving stale query {stale.query_id} from {stale.timestamp.isoformat()}")
+    return await search_response(db, pages, "arXiv is unavailable, serving previously stored results",
+                                 CachedSearch(stale.query_id, stale.num_results), results_per_page,
+                                 stale=True, fetched_at=stale.timestamp.isoformat())
+
+
+async def refresh_search(flights: SingleFlight, key: str, search: Callable[[int], Awaitable[CachedSearch]]):
+    try:
+        await flights.do(key, lambda: search(PRIORITY_BACKGROUND))
+    except (HTTPError, CircuitOpen, RateLimited, SQLAlchemyError) as error:
+        logger.warning(f"Background refresh of a stale search failed: {str(error)}")
+
+
+async def enqueue_search(params: ArxivSearchParams, jobs: JobQueue) -> JSONResponse:
+    try:
+        job_id = await jobs.submit(params)
+    except QueueFull:
+        logger.warning("Rejected arXiv search: job queue is full")
+        raise HTTPException(status_code=503, detail="Search queue is full, try again later",
+                            headers={"Retry-After": "5"})
+    logger.info(f"Queued arXiv search as job {job_id}")
+    return JSONResponse(
+        status_code=202,
+        content=JobResponse(job_id=job_id, status="queued").model_dump(),
+        headers={"Location": f"/arxiv/jobs/{job_id}"}
+    )
+
+
+@router.get("/arxiv/jobs", response_model=dict, tags=["arXiv"])
+async def jobs_endpoint(jobs: JobQueue = Depends(get_search_jobs)):
+    return jobs.stats()
+
+
+@router.get("/arxiv/jobs/{job_id}", response_model=JobResponse, tags=["arXiv"])
+async def job_status_endpoint(job_id: str, jobs: JobQueue = Depends(get_search_jobs)):
+    job = await jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+@router.post("/arxiv/harvest", response_model=HarvestResponse, status_code=202, tags=["arXiv"])
+async def harvest_endpoint(
+        params: ArxivSearchParams,
+        background_tasks: BackgroundTasks,
+        session_factory: async_sessionmaker = Depends(get_session_factory),
+        client: AsyncClient = Depends(get_arxiv_client),
+        pages: ResponseCache = Depends(get_response_cache),
+        flights: SingleFlight = Depends(get_search_flights)
+):
+    logger.info(f"Received harvest request: {params}")
+
+    if not any([params.author, params.title, params.journal]):
+        raise HTTPException(status_code=400, detail="At least one of author, title, or journal must be provided")
+
+    try:
+        query = await start_harvest(session_factory, build_search_query(params), params.max_results)
+    except SQLAlchemyError as error:
+        logger.error(f"Database error: {str(error)}")
+        raise HTTPException(status_code=500, detail="Database error occurred")
+    pages.invalidate()
+
+    background_tasks.add_task(flights.do, ("harvest", query.id),
+                              lambda: run_harvest(query.id, session_factory, client, pages))
+    return harvest_progress(query)
+
+
+@router.get("/arxiv/harvest/{query_id}", response_model=HarvestResponse, tags=["arXiv"])
+async def harvest_status_endpoint(query_id: int, db: AsyncSession = Depends(get_db)):
+    query = await db.get(ArxivQuery, query_id)
+    if query is None or query.harvest_state is None:
+        raise HTTPException(status_code=404, detail="Harvest not found")
+    return harvest_progress(query)
+
+
+@router.post("/arxiv/harvest/{query_id}/resume", response_model=HarvestResponse, status_code=202, tags=["arXiv"])
+async def harvest_resume_endpoint(
+        query_id: int,
+        background_tasks: BackgroundTasks,
+        db: AsyncSession = Depends(get_db),
+        session_factory: async_sessionmaker = Depends(get_session_factory),
+        client: AsyncClient = Depends(get_arxiv_client),
+        pages: ResponseCache = Depends(get_response_cache),
+        flights: SingleFlight = Depends(get_search_flights)
+):
+    query = await db.get(ArxivQuery, query_id)
+    if query is None or query.harvest_state is None:
+        raise HTTPException(status_code=404, detail="Harvest not found")
+    if query.harvest_state == HARVEST_COMPLETE:
+        return harvest_progress(query)
+
+    # Claimed in the database, not just in this worker, so two resumes never page the same windows.
+    try:
+        claimed = await claim_harvest(session_factory, query_id)
+    except SQLAlchemyError as error:
+        logger.error(f"Database error: {str(error)}")
+        raise HTTPException(status_code=500, detail="Database error occurred")
+    if not claimed:
+        raise HTTPException(status_code=409, detail="Harvest is already running")
+
+    background_tasks.add_task(flights.do, ("harvest", query_id),
+                              lambda: run_harvest(query_id, session_factory, client, pages))
+    await db.refresh(query)
+    return harvest_progress(query)
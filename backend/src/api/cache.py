@@ -0,0 +1,16 @@
+from fastapi import APIRouter, Depends
+
+from .utils import get_response_cache, get_search_cache, get_search_flights
+from ..cache import ResponseCache, SearchCache
+from ..singleflight import SingleFlight
+
+router = APIRouter()
+
+
+@router.get("/cache", response_model=dict, tags=["Cache"])
+async def cache_endpoint(
+        search_cache: SearchCache = Depends(get_search_cache),
+        response_cache: ResponseCache = Depends(get_response_cache),
+        search_flights: SingleFlight = Depends(get_search_flights)
+):
+    return {"search": search_cache.stats(), "responses": response_cache.stats(), "in_flight": search_flights.stats()}
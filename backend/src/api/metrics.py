@@ -0,0 +1,11 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from ..metrics import CONTENT_TYPE, REGISTRY
+
+router = APIRouter()
+
+
+@router.get("/metrics", response_class=PlainTextResponse, tags=["Metrics"])
+async def metrics_endpoint():
+    return PlainTextResponse(REGISTRY.render(), media_type=CONTENT_TYPE)
@@ -1,58 +1,105 @@
 import logging
-from datetime import datetime
+from datetime import datetime, timezone
 from typing import Optional
 
-from fastapi import APIRouter, Depends, Query, HTTPException
+from fastapi import APIRouter, Depends, Query, HTTPException, Request
+from sqlalchemy import Select, func, select
 from sqlalchemy.exc import SQLAlchemyError
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from tenacity import retry, stop_after_attempt, wait_exponential
 
-from .utils import get_db
+from .utils import REVALIDATE_CACHE_CONTROL, ModelJSONResponse, get_db, get_response_cache, json_page, page_response
+from ..cache import ResponseCache
+from ..metrics import record_retry
 from ..models import ArxivQuery
-from ..schemas import PaginatedResponse, QueryResponse
+from ..pagination import MAX_ITEMS_PER_PAGE, Cursor, InvalidCursor, decode_cursor, seek, window
+from ..schemas import QueryPage
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
 
-@retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10))
-def fetch_queries(db: Session, query_start_time: datetime, query_end_time: Optional[datetime], skip: int, limit: int):
-    query = db.query(ArxivQuery).filter(ArxivQuery.timestamp >= query_start_time)
+QUERY_KEY = (ArxivQuery.timestamp, ArxivQuery.id)
+# Only what QueryResponse and the cursor need, so rows come back as plain tuples instead of entities.
+QUERY_COLUMNS = (ArxivQuery.id, ArxivQuery.query, ArxivQuery.timestamp, ArxivQuery.status, ArxivQuery.num_results)
+
+
+def normalize_time(value: Optional[datetime]) -> Optional[str]:
+    if value is None:
+        return None
+    return (value.astimezone(timezone.utc) if value.tzinfo else value).isoformat()
+
+
+def select_queries(query_start_time: datetime, query_end_time: Optional[datetime], *columns) -> Select:
+    statement = select(*(columns or (ArxivQuery.id,))).where(ArxivQuery.timestamp >= query_start_time)
     if query_end_time:
-        query = query.filter(ArxivQuery.timestamp <= query_end_time)
-    return query.order_by(ArxivQuery.timestamp.desc()).offset(skip).limit(limit).all()
+        statement = statement.where(ArxivQuery.timestamp <= query_end_time)
+    return statement
+
 
+@retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10),
+       before_sleep=record_retry)
+async def count_queries(db: AsyncSession, query_start_time: datetime, query_end_time: Optional[datetime]):
+    statement = select_queries(query_start_time, query_end_time)
+    return await db.scalar(select(func.count()).select_from(statement.subquery()))
 
-@router.get("/queries", response_model=PaginatedResponse, tags=["Queries"])
+
+@retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10),
+       before_sleep=record_retry)
+async def fetch_queries(db: AsyncSession, query_start_time: datetime, query_end_time: Optional[datetime], skip: int,
+                        limit: int, cursor: Optional[Cursor] = None):
+    statement = seek(select_queries(query_start_time, query_end_time, *QUERY_COLUMNS), QUERY_KEY, cursor, limit)
+    if cursor is None:
+        statement = statement.offset(skip)
+    return (await db.execute(statement)).all()
+
+
+@router.get("/queries", response_model=QueryPage, response_class=ModelJSONResponse, tags=["Queries"])
 async def queries_endpoint(
+        request: Request,
         query_start_time: datetime = Query(..., description="Start time for query range"),
         query_end_time: Optional[datetime] = Query(None, description="End time for query range"),
-        page: int = Query(0, ge=0, lt=10, description="Page number (0-9)"),
-        items_per_page: int = Query(10, const=True, description="Number of items per page (fixed at 10)"),
-        db: Session = Depends(get_db)
+        page: int = Query(0, ge=0, description="Page number, ignored when a cursor is given"),
+        items_per_page: int = Query(10, ge=1, le=MAX_ITEMS_PER_PAGE, description="Number of items per page"),
+        cursor: Optional[str] = Query(None, description="next_cursor or prev_cursor of a previous page"),
+        include_total: bool = Query(False, description="Count all matching queries (costs a full range scan)"),
+        db: AsyncSession = Depends(get_db),
+        pages: ResponseCache = Depends(get_response_cache)
 ):
-    logger.info(f"Received request for queries: start={query_start_time}, end={query_end_time}, page={page}")
+    logger.info(f"Received request for queries: start={query_start_time}, end={query_end_time}, page={page}, "
+                f"cursor={cursor}")
 
     try:
-        query = db.query(ArxivQuery).filter(ArxivQuery.timestamp >= query_start_time)
-        if query_end_time:
-            query = query.filter(ArxivQuery.timestamp <= query_end_time)
+        seek_cursor = decode_cursor(cursor, QUERY_KEY) if cursor else None
+    except InvalidCursor:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
 
-        total = query.count()
-        results = query.order_by(ArxivQuery.timestamp.desc()).offset(page * items_per_page).limit(items_per_page).all()
+    key = ("queries", normalize_time(query_start_time), normalize_time(query_end_time), page, items_per_page, cursor,
+           include_total)
+    cached = pages.get(key)
+    if cached is not None:
+        return page_response(request, cached)
+    generation = pages.generation
+
+    try:
+        total = await count_queries(db, query_start_time, query_end_time) if include_total else None
+        rows = await fetch_queries(db, query_start_time, query_end_time, page * items_per_page, items_per_page,
+                                   seek_cursor)
+        results, next_cursor, prev_cursor = window(rows, lambda row: (row.timestamp, row.id), seek_cursor,
+                                                   items_per_page, has_previous=page > 0)
 
         logger.info(f"Returning {len(results)} queries out of {total}")
-        return PaginatedResponse(
-            total=min(total, 100),
-            page=page,
-            items_per_page=items_per_page,
-            items=[QueryResponse(
-                query=result.query,
-                timestamp=result.timestamp,
-                status=result.status,
-                num_results=result.num_results
-            ) for result in results]
-        )
+        payload = QueryPage.model_validate({
+            "total": total,
+            "page": None if seek_cursor else page,
+            "items_per_page": items_per_page,
+            "next_cursor": next_cursor,
+            "prev_cursor": prev_cursor,
+            "items": results
+        }, from_attributes=True)
+        body = json_page(payload, REVALIDATE_CACHE_CONTROL)
+        pages.set(key, body, pinned=False, generation=generation)
+        return page_response(request, body)
     except SQLAlchemyError as error:
         logger.error(f"Database error: {str(error)}")
         raise HTTPException(status_code=500, detail="Database error occurred")
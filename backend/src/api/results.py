@@ -1,61 +1,194 @@
 import logging
+from typing import Optional
 
-from fastapi import APIRouter, Depends, Query, HTTPException
-from sqlalchemy import and_
+from fastapi import APIRouter, Depends, Query, HTTPException, Request, Response
+from sqlalchemy import select
 from sqlalchemy.exc import SQLAlchemyError
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from tenacity import retry, stop_after_attempt, wait_exponential
 
-from .utils import get_db
-from ..models import ArxivResult, ArxivQuery
-from ..schemas import PaginatedResponse, ResultResponse
+from .utils import (IMMUTABLE_CACHE_CONTROL, REVALIDATE_CACHE_CONTROL, ModelJSONResponse, get_db,
+                    get_response_cache, json_page, page_response)
+from ..cache import CachedPage, ResponseCache
+from ..harvest import HARVEST_COMPLETE
+from ..metrics import record_retry
+from ..models import ArxivQuery, Paper, QueryResult
+from ..pagination import MAX_ITEMS_PER_PAGE, Cursor, InvalidCursor, decode_cursor, seek, window
+from ..schemas import ResultPage
+from ..search import search_results_statement
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
+RESULT_KEY = (QueryResult.query_id, QueryResult.rank)
+# What serve_results needs to know about a query, without loading the entity.
+QUERY_SUMMARY = select(ArxivQuery.id, ArxivQuery.num_results, ArxivQuery.harvest_state)
 
-@retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10))
-def fetch_latest_query(db: Session):
-    return db.query(ArxivQuery).order_by(ArxivQuery.id.desc()).first()
 
+@retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10),
+       before_sleep=record_retry)
+async def fetch_latest_query(db: AsyncSession):
+    return (await db.execute(QUERY_SUMMARY.order_by(ArxivQuery.id.desc()).limit(1))).first()
 
-@retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10))
-def fetch_results(db: Session, query_id: int, skip: int, limit: int):
-    return db.query(ArxivResult).filter(and_(ArxivResult.query_id == query_id)).order_by(
-        ArxivResult.id.desc()).offset(skip).limit(limit).all()
 
+@retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10),
+       before_sleep=record_retry)
+async def fetch_query(db: AsyncSession, query_id: int):
+    return (await db.execute(QUERY_SUMMARY.where(ArxivQuery.id == query_id))).first()
 
-@router.get("/results", response_model=PaginatedResponse, tags=["Results"])
+
+def results_statement(query_id: int, skip: int, limit: int, cursor: Optional[Cursor] = None):
+    """One page of the results of ``query_id``, in rank order."""
+    statement = (select(QueryResult.query_id, QueryResult.rank, Paper.title, Paper.authors.label("author"),
+                        Paper.journal)
+                 .join(Paper, Paper.id == QueryResult.paper_id)
+                 .where(QueryResult.query_id == query_id))
+    statement = seek(statement, RESULT_KEY, cursor, limit, descending=False)
+    if cursor is None:
+        statement = statement.offset(skip)
+    return statement
+
+
+@retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10),
+       before_sleep=record_retry)
+async def fetch_results(db: AsyncSession, query_id: int, skip: int, limit: int, cursor: Optional[Cursor] = None):
+    return (await db.execute(results_statement(query_id, skip, limit, cursor))).all()
+
+
+@retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10),
+       before_sleep=record_retry)
+async def search_stored_results(db: AsyncSession, terms: str, skip: int, limit: int):
+    dialect = (await db.connection()).dialect.name
+    statement = search_results_statement(dialect, terms).offset(skip).limit(limit)
+    return (await db.execute(statement)).all()
+
+
+def is_complete(query) -> bool:
+    """Whether the stored results of ``query`` can no longer change."""
+    return query.harvest_state in (None, HARVEST_COMPLETE)
+
+
+async def serve_results(request: Request, db: AsyncSession, pages: ResponseCache, query_id: Optional[int], page: int,
+                        items_per_page: int, cursor: Optional[str]) -> Response:
+    return page_response(request, await load_results_page(db, pages, query_id, page, items_per_page, cursor))
+
+
+async def load_results_page(db: AsyncSession, pages: ResponseCache, query_id: Optional[int], page: int,
+                            items_per_page: int, cursor: Optional[str] = None) -> CachedPage:
+    """The serialized results page, from the response cache when possible."""
+    try:
+        seek_cursor = decode_cursor(cursor, RESULT_KEY) if cursor else None
+    except InvalidCursor:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if seek_cursor is not None and query_id is not None and seek_cursor.key[0] != query_id:
+        raise HTTPException(status_code=400, detail="Cursor belongs to a different query")
+
+    key = ("results", query_id, page, items_per_page, cursor)
+    cached = pages.get(key)
+    if cached is not None:
+        return cached
+    generation = pages.generation
+
+    try:
+        if seek_cursor is not None:
+            query = await fetch_query(db, seek_cursor.key[0])
+        elif query_id is not None:
+            query = await fetch_query(db, query_id)
+        else:
+            query = await fetch_latest_query(db)
+
+        if query is None:
+            if query_id is not None:
+                raise HTTPException(status_code=404, detail="Query not found")
+            empty = json_page(ResultPage(total=0, page=page, items_per_page=items_per_page, items=[]),
+                              REVALIDATE_CACHE_CONTROL)
+            pages.set(key, empty, pinned=False, generation=generation)
+            return empty
+
+        total = query.num_results
+        rows = await fetch_results(db, query.id, page * items_per_page, items_per_page, seek_cursor)
+        results, next_cursor, prev_cursor = window(rows, lambda row: (row.query_id, row.rank), seek_cursor,
+                                                   items_per_page, has_previous=page > 0)
+
+        logger.info(f"Returning {len(results)} results of query {query.id} out of {total}")
+        payload = ResultPage.model_validate({
+            "total": total,
+            "page": None if seek_cursor else page,
+            "items_per_page": items_per_page,
+            "next_cursor": next_cursor,
+            "prev_cursor": prev_cursor,
+            "items": results
+        }, from_attributes=True)
+        # "The latest query" moves with every search; a page pinned to one finished query never does.
+        pinned = query_id is not None or seek_cursor is not None
+        immutable = pinned and is_complete(query)
+        body = json_page(payload, IMMUTABLE_CACHE_CONTROL if immutable else REVALIDATE_CACHE_CONTROL)
+        pages.set(key, body, pinned=immutable, generation=generation)
+        return body
+    except HTTPException:
+        raise
+    except SQLAlchemyError as error:
+        logger.error(f"Database error: {str(error)}")
+        raise HTTPException(status_code=500, detail="Database error occurred")
+    except Exception as error:
+        logger.error(f"Unexpected error in results_endpoint: {str(error)}")
+        raise HTTPException(status_code=500, detail="An unexpected error occurred")
+
+
+@router.get("/results", response_model=ResultPage, response_class=ModelJSONResponse, tags=["Results"])
 async def results_endpoint(
-        page: int = Query(0, ge=0, lt=10, description="Page number (0-9)"),
-        items_per_page: int = Query(10, const=True, description="Number of items per page (fixed at 10)"),
-        db: Session = Depends(get_db)
+        request: Request,
+        query_id: Optional[int] = Query(None, description="Query whose results to page through, the latest if omitted"),
+        page: int = Query(0, ge=0, description="Page number, ignored when a cursor is given"),
+        items_per_page: int = Query(10, ge=1, le=MAX_ITEMS_PER_PAGE, description="Number of items per page"),
+        cursor: Optional[str] = Query(None, description="next_cursor or prev_cursor of a previous page"),
+        db: AsyncSession = Depends(get_db),
+        pages: ResponseCache = Depends(get_response_cache)
 ):
-    logger.info(f"Received request for results: page={page}")
+    logger.info(f"Received request for results: query_id={query_id}, page={page}, cursor={cursor}")
+    return await serve_results(request, db, pages, query_id, page, items_per_page, cursor)
+
+
+@router.get("/queries/{query_id}/results", response_model=ResultPage, response_class=ModelJSONResponse,
+            tags=["Results"])
+async def query_results_endpoint(
+        query_id: int,
+        request: Request,
+        page: int = Query(0, ge=0, description="Page number, ignored when a cursor is given"),
+        items_per_page: int = Query(10, ge=1, le=MAX_ITEMS_PER_PAGE, description="Number of items per page"),
+        cursor: Optional[str] = Query(None, description="next_cursor or prev_cursor of a previous page"),
+        db: AsyncSession = Depends(get_db),
+        pages: ResponseCache = Depends(get_response_cache)
+):
+    logger.info(f"Received request for results of query {query_id}: page={page}, cursor={cursor}")
+    return await serve_results(request, db, pages, query_id, page, items_per_page, cursor)
+
+
+@router.get("/results/search", response_model=ResultPage, response_class=ModelJSONResponse, tags=["Results"])
+async def search_results_endpoint(
+        q: str = Query(..., description="Words to look for in stored titles, authors and journals"),
+        page: int = Query(0, ge=0, description="Page number"),
+        items_per_page: int = Query(10, ge=1, le=MAX_ITEMS_PER_PAGE, description="Number of items per page"),
+        db: AsyncSession = Depends(get_db)
+):
+    logger.info(f"Received full-text search over stored results: q={q}, page={page}")
+
+    if not q.split():
+        raise HTTPException(status_code=400, detail="Search terms must not be empty")
 
     try:
-        latest_query: ArxivQuery | None = fetch_latest_query(db)
-
-        if latest_query is None:
-            return PaginatedResponse(total=0, page=page, items_per_page=items_per_page, items=[])
-
-        total = latest_query.num_results
-        results = fetch_results(db, latest_query.id, page * items_per_page, items_per_page)
-
-        logger.info(f"Returning {len(results)} results out of {total}")
-        return PaginatedResponse(
-            total=min(total, 100),
-            page=page,
-            items_per_page=items_per_page,
-            items=[ResultResponse(
-                author=result.author,
-                title=result.title,
-                journal=result.journal
-            ) for result in results]
-        )
+        results = await search_stored_results(db, q, page * items_per_page, items_per_page)
+
+        logger.info(f"Returning {len(results)} stored results matching {q!r}")
+        return ModelJSONResponse(ResultPage.model_validate({
+            "total": None,
+            "page": page,
+            "items_per_page": items_per_page,
+            "items": results
+        }, from_attributes=True))
     except SQLAlchemyError as error:
         logger.error(f"Database error: {str(error)}")
         raise HTTPException(status_code=500, detail="Database error occurred")
     except Exception as error:
-        logger.error(f"Unexpected error in results_endpoint: {str(error)}")
+        logger.error(f"Unexpected error in search_results_endpoint: {str(error)}")
         raise HTTPException(status_code=500, detail="An unexpected error occurred")
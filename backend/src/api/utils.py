@@ -1,9 +1,90 @@
-from ..database import SessionLocal
+import hashlib
+import os
 
+from fastapi import Depends, Request, Response
+from fastapi.responses import JSONResponse
+from httpx import AsyncClient
+from pydantic import BaseModel
+from pydantic_core import to_json
+from sqlalchemy.ext.asyncio import async_sessionmaker
 
-def get_db():
-    db = SessionLocal()
-    try:
+from ..breaker import CircuitBreaker
+from ..cache import CachedPage, ResponseCache, SearchCache
+from ..database import AsyncSessionLocal
+from ..jobs import JobQueue
+from ..singleflight import SingleFlight
+
+IMMUTABLE_MAX_AGE = int(os.getenv("IMMUTABLE_MAX_AGE", "31536000"))
+IMMUTABLE_CACHE_CONTROL = f"public, max-age={IMMUTABLE_MAX_AGE}, immutable"
+REVALIDATE_CACHE_CONTROL = "no-cache"
+
+
+class ModelJSONResponse(JSONResponse):
+    """Renders pydantic models straight to JSON bytes with pydantic-core.
+
+    Returning one from an endpoint skips FastAPI's ``response_model`` validation and
+    ``jsonable_encoder`` pass, so a page is validated when it is built and serialized once.
+    """
+
+    def render(self, content) -> bytes:
+        return to_json(content)
+
+
+def get_session_factory() -> async_sessionmaker:
+    return AsyncSessionLocal
+
+
+async def get_db(session_factory: async_sessionmaker = Depends(get_session_factory)):
+    async with session_factory() as db:
         yield db
-    finally:
-        db.close()
+
+
+def get_arxiv_client(request: Request) -> AsyncClient:
+    return request.app.state.arxiv_client
+
+
+def get_arxiv_breaker(request: Request) -> CircuitBreaker:
+    return request.app.state.arxiv_breaker
+
+
+def get_search_cache(request: Request) -> SearchCache:
+    return request.app.state.search_cache
+
+
+def get_response_cache(request: Request) -> ResponseCache:
+    return request.app.state.response_cache
+
+
+def get_search_flights(request: Request) -> SingleFlight:
+    return request.app.state.search_flights
+
+
+def get_search_jobs(request: Request) -> JobQueue:
+    return request.app.state.search_jobs
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    tags = {tag.strip().removeprefix("W/") for tag in header.split(",")}
+    return "*" in tags or etag in tags
+
+
+def json_page(payload: BaseModel, cache_control: str) -> CachedPage:
+    """Serialize ``payload`` once, with a strong ETag of its bytes."""
+    body = to_json(payload)
+    return CachedPage(body, f'"{hashlib.sha256(body).hexdigest()[:32]}"', cache_control)
+
+
+def page_response(request: Request, page: CachedPage) -> Response:
+    headers = {"ETag": page.etag, "Cache-Control": page.cache_control}
+    if etag_matches(request, page.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=page.body, media_type="application/json", headers=headers)
+
+
+def embed_page(payload: dict, field: str, page: CachedPage) -> Response:
+    """Answer ``payload`` with ``page`` spliced in as ``field``, reusing its serialized bytes."""
+    head = to_json(payload)[:-1] + (b"," if payload else b"")
+    return Response(content=head + to_json(field) + b":" + page.body + b"}", media_type="application/json")
@@ -0,0 +1,99 @@
+import os
+import time
+from typing import Optional
+from urllib.parse import urlencode
+
+from httpx import (AsyncClient, AsyncHTTPTransport, HTTPError, HTTPStatusError, Limits, Response, Timeout,
+                   TransportError)
+from tenacity import retry, retry_if_exception, stop_after_attempt, wait_exponential
+
+from .breaker import CircuitBreaker, CircuitBreakerTransport
+from .metrics import ARXIV_REQUEST_SECONDS, ARXIV_RESPONSES, record_retry
+from .ratelimit import PRIORITY_EXTENSION, PRIORITY_INTERACTIVE, ArxivRateLimiter
+from .schemas import ArxivSearchParams
+
+# arXiv serves at most this many entries per call; larger result sets have to be paged.
+ARXIV_MAX_PAGE_SIZE = 2000
+
+
+def create_arxiv_client(limiter: Optional[ArxivRateLimiter] = None,
+                        breaker: Optional[CircuitBreaker] = None) -> AsyncClient:
+    """The shared arXiv client.
+
+    With a ``limiter``, every request it sends waits for the request budget. With a
+    ``breaker``, requests fail fast with :class:`CircuitOpen` while arXiv is down.
+    """
+    timeout = Timeout(
+        float(os.getenv("ARXIV_TIMEOUT", "30")),
+        connect=float(os.getenv("ARXIV_CONNECT_TIMEOUT", "5"))
+    )
+    limits = Limits(
+        max_connections=int(os.getenv("ARXIV_MAX_CONNECTIONS", "20")),
+        max_keepalive_connections=int(os.getenv("ARXIV_MAX_KEEPALIVE_CONNECTIONS", "10")),
+        keepalive_expiry=float(os.getenv("ARXIV_KEEPALIVE_EXPIRY", "30"))
+    )
+    transport = AsyncHTTPTransport(limits=limits)
+    event_hooks = {"request": [], "response": []}
+    if breaker is not None:
+        transport = CircuitBreakerTransport(transport, breaker)
+        event_hooks["request"].append(breaker.on_request)
+    if limiter is not None:
+        event_hooks["request"].append(limiter.on_request)
+        event_hooks["response"].append(limiter.on_response)
+    return AsyncClient(timeout=timeout, transport=transport, follow_redirects=True, event_hooks=event_hooks)
+
+
+def build_search_query(params: ArxivSearchParams) -> str:
+    query_parts = []
+    if params.author:
+        query_parts.append(f"au:{params.author}")
+    if params.title:
+        query_parts.append(f"ti:{params.title}")
+    if params.journal:
+        query_parts.append(f"jr:{params.journal}")
+
+    return "+AND+".join(query_parts)
+
+
+def build_arxiv_url(search_query: str, start: int, max_results: int) -> str:
+    query_params = {
+        'search_query': search_query,
+        'start': start,
+        'max_results': max_results,
+        'sortBy': 'relevance',
+        'sortOrder': 'descending'
+    }
+
+    base_url = os.getenv('ARXIV_API_URL', 'https://export.arxiv.org/api/query')
+    return f"{base_url}?{urlencode(query_params)}"
+
+
+def is_transient(error: BaseException) -> bool:
+    """Whether a retry may succeed: a network failure, a 429 or a server error, but not a rejected request."""
+    if isinstance(error, TransportError):
+        return True
+    if isinstance(error, HTTPStatusError):
+        status = error.response.status_code
+        return status == 429 or status >= 500
+    return False
+
+
+@retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10),
+       retry=retry_if_exception(is_transient), before_sleep=record_retry, reraise=True)
+async def open_arxiv_stream(client: AsyncClient, url: str, priority: int = PRIORITY_INTERACTIVE) -> Response:
+    request = client.build_request("GET", url, extensions={PRIORITY_EXTENSION: priority})
+    start = time.perf_counter()
+    try:
+        response = await client.send(request, stream=True)
+    except HTTPError:
+        ARXIV_RESPONSES.inc("error")
+        raise
+    finally:
+        ARXIV_REQUEST_SECONDS.observe(time.perf_counter() - start)
+    ARXIV_RESPONSES.inc(response.status_code)
+    try:
+        response.raise_for_status()
+    except HTTPStatusError:
+        await response.aclose()
+        raise
+    return response
@@ -0,0 +1,100 @@
+import time
+from typing import AsyncIterator, NamedTuple
+from xml.etree.ElementTree import XMLPullParser
+
+ATOM = "{http://www.w3.org/2005/Atom}"
+ARXIV = "{http://arxiv.org/schemas/atom}"
+OPENSEARCH = "{http://a9.com/-/spec/opensearch/1.1/}"
+
+ABS_PREFIX = "arxiv.org/abs/"
+
+
+class AtomEntry(NamedTuple):
+    arxiv_id: str
+    title: str
+    authors: tuple[str, ...]
+    journal_ref: str
+
+
+def parse_arxiv_id(entry_id: str) -> str:
+    """Turn ``http://arxiv.org/abs/2106.01234v2`` into ``2106.01234``."""
+    arxiv_id = entry_id.partition(ABS_PREFIX)[2] or entry_id
+    base, _, version = arxiv_id.rpartition("v")
+    return base if base and version.isdigit() else arxiv_id
+
+
+class AtomStreamParser:
+    """Incremental parser for arXiv Atom feeds.
+
+    Feed it the response body chunk by chunk; each call returns the entries completed by
+    that chunk. Finished entries are dropped from the tree, so memory stays bounded by the
+    largest single entry instead of the whole feed. Feed-level ``title`` and
+    ``total_results`` are filled in as soon as they are seen, which in arXiv responses is
+    before the first entry. ``parse_seconds`` adds up the time spent in :meth:`feed` and
+    :meth:`close`.
+    """
+
+    def __init__(self):
+        self.title = ""
+        self.total_results = 0
+        self.parse_seconds = 0.0
+        self._parser = XMLPullParser(events=("start", "end"))
+        self._root = None
+        self._depth = 0
+
+    def feed(self, chunk: bytes) -> list[AtomEntry]:
+        start = time.perf_counter()
+        self._parser.feed(chunk)
+        entries = self._read_entries()
+        self.parse_seconds += time.perf_counter() - start
+        return entries
+
+    def close(self) -> list[AtomEntry]:
+        start = time.perf_counter()
+        self._parser.close()
+        entries = self._read_entries()
+        self.parse_seconds += time.perf_counter() - start
+        return entries
+
+    def _read_entries(self) -> list[AtomEntry]:
+        entries = []
+        for event, element in self._parser.read_events():
+            if event == "start":
+                if self._root is None:
+                    self._root = element
+                self._depth += 1
+                continue
+
+            self._depth -= 1
+            if self._depth != 1:
+                continue
+            if element.tag == f"{ATOM}entry":
+                entries.append(self._to_entry(element))
+                self._root.remove(element)
+            elif element.tag == f"{ATOM}title":
+                self.title = element.text or ""
+            elif element.tag == f"{OPENSEARCH}totalResults":
+                self.total_results = int(element.text or 0)
+        return entries
+
+    @staticmethod
+    def _to_entry(element) -> AtomEntry:
+        return AtomEntry(
+            arxiv_id=parse_arxiv_id(element.findtext(f"{ATOM}id", "")),
+            title=element.findtext(f"{ATOM}title", ""),
+            authors=tuple(author.findtext(f"{ATOM}name", "") for author in element.iterfind(f"{ATOM}author")),
+            journal_ref=element.findtext(f"{ARXIV}journal_ref", "")
+        )
+
+
+async def iter_entry_batches(chunks: AsyncIterator[bytes], parser: AtomStreamParser,
+                             batch_size: int) -> AsyncIterator[list[AtomEntry]]:
+    batch = []
+    async for chunk in chunks:
+        batch.extend(parser.feed(chunk))
+        while len(batch) >= batch_size:
+            yield batch[:batch_size]
+            batch = batch[batch_size:]
+    batch.extend(parser.close())
+    if batch:
+        yield batch
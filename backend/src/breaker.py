@@ -0,0 +1,146 @@
+import logging
+import os
+import time
+
+from httpx import AsyncBaseTransport, Request, Response, TransportError
+
+from .metrics import REGISTRY, Counter, Gauge
+
+logger = logging.getLogger(__name__)
+
+BREAKER_FAILURES = int(os.getenv("ARXIV_BREAKER_FAILURES", "5"))
+BREAKER_RESET = float(os.getenv("ARXIV_BREAKER_RESET", "30"))
+
+CIRCUIT_CLOSED = "closed"
+CIRCUIT_HALF_OPEN = "half_open"
+CIRCUIT_OPEN = "open"
+CIRCUIT_STATES = {CIRCUIT_CLOSED: 0, CIRCUIT_HALF_OPEN: 1, CIRCUIT_OPEN: 2}
+
+CIRCUIT_OPENED = REGISTRY.register(Counter(
+    "arxiv_circuit_opened", "Times the arXiv circuit breaker opened after consecutive failures."))
+CIRCUIT_REJECTIONS = REGISTRY.register(Counter(
+    "arxiv_circuit_rejections", "arXiv requests failed fast because the circuit was open."))
+
+
+class CircuitOpen(Exception):
+    def __init__(self, retry_after: float):
+        super().__init__(f"arXiv circuit is open, retry in {retry_after:.0f} s")
+        self.retry_after = retry_after
+
+
+def is_failure(response: Response) -> bool:
+    return response.status_code == 429 or response.status_code >= 500
+
+
+class CircuitBreaker:
+    """Stops calling arXiv after ``failure_threshold`` consecutive failures.
+
+    Timeouts, connection errors, ``429`` and ``5xx`` answers count as failures. While open,
+    requests fail fast with :class:`CircuitOpen`. After ``reset_timeout`` seconds the circuit
+    is half open and lets a single trial request through: its success closes the circuit,
+    its failure opens it again for another ``reset_timeout``.
+    """
+
+    def __init__(self, failure_threshold: int = BREAKER_FAILURES, reset_timeout: float = BREAKER_RESET):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened = 0
+        self.rejected = 0
+        self._open_until = 0.0
+        self._trial = False
+
+    @property
+    def state(self) -> str:
+        if self._open_until == 0.0:
+            return CIRCUIT_CLOSED
+        return CIRCUIT_OPEN if time.monotonic() < self._open_until else CIRCUIT_HALF_OPEN
+
+    def retry_after(self) -> float:
+        return max(self._open_until - time.monotonic(), 0.0)
+
+    def _reject(self):
+        self.rejected += 1
+        CIRCUIT_REJECTIONS.inc()
+        raise CircuitOpen(self.retry_after() or self.reset_timeout)
+
+    def check(self):
+        """Fail fast while the circuit is open, without claiming the half-open trial."""
+        if self.state == CIRCUIT_OPEN:
+            self._reject()
+
+    def claim(self):
+        """Let a request through, taking the trial slot when the circuit is half open."""
+        state = self.state
+        if state == CIRCUIT_OPEN or (state == CIRCUIT_HALF_OPEN and self._trial):
+            self._reject()
+        if state == CIRCUIT_HALF_OPEN:
+            self._trial = True
+
+    def release(self):
+        """Give back the trial slot of a request that ended without an answer, e.g. when cancelled."""
+        self._trial = False
+
+    def record_success(self):
+        if self._open_until:
+            logger.info("arXiv answered again, closing the circuit")
+        self.failures = 0
+        self._open_until = 0.0
+        self._trial = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self._trial or (self._open_until == 0.0 and self.failures >= self.failure_threshold):
+            self._open_until = time.monotonic() + self.reset_timeout
+            self.opened += 1
+            CIRCUIT_OPENED.inc()
+            logger.warning(f"arXiv failed {self.failures} times in a row, "
+                           f"opening the circuit for {self.reset_timeout:.0f} s")
+        self._trial = False
+
+    async def on_request(self, request: Request):
+        """httpx request hook, run before the rate limiter so an open circuit never waits for budget."""
+        self.check()
+
+    def stats(self) -> dict:
+        return {
+            "state": self.state,
+            "failures": self.failures,
+            "opened": self.opened,
+            "rejected": self.rejected,
+            "retry_after": self.retry_after()
+        }
+
+
+class CircuitBreakerTransport(AsyncBaseTransport):
+    """Wraps the arXiv transport, reporting the outcome of every request to ``breaker``."""
+
+    def __init__(self, transport: AsyncBaseTransport, breaker: CircuitBreaker):
+        self.transport = transport
+        self.breaker = breaker
+
+    async def handle_async_request(self, request: Request) -> Response:
+        self.breaker.claim()
+        try:
+            response = await self.transport.handle_async_request(request)
+        except TransportError:
+            self.breaker.record_failure()
+            raise
+        except BaseException:
+            self.breaker.release()
+            raise
+        if is_failure(response):
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+        return response
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+
+def create_circuit_breaker() -> CircuitBreaker:
+    breaker = CircuitBreaker()
+    REGISTRY.register(Gauge("arxiv_circuit_state", "arXiv circuit breaker state: 0 closed, 1 half open, 2 open.",
+                            lambda: CIRCUIT_STATES[breaker.state], mode="max"))
+    return breaker
@@ -0,0 +1,288 @@
+"""Load arXiv metadata dumps into the local database, so searches have a corpus to serve.
+
+Reads the Kaggle/arXiv JSON-lines snapshot (``arxiv-metadata-oai-snapshot.json``) or OAI-PMH
+``ListRecords`` XML in the ``arXiv`` or ``oai_dc`` formats, either optionally gzipped. Records
+are parsed across a process pool and written in chunks through the same upserts and
+``COPY`` path as searches. Every dump is stored as one query, so its papers can be browsed
+with ``/queries/{query_id}/results``. Progress is committed with every chunk, and running
+the same command again resumes after the last committed chunk. Run from the repository root::
+
+    python -m backend.src.bulk_import arxiv-metadata-oai-snapshot.json.gz [--workers 8] [--chunk-size 5000]
+"""
+import argparse
+import asyncio
+import gzip
+import json
+import logging
+import os
+import re
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import BinaryIO, Iterator, Optional, Sequence
+from xml.etree import ElementTree
+
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from .atom import AtomEntry, parse_arxiv_id
+from .database import DATABASE_URL, to_async_url
+from .migrations import migrate
+from .models import ArxivQuery, BulkImport
+from .storage import INSERT_BATCH_SIZE, insert_query, store_entries
+
+logger = logging.getLogger(__name__)
+
+IMPORT_CHUNK_SIZE = int(os.getenv("IMPORT_CHUNK_SIZE", "5000"))
+IMPORT_WORKERS = int(os.getenv("IMPORT_WORKERS", str(os.cpu_count() or 1)))
+
+IMPORT_RUNNING = "running"
+IMPORT_COMPLETE = "complete"
+IMPORT_FAILED = "failed"
+
+FORMAT_JSONL = "jsonl"
+FORMAT_OAI = "oai"
+
+READ_SIZE = 1024 * 1024
+GZIP_MAGIC = b"\x1f\x8b"
+OAI_RECORD = re.compile(rb"<(?:[\w.-]+:)?record[\s>].*?</(?:[\w.-]+:)?record>", re.DOTALL)
+OAI_RECORD_START = re.compile(rb"<(?:[\w.-]+:)?record[\s>]")
+# Bytes kept from the end of a block without a record start, in case a tag was cut in half there.
+OAI_TAG_TAIL = 256
+# An opened record that grows past this without closing is dropped as malformed.
+OAI_MAX_RECORD_SIZE = 16 * 1024 * 1024
+# Prefixes OAI-PMH responses usually declare on the root element, which records cut out of it no longer have.
+OAI_CHUNK_START = (b'<records xmlns:oai_dc="http://www.openarchives.org/OAI/2.0/oai_dc/" '
+                   b'xmlns:dc="http://purl.org/dc/elements/1.1/" '
+                   b'xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">')
+OAI_CHUNK_END = b"</records>"
+OAI_IDENTIFIER_PREFIX = "oai:arXiv.org:"
+
+
+def open_dump(path: Path) -> BinaryIO:
+    with path.open("rb") as probe:
+        gzipped = probe.read(2) == GZIP_MAGIC
+    return gzip.open(path, "rb") if gzipped else path.open("rb")
+
+
+def detect_format(path: Path) -> str:
+    with open_dump(path) as dump:
+        head = dump.read(4096).lstrip()
+    return FORMAT_OAI if head.startswith(b"<") else FORMAT_JSONL
+
+
+def dump_source(path: Path) -> str:
+    return f"{path.name}:{path.stat().st_size}"
+
+
+def iter_records(dump: BinaryIO, dump_format: str) -> Iterator[bytes]:
+    """Raw records of a dump, one JSON line or one OAI ``<record>`` element at a time."""
+    if dump_format == FORMAT_JSONL:
+        for line in dump:
+            if line.strip():
+                yield line
+        return
+
+    buffer = b""
+    while block := dump.read(READ_SIZE):
+        buffer += block
+        end = 0
+        for match in OAI_RECORD.finditer(buffer):
+            yield match.group(0)
+            end = match.end()
+        # Only an opened record is carried over to the next block. Response headers, resumption
+        # tokens and anything else outside records are dropped, so the buffer stays bounded.
+        start = OAI_RECORD_START.search(buffer, end)
+        if start is None:
+            buffer = buffer[max(end, len(buffer) - OAI_TAG_TAIL):]
+        elif len(buffer) - start.start() > OAI_MAX_RECORD_SIZE:
+            logger.warning(f"Skipping a record that is not closed within {OAI_MAX_RECORD_SIZE} bytes")
+            buffer = buffer[start.end():]
+        else:
+            buffer = buffer[start.start():]
+
+
+def iter_chunks(path: Path, dump_format: str, chunk_size: int, skip: int = 0) -> Iterator[list[bytes]]:
+    """Raw records in chunks of ``chunk_size``, after the first ``skip`` records."""
+    with open_dump(path) as dump:
+        chunk = []
+        for index, record in enumerate(iter_records(dump, dump_format)):
+            if index < skip:
+                continue
+            chunk.append(record)
+            if len(chunk) == chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+
+def clean(text: Optional[str]) -> str:
+    return " ".join((text or "").split())
+
+
+def json_entry(line: bytes) -> Optional[AtomEntry]:
+    record = json.loads(line)
+    if not record.get("id"):
+        return None
+    if record.get("authors_parsed"):
+        # [keyname, forenames, suffix]
+        authors = tuple(clean(" ".join(part for part in (names[1:2] + names[:1] + names[2:3]) if part))
+                        for names in record["authors_parsed"])
+    else:
+        authors = tuple(clean(name) for name in re.split(r",| and ", record.get("authors") or "") if clean(name))
+    return AtomEntry(record["id"], clean(record.get("title")), tuple(name for name in authors if name),
+                     clean(record.get("journal-ref")))
+
+
+def local_name(element: ElementTree.Element) -> str:
+    return element.tag.rpartition("}")[2]
+
+
+def children(element: ElementTree.Element, name: str) -> list[ElementTree.Element]:
+    return [child for child in element.iter() if local_name(child) == name]
+
+
+def oai_entry(record: ElementTree.Element) -> Optional[AtomEntry]:
+    """An ``arXiv`` or ``oai_dc`` metadata record; deleted records have no metadata and are skipped."""
+    metadata = next(iter(children(record, "metadata")), None)
+    if metadata is None:
+        return None
+
+    identifiers = [clean(element.text) for element in children(metadata, "id")]
+    identifiers += [parse_arxiv_id(clean(element.text)) for element in children(metadata, "identifier")
+                    if "arxiv.org/abs/" in (element.text or "")]
+    identifiers += [clean(element.text).removeprefix(OAI_IDENTIFIER_PREFIX)
+                    for element in children(record, "identifier") if (element.text or "").startswith("oai:")]
+    if not identifiers or not identifiers[0]:
+        return None
+
+    authors = tuple(clean(" ".join(part.text or "" for name in ("forenames", "keyname", "suffix")
+                                   for part in children(author, name)))
+                    for author in children(metadata, "author"))
+    # oai_dc names authors "Keyname, Forenames".
+    authors += tuple(clean(" ".join(reversed(clean(creator.text).split(", ", 1))))
+                     for creator in children(metadata, "creator"))
+    titles = children(metadata, "title")
+    journals = children(metadata, "journal-ref")
+    return AtomEntry(identifiers[0], clean(titles[0].text) if titles else "", tuple(name for name in authors if name),
+                     clean(journals[0].text) if journals else "")
+
+
+def parse_chunk(dump_format: str, records: Sequence[bytes]) -> list[AtomEntry]:
+    """Parse raw records into entries; runs in the worker processes."""
+    if dump_format == FORMAT_JSONL:
+        entries = []
+        for line in records:
+            try:
+                entries.append(json_entry(line))
+            except (ValueError, TypeError, AttributeError) as error:
+                logger.warning(f"Skipping malformed record: {error}")
+    else:
+        root = ElementTree.fromstring(OAI_CHUNK_START + b"".join(records) + OAI_CHUNK_END)
+        entries = [oai_entry(record) for record in root]
+    return [entry for entry in entries if entry is not None]
+
+
+async def start_import(session_factory: async_sessionmaker, path: Path) -> BulkImport:
+    source = dump_source(path)
+    async with session_factory() as db, db.begin():
+        progress = await db.scalar(select(BulkImport).where(BulkImport.source == source))
+        if progress is None:
+            query_id = await insert_query(db, query=f"Import of {path.name}", status=200, num_results=0)
+            progress = BulkImport(source=source, query_id=query_id, state=IMPORT_RUNNING, position=0, stored=0)
+            db.add(progress)
+    return progress
+
+
+async def store_chunk(session_factory: async_sessionmaker, progress: BulkImport, consumed: int,
+                      entries: list[AtomEntry]):
+    """Write one chunk and advance the checkpoint in the same transaction."""
+    async with session_factory() as db, db.begin():
+        for first in range(0, len(entries), INSERT_BATCH_SIZE):
+            await store_entries(db, progress.query_id, progress.stored + first,
+                                entries[first:first + INSERT_BATCH_SIZE])
+        position, stored = progress.position + consumed, progress.stored + len(entries)
+        await db.execute(update(BulkImport).where(BulkImport.id == progress.id).values(
+            position=position, stored=stored, state=IMPORT_RUNNING))
+        await db.execute(update(ArxivQuery).where(ArxivQuery.id == progress.query_id).values(num_results=stored))
+    progress.position, progress.stored = position, stored
+
+
+async def set_import_state(session_factory: async_sessionmaker, progress: BulkImport, state: str):
+    async with session_factory() as db, db.begin():
+        await db.execute(update(BulkImport).where(BulkImport.id == progress.id).values(state=state))
+    progress.state = state
+
+
+async def import_dump(path: Path, session_factory: async_sessionmaker, dump_format: Optional[str] = None,
+                      workers: int = IMPORT_WORKERS, chunk_size: int = IMPORT_CHUNK_SIZE) -> BulkImport:
+    """Import ``path``, resuming after its last committed chunk; returns the final progress.
+
+    At most two chunks per worker are read ahead, so memory stays bounded however large the dump is.
+    """
+    dump_format = dump_format or detect_format(path)
+    progress = await start_import(session_factory, path)
+    if progress.state == IMPORT_COMPLETE:
+        logger.info(f"{path.name} was already imported into query {progress.query_id}")
+        return progress
+    if progress.position:
+        logger.info(f"Resuming {path.name} after {progress.position} records")
+
+    loop = asyncio.get_running_loop()
+    start, stored_before = time.perf_counter(), progress.stored
+    state = IMPORT_FAILED
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            pending = deque()
+            for records in iter_chunks(path, dump_format, chunk_size, skip=progress.position):
+                pending.append((len(records), loop.run_in_executor(pool, parse_chunk, dump_format, records)))
+                if len(pending) >= 2 * workers:
+                    consumed, parsed = pending.popleft()
+                    await store_chunk(session_factory, progress, consumed, await parsed)
+                    log_rate(progress, progress.stored - stored_before, time.perf_counter() - start)
+            while pending:
+                consumed, parsed = pending.popleft()
+                await store_chunk(session_factory, progress, consumed, await parsed)
+                log_rate(progress, progress.stored - stored_before, time.perf_counter() - start)
+        state = IMPORT_COMPLETE
+    except Exception as error:
+        logger.error(f"Import of {path.name} failed after {progress.position} records: {str(error)}")
+        raise
+    finally:
+        await set_import_state(session_factory, progress, state)
+    return progress
+
+
+def log_rate(progress: BulkImport, rows: int, seconds: float):
+    logger.info(f"Query {progress.query_id}: read {progress.position} records, stored {progress.stored} "
+                f"({rows / seconds if seconds else 0:.0f} rows/s)")
+
+
+async def main(paths: list[Path], database_url: str, dump_format: Optional[str], workers: int, chunk_size: int):
+    engine = create_async_engine(to_async_url(database_url))
+    session_factory = async_sessionmaker(bind=engine, autoflush=False, expire_on_commit=False)
+    try:
+        async with engine.begin() as connection:
+            await connection.run_sync(migrate)
+        for path in paths:
+            start = time.perf_counter()
+            progress = await import_dump(path, session_factory, dump_format, workers, chunk_size)
+            seconds = time.perf_counter() - start
+            logger.info(f"{path.name}: {progress.stored} records in query {progress.query_id}, {seconds:.1f} s")
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level="INFO")
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("paths", type=Path, nargs="+", help="Dumps to import, each stored as its own query")
+    parser.add_argument("--database-url", default=DATABASE_URL)
+    parser.add_argument("--format", choices=[FORMAT_JSONL, FORMAT_OAI], help="Detected from the content by default")
+    parser.add_argument("--workers", type=int, default=IMPORT_WORKERS, help="Parser processes")
+    parser.add_argument("--chunk-size", type=int, default=IMPORT_CHUNK_SIZE, help="Records per transaction")
+    arguments = parser.parse_args()
+    asyncio.run(main(arguments.paths, arguments.database_url, arguments.format, arguments.workers,
+                     arguments.chunk_size))
@@ -0,0 +1,217 @@
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Any, NamedTuple, Optional
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .models import ArxivQuery
+from .schemas import ArxivSearchParams
+
+
+class LRUCache:
+    """Size-bounded LRU mapping with an optional per-entry time to live."""
+
+    def __init__(self, max_entries: int, ttl: Optional[float] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: OrderedDict[Any, tuple[float, Any]] = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key, value):
+        expires_at = time.monotonic() + self.ttl if self.ttl is not None else float("inf")
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": self.hits / lookups if lookups else 0.0
+        }
+
+
+class CachedSearch(NamedTuple):
+    query_id: int
+    num_results: int
+
+
+class StoredSearch(NamedTuple):
+    query_id: int
+    num_results: int
+    timestamp: datetime
+
+
+async def fetch_stored_search(db: AsyncSession, key: str, since: Optional[datetime] = None) -> Optional[StoredSearch]:
+    """The most recent successful query stored for ``key``, however old unless ``since`` is given."""
+    statement = select(ArxivQuery.id, ArxivQuery.num_results, ArxivQuery.timestamp).where(
+        ArxivQuery.search_key == key, ArxivQuery.status == 200)
+    if since is not None:
+        statement = statement.where(ArxivQuery.timestamp >= since)
+    row = (await db.execute(statement.order_by(ArxivQuery.id.desc()).limit(1))).first()
+    return StoredSearch(row.id, row.num_results, row.timestamp) if row else None
+
+
+def search_key(params: ArxivSearchParams) -> str:
+    def normalize(value: str) -> str:
+        return " ".join(value.split()).casefold()
+
+    return "|".join([
+        f"author={normalize(params.author)}",
+        f"title={normalize(params.title)}",
+        f"journal={normalize(params.journal)}",
+        f"max_results={params.max_results}"
+    ])
+
+
+class SearchCache:
+    """Maps normalized search parameters to the stored query that answered them.
+
+    Lookups go to an in-process LRU first. With ``shared`` enabled, misses fall back to
+    ``arxiv_queries.search_key`` so every worker can reuse queries stored by the others.
+    """
+
+    def __init__(self, max_entries: int, ttl: float, shared: bool = False):
+        self.ttl = ttl
+        self.shared = shared
+        self.local = LRUCache(max_entries, ttl)
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+
+    async def get(self, db: AsyncSession, key: str) -> Optional[CachedSearch]:
+        cached = self.local.get(key)
+        if cached is None and self.shared:
+            cached = await self._fetch_shared(db, key)
+            if cached is not None:
+                self.shared_hits += 1
+                self.local.set(key, cached)
+        if cached is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return cached
+
+    def set(self, key: str, value: CachedSearch):
+        self.local.set(key, value)
+
+    async def _fetch_shared(self, db: AsyncSession, key: str) -> Optional[CachedSearch]:
+        stored = await fetch_stored_search(db, key, datetime.now(timezone.utc) - timedelta(seconds=self.ttl))
+        return CachedSearch(stored.query_id, stored.num_results) if stored else None
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "backend": "shared" if self.shared else "memory",
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "shared_hits": self.shared_hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "local": self.local.stats()
+        }
+
+
+class CachedPage(NamedTuple):
+    body: bytes
+    etag: str
+    cache_control: str
+
+
+class ResponseCache:
+    """Serialized ``/queries`` and ``/results`` pages, keyed on their normalized parameters.
+
+    Pages pinned to a finished query never change and only leave by LRU eviction. Every
+    other page is dropped by :meth:`invalidate` whenever a query is committed, and expires
+    after ``ttl`` so commits made by other workers show up as well. Callers read
+    ``generation`` before querying the database, so a page built from data older than the
+    last invalidation is not stored.
+    """
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.pinned = LRUCache(max_entries)
+        self.moving = LRUCache(max_entries, ttl)
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, key) -> Optional[CachedPage]:
+        page = self.pinned.get(key)
+        if page is None:
+            page = self.moving.get(key)
+        if page is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return page
+
+    def set(self, key, page: CachedPage, pinned: bool, generation: int):
+        if pinned:
+            self.pinned.set(key, page)
+        elif generation == self.generation:
+            self.moving.set(key, page)
+
+    def invalidate(self):
+        self.generation += 1
+        self.invalidations += 1
+        self.moving.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "invalidations": self.invalidations,
+            "size": len(self.pinned) + len(self.moving),
+            "evictions": self.pinned.evictions + self.moving.evictions,
+            "pinned": {"size": len(self.pinned), "max_entries": self.pinned.max_entries},
+            "moving": {"size": len(self.moving), "max_entries": self.moving.max_entries, "ttl": self.moving.ttl}
+        }
+
+
+def create_search_cache() -> SearchCache:
+    return SearchCache(
+        max_entries=int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", "1024")),
+        ttl=float(os.getenv("SEARCH_CACHE_TTL", "3600")),
+        shared=os.getenv("SEARCH_CACHE_BACKEND", "memory").lower() == "shared"
+    )
+
+
+def create_response_cache() -> ResponseCache:
+    return ResponseCache(
+        max_entries=int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1024")),
+        ttl=float(os.getenv("RESPONSE_CACHE_TTL", "30"))
+    )
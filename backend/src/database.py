@@ -1,18 +1,92 @@
 import os
+import time
+from uuid import uuid4
 
-from sqlalchemy import create_engine
+from sqlalchemy.engine import URL, make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy.pool import QueuePool
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool
+
+from .metrics import DB_POOL_WAIT_SECONDS, REGISTRY, Gauge
 
 DATABASE_URL = os.getenv("DATABASE_URL", "postgresql://user:password@db/arxivdb")
 
-engine = create_engine(
-    DATABASE_URL,
-    poolclass=QueuePool,
-    pool_size=10,
-    max_overflow=20
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+# Connections all workers of the deployment may hold together, split evenly between them; 0 for no budget.
+MAX_CONNECTIONS = int(os.getenv("DB_MAX_CONNECTIONS", "0"))
+WORKERS = int(os.getenv("WEB_CONCURRENCY", "1"))
+# Behind PgBouncer in transaction mode: no pool of our own and no prepared statements.
+PGBOUNCER = os.getenv("DB_PGBOUNCER", "false").lower() == "true"
+MIGRATE_ON_STARTUP = os.getenv("DB_MIGRATE_ON_STARTUP", "true").lower() == "true"
+
+ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite"
+}
+
+
+def to_async_url(database_url: str) -> URL:
+    url = make_url(database_url)
+    if url.drivername in ASYNC_DRIVERS:
+        return url.set(drivername=ASYNC_DRIVERS[url.drivername])
+    return url
+
+
+def async_connect_args_for(database_url: str) -> dict:
+    if PGBOUNCER and make_url(database_url).get_backend_name() == "postgresql":
+        # PgBouncer hands every transaction a different server connection, which would not know
+        # statements prepared on another one. Unique names keep asyncpg's own statements apart.
+        return {"statement_cache_size": 0, "prepared_statement_cache_size": 0,
+                "prepared_statement_name_func": lambda: f"__asyncpg_{uuid4()}__"}
+    return {}
+
+
+def split_connection_budget(budget: int, workers: int, pool_size: int = POOL_SIZE,
+                            max_overflow: int = MAX_OVERFLOW) -> tuple[int, int]:
+    """Pool size and overflow of one worker, so that ``workers`` pools together stay within ``budget``."""
+    if budget <= 0:
+        return pool_size, max_overflow
+    share = max(budget // workers, 1)
+    size = min(pool_size, share)
+    return size, min(max_overflow, share - size)
+
+
+def pool_arguments(poolclass: type, pool_size: int, max_overflow: int) -> dict:
+    if PGBOUNCER:
+        return {"poolclass": NullPool}
+    return {"poolclass": poolclass, "pool_size": pool_size, "max_overflow": max_overflow, "pool_timeout": POOL_TIMEOUT}
+
+
+class TimedAsyncQueuePool(AsyncAdaptedQueuePool):
+    """Records in ``db_pool_wait_seconds`` how long every checkout waited for a connection."""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            DB_POOL_WAIT_SECONDS.observe(time.perf_counter() - start)
+
+
+WORKER_POOL_SIZE, WORKER_MAX_OVERFLOW = split_connection_budget(MAX_CONNECTIONS, WORKERS)
+
+async_engine = create_async_engine(
+    to_async_url(DATABASE_URL),
+    **pool_arguments(TimedAsyncQueuePool, WORKER_POOL_SIZE, WORKER_MAX_OVERFLOW),
+    connect_args=async_connect_args_for(DATABASE_URL)
 )
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+AsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
+
+# Read through async_engine.pool on every scrape: dispose() replaces the pool object.
+# Behind PgBouncer there is no pool here to report on.
+if not PGBOUNCER:
+    REGISTRY.register(Gauge("db_pool_size", "Connections the pool keeps open.", lambda: async_engine.pool.size()))
+    REGISTRY.register(Gauge("db_pool_checked_out", "Connections currently lent out by the pool.",
+                            lambda: async_engine.pool.checkedout()))
+    REGISTRY.register(Gauge("db_pool_overflow",
+                            f"Connections open beyond the pool size, at most {WORKER_MAX_OVERFLOW}.",
+                            lambda: max(0, async_engine.pool.overflow())))
 
 Base = declarative_base()
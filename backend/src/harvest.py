@@ -0,0 +1,132 @@
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from httpx import AsyncClient
+from sqlalchemy import or_, update
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from .arxiv_client import ARXIV_MAX_PAGE_SIZE, build_arxiv_url, open_arxiv_stream
+from .atom import AtomStreamParser
+from .cache import ResponseCache
+from .models import ArxivQuery
+from .ratelimit import PRIORITY_BACKGROUND
+from .storage import insert_query, store_feed
+
+logger = logging.getLogger(__name__)
+
+HARVEST_PAGE_SIZE = min(int(os.getenv("ARXIV_HARVEST_PAGE_SIZE", "1000")), ARXIV_MAX_PAGE_SIZE)
+# A running harvest without a committed window for this long is taken to have died with its worker.
+HARVEST_STALE_AFTER = float(os.getenv("HARVEST_STALE_AFTER", "600"))
+
+HARVEST_RUNNING = "running"
+HARVEST_COMPLETE = "complete"
+HARVEST_FAILED = "failed"
+
+
+def harvest_progress(query: ArxivQuery) -> dict:
+    return {
+        "query_id": query.id,
+        "state": query.harvest_state,
+        "harvested": query.harvest_next_start,
+        "target": query.harvest_target
+    }
+
+
+async def start_harvest(session_factory: async_sessionmaker, search_query: str, target: int) -> ArxivQuery:
+    async with session_factory() as db, db.begin():
+        query_id = await insert_query(
+            db,
+            query=search_query,
+            search_query=search_query,
+            status=200,
+            num_results=0,
+            harvest_state=HARVEST_RUNNING,
+            harvest_target=target,
+            harvest_next_start=0,
+            harvest_updated_at=datetime.now(timezone.utc)
+        )
+    async with session_factory() as db:
+        return await db.get(ArxivQuery, query_id)
+
+
+async def claim_harvest(session_factory: async_sessionmaker, query_id: int) -> bool:
+    """Mark a harvest running, unless a worker is already running it; whether this caller got it.
+
+    The check and the update are one conditional UPDATE, so of several workers resuming the
+    same harvest at once exactly one wins.
+    """
+    stale = datetime.now(timezone.utc) - timedelta(seconds=HARVEST_STALE_AFTER)
+    async with session_factory() as db, db.begin():
+        result = await db.execute(
+            update(ArxivQuery)
+            .where(ArxivQuery.id == query_id, ArxivQuery.harvest_state.is_not(None),
+                   or_(ArxivQuery.harvest_state != HARVEST_RUNNING, ArxivQuery.harvest_updated_at.is_(None),
+                       ArxivQuery.harvest_updated_at < stale))
+            .values(harvest_state=HARVEST_RUNNING, harvest_updated_at=datetime.now(timezone.utc))
+        )
+    return result.rowcount == 1
+
+
+async def run_harvest(query_id: int, session_factory: async_sessionmaker, client: AsyncClient,
+                      pages: Optional[ResponseCache] = None):
+    """Page through arXiv for a harvest query, starting after its last completed window.
+
+    Each window is written in its own transaction together with the progress columns on
+    ``arxiv_queries``, so a crashed harvest resumes exactly where the last commit left off.
+    Windows are requested at background priority, so the client's rate limiter spaces them
+    out and lets interactive searches go first.
+    """
+    async with session_factory() as db:
+        query = await db.get(ArxivQuery, query_id)
+    if query is None or query.harvest_state == HARVEST_COMPLETE:
+        return
+
+    next_start, target = query.harvest_next_start, query.harvest_target
+    state = HARVEST_FAILED
+    try:
+        await set_harvest_state(session_factory, query_id, HARVEST_RUNNING)
+        while next_start < target:
+            window = min(HARVEST_PAGE_SIZE, target - next_start)
+            parser = AtomStreamParser()
+            response = await open_arxiv_stream(client, build_arxiv_url(query.search_query, next_start, window),
+                                               PRIORITY_BACKGROUND)
+            try:
+                async with session_factory() as db, db.begin():
+                    stored = await store_feed(db, query_id, response, parser, window, next_start)
+                    next_start += stored
+                    target = min(target, parser.total_results)
+                    await db.execute(update(ArxivQuery).where(ArxivQuery.id == query_id).values(
+                        num_results=next_start,
+                        harvest_next_start=next_start,
+                        harvest_target=target,
+                        harvest_updated_at=datetime.now(timezone.utc)
+                    ))
+            finally:
+                await response.aclose()
+            invalidate_pages(pages)
+            logger.info(f"Harvest {query_id}: stored {next_start} of {target} results")
+
+            if stored == 0 and next_start < target:
+                logger.warning(f"Harvest {query_id}: arXiv returned an empty window at {next_start}")
+                return
+        state = HARVEST_COMPLETE
+    except Exception as error:
+        logger.error(f"Harvest {query_id} failed at {next_start}: {str(error)}")
+    finally:
+        await set_harvest_state(session_factory, query_id, state)
+        invalidate_pages(pages)
+
+
+def invalidate_pages(pages: Optional[ResponseCache]):
+    if pages is not None:
+        pages.invalidate()
+
+
+async def set_harvest_state(session_factory: async_sessionmaker, query_id: int, state: str):
+    async with session_factory() as db, db.begin():
+        await db.execute(update(ArxivQuery).where(ArxivQuery.id == query_id).values(
+            harvest_state=state,
+            harvest_updated_at=datetime.now(timezone.utc)
+        ))
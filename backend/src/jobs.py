@@ -0,0 +1,214 @@
+import asyncio
+import logging
+import os
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Optional
+
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from .cache import CachedSearch
+from .models import ArxivJob
+from .schemas import ArxivSearchParams
+
+logger = logging.getLogger(__name__)
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+
+SearchHandler = Callable[[ArxivSearchParams], Awaitable[CachedSearch]]
+
+
+class QueueFull(Exception):
+    pass
+
+
+class MemoryJobStore:
+    """Keeps job state in process, at most ``max_jobs`` of them.
+
+    A new job makes room by forgetting the oldest finished one. Queued and running jobs are
+    never dropped: with ``max_jobs`` of them unfinished, new jobs are refused with :class:`QueueFull`.
+    """
+
+    def __init__(self, max_jobs: int):
+        self.max_jobs = max_jobs
+        self._jobs: dict[str, dict] = {}
+        self._finished: OrderedDict[str, None] = OrderedDict()
+
+    async def add(self, job_id: str, params: ArxivSearchParams):
+        if len(self._jobs) >= self.max_jobs:
+            if not self._finished:
+                raise QueueFull()
+            oldest, _ = self._finished.popitem(last=False)
+            del self._jobs[oldest]
+        self._jobs[job_id] = {"job_id": job_id, "status": JOB_QUEUED, "params": params}
+
+    async def claim(self, job_id: str) -> bool:
+        return await self.update(job_id, status=JOB_RUNNING)
+
+    async def update(self, job_id: str, **changes) -> bool:
+        job = self._jobs.get(job_id)
+        if job is None:
+            return False
+        job.update(changes)
+        if job["status"] in (JOB_SUCCEEDED, JOB_FAILED):
+            self._finished[job_id] = None
+        return True
+
+    async def get(self, job_id: str) -> Optional[dict]:
+        return self._jobs.get(job_id)
+
+    async def recover(self) -> list[tuple[str, ArxivSearchParams]]:
+        return []
+
+
+class DatabaseJobStore:
+    """Persists jobs in ``arxiv_jobs`` so queued work survives a restart.
+
+    ``claim`` only moves a job from queued to running in a conditional UPDATE, so a job is
+    executed once even if several workers recover it.
+    """
+
+    def __init__(self, session_factory: async_sessionmaker, stale_after: float):
+        self.session_factory = session_factory
+        self.stale_after = stale_after
+
+    async def add(self, job_id: str, params: ArxivSearchParams):
+        async with self.session_factory() as db, db.begin():
+            db.add(ArxivJob(id=job_id, status=JOB_QUEUED, params=params.model_dump_json()))
+
+    async def claim(self, job_id: str) -> bool:
+        async with self.session_factory() as db, db.begin():
+            result = await db.execute(update(ArxivJob).where(ArxivJob.id == job_id, ArxivJob.status == JOB_QUEUED)
+                                      .values(status=JOB_RUNNING, updated_at=datetime.now(timezone.utc)))
+        return result.rowcount == 1
+
+    async def update(self, job_id: str, **changes) -> bool:
+        async with self.session_factory() as db, db.begin():
+            result = await db.execute(update(ArxivJob).where(ArxivJob.id == job_id)
+                                      .values(updated_at=datetime.now(timezone.utc), **changes))
+        return result.rowcount == 1
+
+    async def get(self, job_id: str) -> Optional[dict]:
+        async with self.session_factory() as db:
+            job = await db.get(ArxivJob, job_id)
+        if job is None:
+            return None
+        return {"job_id": job.id, "status": job.status, "query_id": job.query_id, "num_results": job.num_results,
+                "error": job.error}
+
+    async def recover(self) -> list[tuple[str, ArxivSearchParams]]:
+        stale = datetime.now(timezone.utc) - timedelta(seconds=self.stale_after)
+        async with self.session_factory() as db, db.begin():
+            await db.execute(update(ArxivJob).where(ArxivJob.status == JOB_RUNNING, ArxivJob.updated_at < stale)
+                             .values(status=JOB_QUEUED))
+            jobs = (await db.scalars(select(ArxivJob).where(ArxivJob.status == JOB_QUEUED)
+                                     .order_by(ArxivJob.created_at))).all()
+        return [(job.id, ArxivSearchParams.model_validate_json(job.params)) for job in jobs]
+
+
+class JobQueue:
+    """Bounded queue of arXiv searches drained by a fixed number of worker tasks.
+
+    ``submit`` raises :class:`QueueFull` instead of waiting, so callers can shed load while
+    the workers are saturated.
+    """
+
+    def __init__(self, store, handler: SearchHandler, workers: int, max_depth: int):
+        self.store = store
+        self.handler = handler
+        self.workers = workers
+        self._queue: asyncio.Queue[tuple[str, ArxivSearchParams]] = asyncio.Queue(max_depth)
+        self._tasks: list[asyncio.Task] = []
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+
+    async def start(self):
+        for job_id, params in await self.store.recover():
+            if self._queue.full():
+                break
+            self._queue.put_nowait((job_id, params))
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def submit(self, params: ArxivSearchParams) -> str:
+        if self._queue.full():
+            self.rejected += 1
+            raise QueueFull()
+        job_id = uuid.uuid4().hex
+        try:
+            await self.store.add(job_id, params)
+        except QueueFull:
+            self.rejected += 1
+            raise
+        try:
+            self._queue.put_nowait((job_id, params))
+        except asyncio.QueueFull:
+            self.rejected += 1
+            await self.store.update(job_id, status=JOB_FAILED, error="Job queue is full")
+            raise QueueFull()
+        return job_id
+
+    async def get(self, job_id: str) -> Optional[dict]:
+        return await self.store.get(job_id)
+
+    async def _work(self):
+        while True:
+            job_id, params = await self._queue.get()
+            try:
+                if await self.store.claim(job_id):
+                    await self._run(job_id, params)
+            except Exception as error:
+                logger.error(f"Job {job_id} could not be run: {str(error)}")
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job_id: str, params: ArxivSearchParams):
+        self.running += 1
+        try:
+            result = await self.handler(params)
+        except Exception as error:
+            self.failed += 1
+            logger.error(f"Job {job_id} failed: {str(error)}")
+            await self.store.update(job_id, status=JOB_FAILED, error=str(error) or type(error).__name__)
+        else:
+            self.completed += 1
+            await self.store.update(job_id, status=JOB_SUCCEEDED, query_id=result.query_id,
+                                    num_results=result.num_results)
+        finally:
+            self.running -= 1
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "depth": self._queue.qsize(),
+            "max_depth": self._queue.maxsize,
+            "running": self.running,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected
+        }
+
+
+def create_job_queue(handler: SearchHandler, session_factory: async_sessionmaker) -> JobQueue:
+    if os.getenv("JOB_BACKEND", "memory").lower() == "database":
+        store = DatabaseJobStore(session_factory, stale_after=float(os.getenv("JOB_STALE_AFTER", "600")))
+    else:
+        store = MemoryJobStore(max_jobs=int(os.getenv("JOB_MAX_RETAINED", "10000")))
+    return JobQueue(
+        store,
+        handler,
+        workers=int(os.getenv("JOB_WORKERS", "4")),
+        max_depth=int(os.getenv("JOB_QUEUE_SIZE", "100"))
+    )
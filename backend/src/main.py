@@ -1,3 +1,4 @@
+import asyncio
 import logging
 from contextlib import asynccontextmanager
 
@@ -5,23 +6,59 @@ from dotenv import load_dotenv
 from fastapi import FastAPI
 from sqlalchemy.exc import SQLAlchemyError
 
-from .api import arxiv, queries, results
-from .database import Base, engine
+# Before the imports below, which read their settings from the environment.
+load_dotenv()
+
+from .api import arxiv, cache, metrics, queries, results
+from .api.arxiv import run_search
+from .arxiv_client import create_arxiv_client
+from .breaker import create_circuit_breaker
+from .cache import create_response_cache, create_search_cache
+from .database import MIGRATE_ON_STARTUP, AsyncSessionLocal, async_engine
+from .jobs import create_job_queue
+from .metrics import REGISTRY, RequestMetricsMiddleware
+from .migrations import migrate
+from .profiling import RequestProfilerMiddleware
+from .ratelimit import PRIORITY_BACKGROUND, create_arxiv_rate_limiter
+from .singleflight import SingleFlight
 
 logging.basicConfig(level="INFO")
 logger = logging.getLogger(__name__)
-load_dotenv()
 
 
 @asynccontextmanager
-async def lifespan(_app: FastAPI):
-    try:
-        Base.metadata.create_all(bind=engine)
-    except SQLAlchemyError as e:
-        logger.error(f"Failed to create tables: {str(e)}")
-        raise
+async def lifespan(app_instance: FastAPI):
+    # backend.src.serve migrates once before starting its workers, so they skip it.
+    if MIGRATE_ON_STARTUP:
+        try:
+            async with async_engine.begin() as connection:
+                await connection.run_sync(migrate)
+        except SQLAlchemyError as e:
+            logger.error(f"Failed to migrate the database schema: {str(e)}")
+            raise
+    state = app_instance.state
+    state.arxiv_limiter = create_arxiv_rate_limiter()
+    state.arxiv_breaker = create_circuit_breaker()
+    state.arxiv_client = create_arxiv_client(state.arxiv_limiter, state.arxiv_breaker)
+    state.search_cache = create_search_cache()
+    state.response_cache = create_response_cache()
+    state.search_flights = SingleFlight()
+    state.search_jobs = create_job_queue(
+        lambda params: run_search(params, AsyncSessionLocal, state.arxiv_client, state.search_cache,
+                                  state.response_cache, state.search_flights, PRIORITY_BACKGROUND),
+        AsyncSessionLocal
+    )
+    await state.search_jobs.start()
+    metrics_flusher = asyncio.create_task(REGISTRY.flush_periodically()) if REGISTRY.directory else None
     yield
-    engine.dispose()
+    if metrics_flusher is not None:
+        metrics_flusher.cancel()
+        REGISTRY.flush(gauges=False)
+    await state.search_jobs.stop()
+    await state.arxiv_client.aclose()
+    if state.arxiv_limiter is not None:
+        await state.arxiv_limiter.close()
+    await async_engine.dispose()
 
 
 app = FastAPI(
@@ -31,7 +68,12 @@ app = FastAPI(
     lifespan=lifespan
 )
 
+app.add_middleware(RequestMetricsMiddleware)
+app.add_middleware(RequestProfilerMiddleware)
+
 app.include_router(arxiv.router)
+app.include_router(cache.router)
+app.include_router(metrics.router)
 app.include_router(queries.router)
 app.include_router(results.router)
 
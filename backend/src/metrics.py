@@ -0,0 +1,278 @@
+import asyncio
+import json
+import logging
+import math
+import os
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+# Rendered as Prometheus text exposition format 0.0.4.
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Set by backend.src.serve when it starts several workers: each writes its samples here, and a scrape
+# reports the sum over all of them instead of the numbers of whichever worker answered.
+METRICS_MULTIPROC_DIR = os.getenv("METRICS_MULTIPROC_DIR")
+METRICS_FLUSH_INTERVAL = float(os.getenv("METRICS_FLUSH_INTERVAL", "5"))
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 7.5, 10.0, 30.0, 60.0)
+
+
+def format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for value in values)
+    return "{" + ",".join(f'{name}="{value}"' for name, value in zip(names, escaped)) + "}"
+
+
+def format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+
+def render_metric(name: str, documentation: str, kind: str, samples) -> str:
+    lines = [f"# HELP {name} {documentation}", f"# TYPE {name} {kind}"]
+    lines.extend(f"{sample}{labels} {format_value(value)}" for sample, labels, value in samples)
+    return "\n".join(lines)
+
+
+def process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def _key(self, labels: Sequence[str]) -> tuple:
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {labels}")
+        return tuple(str(label) for label in labels)
+
+    def samples(self) -> list[tuple[str, str, float]]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        return render_metric(self.name, self.documentation, self.kind, self.samples())
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, *labels, amount: float = 1.0):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, *labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def samples(self):
+        return [(f"{self.name}_total", format_labels(self.labelnames, key), value)
+                for key, value in self._values.items()]
+
+
+class Gauge(Metric):
+    """A value read from ``function`` at scrape time, so it is never stale.
+
+    Across workers, gauges are added up, or with ``mode="max"`` the highest value is reported.
+    """
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, function: Callable[[], float], mode: str = "sum"):
+        super().__init__(name, documentation)
+        self.function = function
+        self.mode = mode
+
+    def samples(self):
+        return [(self.name, "", self.function())]
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        # Per label set: a count per bucket (not cumulative), the sum and the count.
+        self._series: dict[tuple, tuple[list[int], list[float]]] = {}
+
+    def observe(self, value: float, *labels):
+        key = self._key(labels)
+        counts, totals = self._series.setdefault(key, ([0] * len(self.buckets), [0.0, 0]))
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[index] += 1
+                break
+        totals[0] += value
+        totals[1] += 1
+
+    @contextmanager
+    def time(self, *labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+    def count(self, *labels) -> int:
+        series = self._series.get(self._key(labels))
+        return series[1][1] if series else 0
+
+    def samples(self):
+        samples = []
+        for key, (counts, (total, count)) in self._series.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                bucket_labels = format_labels(self.labelnames + ("le",), key + (format_value(bound),))
+                samples.append((f"{self.name}_bucket", bucket_labels, cumulative))
+            labels = format_labels(self.labelnames, key)
+            samples.append((f"{self.name}_sum", labels, total))
+            samples.append((f"{self.name}_count", labels, count))
+        return samples
+
+
+class Registry:
+    """The metrics of this process, or of all workers when ``directory`` is set.
+
+    In multiprocess mode every worker writes a snapshot of its samples to ``<directory>/<pid>.json``
+    every ``METRICS_FLUSH_INTERVAL`` seconds, and the worker answering a scrape merges them.
+    Counters and histograms of workers that exited are kept, so totals never go backwards;
+    their gauges are dropped.
+    """
+
+    def __init__(self, directory: Optional[str] = METRICS_MULTIPROC_DIR, pid: Optional[int] = None):
+        self._metrics: dict[str, Metric] = {}
+        self.directory = Path(directory) if directory else None
+        self.pid = pid or os.getpid()
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def snapshot(self, gauges: bool = True) -> dict:
+        return {metric.name: {"kind": metric.kind, "documentation": metric.documentation,
+                              "mode": getattr(metric, "mode", "sum"), "samples": metric.samples()}
+                for metric in self._metrics.values() if gauges or metric.kind != "gauge"}
+
+    def flush(self, gauges: bool = True):
+        """Write this worker's samples for the others to read; the last flush of a worker leaves out its gauges."""
+        path = self.directory / f"{self.pid}.json"
+        temporary = path.with_suffix(".tmp")
+        temporary.write_text(json.dumps({"pid": self.pid, "metrics": self.snapshot(gauges)}))
+        temporary.replace(path)
+
+    async def flush_periodically(self, interval: float = METRICS_FLUSH_INTERVAL):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                self.flush()
+            except OSError as error:
+                logger.error(f"Unable to write metrics to {self.directory}: {str(error)}")
+
+    def collect(self) -> dict:
+        if self.directory is None:
+            return self.snapshot()
+        self.flush()
+        merged = {}
+        for path in sorted(self.directory.glob("*.json")):
+            try:
+                worker = json.loads(path.read_text())
+            except (OSError, ValueError):
+                continue  # A worker replacing its file right now; its next flush is read on the next scrape.
+            alive = worker["pid"] == self.pid or process_alive(worker["pid"])
+            for name, metric in worker["metrics"].items():
+                if metric["kind"] == "gauge" and not alive:
+                    continue
+                target = merged.setdefault(name, {**metric, "samples": {}})
+                for sample, labels, value in metric["samples"]:
+                    previous = target["samples"].get((sample, labels))
+                    if previous is None:
+                        target["samples"][(sample, labels)] = value
+                    elif metric["mode"] == "max":
+                        target["samples"][(sample, labels)] = max(previous, value)
+                    else:
+                        target["samples"][(sample, labels)] = previous + value
+        for metric in merged.values():
+            metric["samples"] = [(sample, labels, value) for (sample, labels), value in metric["samples"].items()]
+        return merged
+
+    def render(self) -> str:
+        return "\n".join(render_metric(name, metric["documentation"], metric["kind"], metric["samples"])
+                         for name, metric in self.collect().items()) + "\n"
+
+
+REGISTRY = Registry()
+
+HTTP_REQUEST_SECONDS = REGISTRY.register(Histogram(
+    "http_request_duration_seconds", "Time spent answering a request, by route template.",
+    ("method", "route", "status")))
+ARXIV_REQUEST_SECONDS = REGISTRY.register(Histogram(
+    "arxiv_request_duration_seconds", "Time from sending an arXiv request to its response headers, per attempt."))
+ARXIV_RESPONSES = REGISTRY.register(Counter(
+    "arxiv_responses", "arXiv responses by HTTP status code, or 'error' when no response arrived.", ("status",)))
+FEED_PARSE_SECONDS = REGISTRY.register(Histogram(
+    "arxiv_feed_parse_seconds", "CPU time spent parsing one arXiv Atom response."))
+FEED_INSERT_SECONDS = REGISTRY.register(Histogram(
+    "arxiv_feed_insert_seconds", "Time spent writing the entries of one arXiv response to the database."))
+RETRIES = REGISTRY.register(Counter(
+    "retries", "Attempts retried by tenacity, by the function that failed.", ("function",)))
+STALE_RESPONSES = REGISTRY.register(Counter(
+    "arxiv_stale_responses", "Searches answered with an older stored copy because arXiv was unavailable."))
+DB_POOL_WAIT_SECONDS = REGISTRY.register(Histogram(
+    "db_pool_wait_seconds", "Time spent waiting for a database connection from the pool, including connecting."))
+
+
+class RequestMetricsMiddleware:
+    """ASGI middleware recording ``http_request_duration_seconds`` for every HTTP request.
+
+    Requests are labelled by route template, so ``/queries/{query_id}/results`` stays one
+    series however many queries there are.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = scope.get("route")
+            HTTP_REQUEST_SECONDS.observe(time.perf_counter() - start, scope["method"],
+                                         getattr(route, "path", "unmatched"), status)
+
+
+def record_retry(retry_state):
+    """tenacity ``before_sleep`` hook counting every retried attempt."""
+    RETRIES.inc(getattr(retry_state.fn, "__name__", "unknown"))
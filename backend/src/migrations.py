@@ -0,0 +1,152 @@
+"""Versioned schema changes for databases created by earlier releases.
+
+``create_all`` only creates missing tables, it never adds columns or indexes to existing
+ones. Every change to an existing table is therefore appended to :data:`MIGRATIONS` and
+recorded in ``schema_version``; fresh databases are created from the models and stamped
+with the latest version directly.
+"""
+import logging
+from typing import Callable
+
+from sqlalchemy import Column, Connection, Integer, Table, delete, insert, inspect, select, text
+
+from .database import Base
+from .models import FULL_TEXT_DDL, ArxivJob, ArxivQuery, Author, Paper, PaperAuthor
+from .storage import INSERT_BATCH_SIZE, author_links, insert_ignoring_duplicates
+
+logger = logging.getLogger(__name__)
+
+schema_version = Table("schema_version", Base.metadata, Column("version", Integer, nullable=False))
+
+
+def add_missing_columns(connection: Connection, table: Table, names: list[str]):
+    existing = {column["name"] for column in inspect(connection).get_columns(table.name)}
+    for name in names:
+        if name not in existing:
+            column_type = table.c[name].type.compile(dialect=connection.dialect)
+            connection.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {name} {column_type}"))
+
+
+def create_index(connection: Connection, table: Table, name: str):
+    index = next(index for index in table.indexes if index.name == name)
+    index.create(connection, checkfirst=True)
+
+
+def drop_index(connection: Connection, name: str):
+    connection.execute(text(f"DROP INDEX IF EXISTS {name}"))
+
+
+def add_search_and_harvest_columns(connection: Connection):
+    add_missing_columns(connection, ArxivQuery.__table__, [
+        "search_key", "search_query", "harvest_state", "harvest_target", "harvest_next_start"
+    ])
+    create_index(connection, ArxivQuery.__table__, "ix_arxiv_queries_search_key")
+    ArxivJob.__table__.create(connection, checkfirst=True)
+
+
+def index_access_patterns(connection: Connection):
+    create_index(connection, ArxivQuery.__table__, "ix_arxiv_queries_timestamp_id")
+    if inspect(connection).has_table("arxiv_results"):
+        connection.execute(text("CREATE INDEX IF NOT EXISTS ix_arxiv_results_query_id_id "
+                                "ON arxiv_results (query_id, id)"))
+    # Nothing filters on the query text, and (query_id, id) covers every lookup by query_id.
+    drop_index(connection, "ix_arxiv_queries_query")
+    drop_index(connection, "ix_arxiv_results_query_id")
+
+
+def add_full_text_search(connection: Connection):
+    for statement in FULL_TEXT_DDL.get(connection.dialect.name, []):
+        connection.execute(text(statement))
+    if connection.dialect.name == "sqlite":
+        connection.execute(text("INSERT INTO papers_fts (papers_fts) VALUES ('rebuild')"))
+
+
+def add_harvest_heartbeat(connection: Connection):
+    add_missing_columns(connection, ArxivQuery.__table__, ["harvest_updated_at"])
+
+
+# Rank within each query and the first row of every identical (title, author, journal) copy.
+LEGACY_RESULTS = (
+    "SELECT id, query_id, title, author, journal, "
+    "ROW_NUMBER() OVER (PARTITION BY query_id ORDER BY id) - 1 AS rank, "
+    "MIN(id) OVER (PARTITION BY title, author, journal) AS first_id "
+    "FROM arxiv_results WHERE query_id IS NOT NULL"
+)
+
+
+def normalize_results(connection: Connection):
+    """Move ``arxiv_results`` into ``papers``, ``authors`` and ``query_results``.
+
+    Old rows carry no arXiv id, so identical copies are merged into one paper keyed
+    ``legacy:<first row id>``. Papers fetched again later get a separate row under their real id.
+    """
+    if not inspect(connection).has_table("arxiv_results"):
+        return
+
+    connection.execute(text(
+        "INSERT INTO papers (arxiv_id, title, authors, journal) "
+        f"SELECT 'legacy:' || id, title, author, journal FROM ({LEGACY_RESULTS}) AS legacy WHERE id = first_id"
+    ))
+    connection.execute(text(
+        "INSERT INTO query_results (query_id, rank, paper_id) "
+        f"SELECT legacy.query_id, legacy.rank, papers.id FROM ({LEGACY_RESULTS}) AS legacy "
+        "JOIN papers ON papers.arxiv_id = 'legacy:' || legacy.first_id"
+    ))
+
+    dialect = connection.dialect.name
+    papers = connection.execute(select(Paper.arxiv_id, Paper.id, Paper.authors)
+                                .where(Paper.arxiv_id.like("legacy:%"))).all()
+    for start in range(0, len(papers), INSERT_BATCH_SIZE):
+        batch = papers[start:start + INSERT_BATCH_SIZE]
+        authors_by_paper = {arxiv_id: [name for name in (authors or "").split(", ") if name]
+                            for arxiv_id, _, authors in batch}
+        names = {name for names in authors_by_paper.values() for name in names}
+        if not names:
+            continue
+        connection.execute(insert_ignoring_duplicates(dialect, Author.__table__, "name"),
+                           [{"name": name} for name in names])
+        author_ids = dict(connection.execute(select(Author.name, Author.id).where(Author.name.in_(names))).all())
+        connection.execute(insert_ignoring_duplicates(dialect, PaperAuthor.__table__, "paper_id", "position"),
+                           author_links({arxiv_id: paper_id for arxiv_id, paper_id, _ in batch}, author_ids,
+                                        authors_by_paper))
+
+    connection.execute(text("DROP TABLE IF EXISTS arxiv_results_fts"))
+    connection.execute(text("DROP TABLE arxiv_results"))
+
+
+MIGRATIONS: list[Callable[[Connection], None]] = [
+    add_search_and_harvest_columns,
+    index_access_patterns,
+    add_full_text_search,
+    normalize_results,
+    add_harvest_heartbeat,
+]
+
+LATEST_VERSION = len(MIGRATIONS)
+
+
+def current_version(connection: Connection) -> int:
+    if not inspect(connection).has_table(schema_version.name):
+        return 0
+    return connection.scalar(select(schema_version.c.version)) or 0
+
+
+def set_version(connection: Connection, version: int):
+    connection.execute(delete(schema_version))
+    connection.execute(insert(schema_version).values(version=version))
+
+
+def migrate(connection: Connection):
+    """Bring the schema up to :data:`LATEST_VERSION` inside the caller's transaction."""
+    if not inspect(connection).has_table(ArxivQuery.__tablename__):
+        Base.metadata.create_all(connection)
+        set_version(connection, LATEST_VERSION)
+        return
+
+    version = current_version(connection)
+    Base.metadata.create_all(connection)
+    for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+        logger.info(f"Applying schema migration {number}: {migration.__name__}")
+        migration(connection)
+    if version != LATEST_VERSION:
+        set_version(connection, LATEST_VERSION)
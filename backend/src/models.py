@@ -1,4 +1,6 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey
+from datetime import datetime, timezone
+
+from sqlalchemy import DDL, Column, Integer, String, DateTime, ForeignKey, Index, event
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 
@@ -7,23 +9,127 @@ from .database import Base
 
 class ArxivQuery(Base):
     __tablename__ = "arxiv_queries"
+    __table_args__ = (
+        Index("ix_arxiv_queries_timestamp_id", "timestamp", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
-    query = Column(String, index=True)
-    timestamp = Column(DateTime(timezone=True), default=func.now())
+    query = Column(String)
+    search_key = Column(String, index=True)
+    timestamp = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
     status = Column(Integer)
     num_results = Column(Integer)
+    search_query = Column(String)
+    harvest_state = Column(String)
+    harvest_target = Column(Integer)
+    harvest_next_start = Column(Integer)
+    # Touched whenever a harvest window commits; a running harvest that stops touching it was abandoned.
+    harvest_updated_at = Column(DateTime(timezone=True))
 
-    results = relationship("ArxivResult", back_populates="query")
+    results = relationship("QueryResult", back_populates="query", order_by="QueryResult.rank")
 
 
-class ArxivResult(Base):
-    __tablename__ = "arxiv_results"
+class Paper(Base):
+    """One row per arXiv paper, shared by every query that returned it."""
+    __tablename__ = "papers"
 
-    id = Column(Integer, primary_key=True, index=True)
-    query_id = Column(Integer, ForeignKey('arxiv_queries.id'), index=True)
-    author = Column(String)
+    id = Column(Integer, primary_key=True)
+    arxiv_id = Column(String, nullable=False, unique=True)
     title = Column(String)
+    # Display form of the author list, as returned by /results; the normalized names live in paper_authors.
+    authors = Column(String)
     journal = Column(String)
 
+    author_links = relationship("PaperAuthor", back_populates="paper", order_by="PaperAuthor.position")
+
+
+class Author(Base):
+    __tablename__ = "authors"
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String, nullable=False, unique=True)
+
+
+class PaperAuthor(Base):
+    __tablename__ = "paper_authors"
+
+    paper_id = Column(Integer, ForeignKey('papers.id'), primary_key=True)
+    position = Column(Integer, primary_key=True)
+    author_id = Column(Integer, ForeignKey('authors.id'), nullable=False, index=True)
+
+    paper = relationship("Paper", back_populates="author_links")
+    author = relationship("Author")
+
+
+class QueryResult(Base):
+    """Links a query to the papers it returned, in arXiv's rank order."""
+    __tablename__ = "query_results"
+
+    query_id = Column(Integer, ForeignKey('arxiv_queries.id'), primary_key=True)
+    rank = Column(Integer, primary_key=True)
+    paper_id = Column(Integer, ForeignKey('papers.id'), nullable=False, index=True)
+
     query = relationship("ArxivQuery", back_populates="results")
+    paper = relationship("Paper")
+
+
+class ArxivJob(Base):
+    __tablename__ = "arxiv_jobs"
+
+    id = Column(String(32), primary_key=True)
+    status = Column(String, index=True)
+    params = Column(String)
+    query_id = Column(Integer, ForeignKey('arxiv_queries.id'))
+    num_results = Column(Integer)
+    error = Column(String)
+    created_at = Column(DateTime(timezone=True), default=func.now())
+    updated_at = Column(DateTime(timezone=True), default=func.now())
+
+
+
+class BulkImport(Base):
+    """Progress of one metadata dump import, so an interrupted import resumes where it stopped."""
+    __tablename__ = "bulk_imports"
+
+    id = Column(Integer, primary_key=True)
+    # File name and size of the dump; importing the same file again resumes or skips it.
+    source = Column(String, nullable=False, unique=True)
+    query_id = Column(Integer, ForeignKey('arxiv_queries.id'), nullable=False)
+    state = Column(String)
+    # Records read from the dump, including deleted or malformed ones that were skipped.
+    position = Column(Integer, nullable=False, default=0)
+    stored = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime(timezone=True), default=func.now())
+
+# Full-text search over papers lives outside the ORM columns: a generated tsvector with a
+# GIN index on Postgres, and an external-content FTS5 table kept in sync by triggers on SQLite.
+FULL_TEXT_DDL = {
+    "postgresql": [
+        "ALTER TABLE papers ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS ("
+        "setweight(to_tsvector('english', coalesce(title, '')), 'A') || "
+        "setweight(to_tsvector('english', coalesce(authors, '')), 'B') || "
+        "setweight(to_tsvector('english', coalesce(journal, '')), 'C')) STORED",
+        "CREATE INDEX IF NOT EXISTS ix_papers_search_vector ON papers USING gin (search_vector)"
+    ],
+    "sqlite": [
+        "CREATE VIRTUAL TABLE IF NOT EXISTS papers_fts USING fts5("
+        "title, authors, journal, content='papers', content_rowid='id')",
+        "CREATE TRIGGER IF NOT EXISTS papers_fts_insert AFTER INSERT ON papers BEGIN "
+        "INSERT INTO papers_fts (rowid, title, authors, journal) "
+        "VALUES (new.id, new.title, new.authors, new.journal); END",
+        "CREATE TRIGGER IF NOT EXISTS papers_fts_delete AFTER DELETE ON papers BEGIN "
+        "INSERT INTO papers_fts (papers_fts, rowid, title, authors, journal) "
+        "VALUES ('delete', old.id, old.title, old.authors, old.journal); END",
+        "CREATE TRIGGER IF NOT EXISTS papers_fts_update AFTER UPDATE ON papers BEGIN "
+        "INSERT INTO papers_fts (papers_fts, rowid, title, authors, journal) "
+        "VALUES ('delete', old.id, old.title, old.authors, old.journal); "
+        "INSERT INTO papers_fts (rowid, title, authors, journal) "
+        "VALUES (new.id, new.title, new.authors, new.journal); END"
+    ]
+}
+
+for dialect, statements in FULL_TEXT_DDL.items():
+    for statement in statements:
+        event.listen(Paper.__table__, "after_create", DDL(statement).execute_if(dialect=dialect))
+event.listen(Paper.__table__, "before_drop",
+             DDL("DROP TABLE IF EXISTS papers_fts").execute_if(dialect="sqlite"))
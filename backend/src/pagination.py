@@ -0,0 +1,76 @@
+import base64
+import json
+import os
+from datetime import datetime
+from typing import Any, Callable, NamedTuple, Optional, Sequence
+
+from sqlalchemy import DateTime, Select, bindparam, tuple_
+
+MAX_ITEMS_PER_PAGE = int(os.getenv("MAX_ITEMS_PER_PAGE", "100"))
+
+NEXT = "next"
+PREV = "prev"
+
+
+class Cursor(NamedTuple):
+    direction: str
+    key: tuple
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(direction: str, key: Sequence[Any]) -> str:
+    values = [value.isoformat() if isinstance(value, datetime) else value for value in key]
+    payload = json.dumps([direction, values], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip("=")
+
+
+def decode_cursor(token: str, columns: Sequence) -> Cursor:
+    try:
+        direction, values = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+        if direction not in (NEXT, PREV) or len(values) != len(columns):
+            raise InvalidCursor(token)
+        key = tuple(datetime.fromisoformat(value) if isinstance(column.type, DateTime) else value
+                    for column, value in zip(columns, values))
+    except (TypeError, ValueError) as error:
+        raise InvalidCursor(token) from error
+    return Cursor(direction, key)
+
+
+def seek(statement: Select, columns: Sequence, cursor: Optional[Cursor], limit: int,
+         descending: bool = True) -> Select:
+    """Order ``statement`` by ``columns``, newest first by default, and continue after ``cursor``.
+
+    One row more than ``limit`` is selected so the caller can tell whether another page
+    follows. ``prev`` cursors walk the index in the opposite order and are reversed afterwards.
+    """
+    forward = [column.desc() if descending else column.asc() for column in columns]
+    backward = [column.asc() if descending else column.desc() for column in columns]
+    if cursor is None:
+        return statement.order_by(*forward).limit(limit + 1)
+
+    key = tuple_(*columns)
+    bound = tuple_(*(bindparam(None, value, type_=column.type) for column, value in zip(columns, cursor.key)))
+    if cursor.direction == NEXT:
+        after = key < bound if descending else key > bound
+        return statement.where(after).order_by(*forward).limit(limit + 1)
+    before = key > bound if descending else key < bound
+    return statement.where(before).order_by(*backward).limit(limit + 1)
+
+
+def window(rows: Sequence, key_of: Callable[[Any], tuple], cursor: Optional[Cursor], limit: int,
+           has_previous: bool = False) -> tuple[list, Optional[str], Optional[str]]:
+    """Trim the extra row fetched by :func:`seek` and build the neighbouring cursors."""
+    has_more = len(rows) > limit
+    rows = list(rows[:limit])
+    if cursor is not None and cursor.direction == PREV:
+        rows.reverse()
+        has_next, has_previous = True, has_more
+    else:
+        has_next, has_previous = has_more, has_previous or cursor is not None
+
+    next_cursor = encode_cursor(NEXT, key_of(rows[-1])) if rows and has_next else None
+    prev_cursor = encode_cursor(PREV, key_of(rows[0])) if rows and has_previous else None
+    return rows, next_cursor, prev_cursor
@@ -0,0 +1,180 @@
+import cProfile
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+try:
+    from pyinstrument import Profiler
+    from pyinstrument.renderers import SpeedscopeRenderer
+except ImportError:  # Without pyinstrument, profiles fall back to cProfile's .prof format.
+    Profiler = None
+
+logger = logging.getLogger(__name__)
+
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_ALLOW_HEADER = os.getenv("PROFILE_ALLOW_HEADER", "false").lower() == "true"
+PROFILE_DIR = Path(os.getenv("PROFILE_DIR", "./profiles"))
+# A statement repeated this many times within one request is reported as a likely N+1.
+N_PLUS_ONE_THRESHOLD = int(os.getenv("PROFILE_N_PLUS_ONE_THRESHOLD", "5"))
+
+PROFILE_HEADER = b"x-profile"
+# pyinstrument and cProfile both refuse to start a second profiler while one is running.
+PROFILER_LOCK = threading.Lock()
+LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+
+
+class SqlStats:
+    """Statements run on behalf of one profiled request."""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.statements: Counter[str] = Counter()
+
+    def record(self, statement: str, seconds: float):
+        self.count += 1
+        self.seconds += seconds
+        # Inlined literals would make every iteration of a loop look like a different statement.
+        self.statements[LITERALS.sub("?", " ".join(statement.split()))] += 1
+
+    def repeated(self) -> dict[str, int]:
+        return {statement: count for statement, count in self.statements.items() if count >= N_PLUS_ONE_THRESHOLD}
+
+
+current_sql: ContextVar[Optional[SqlStats]] = ContextVar("current_sql", default=None)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def start_statement_timer(conn, cursor, statement, parameters, context, executemany):
+    if current_sql.get() is not None:
+        conn.info.setdefault("profile_start", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def record_statement(conn, cursor, statement, parameters, context, executemany):
+    stats = current_sql.get()
+    if stats is not None and conn.info.get("profile_start"):
+        stats.record(statement, time.perf_counter() - conn.info["profile_start"].pop())
+
+
+def start_profiler():
+    if Profiler is None:
+        profiler = cProfile.Profile()
+        profiler.enable()
+    else:
+        profiler = Profiler(async_mode="enabled")
+        profiler.start()
+    return profiler
+
+
+class RequestProfilerMiddleware:
+    """ASGI middleware profiling a sample of requests, or those asking with ``X-Profile: 1``.
+
+    A profiled request gets a sampling profile (speedscope JSON with pyinstrument, cProfile
+    output otherwise) and a SQL summary written to ``PROFILE_DIR``. It also gets
+    ``X-Profile-*`` response headers with the statement count, SQL time, the number of
+    statements that look like an N+1 loop, and the profile file name. Requests that are
+    not profiled only pay for one random draw and one header lookup.
+    """
+
+    def __init__(self, app, sample_rate: float = PROFILE_SAMPLE_RATE, allow_header: bool = PROFILE_ALLOW_HEADER,
+                 directory: Path = PROFILE_DIR):
+        self.app = app
+        self.sample_rate = sample_rate
+        self.allow_header = allow_header
+        self.directory = directory
+
+    def wants_profile(self, scope) -> bool:
+        if self.sample_rate and random.random() < self.sample_rate:
+            return True
+        return self.allow_header and any(name == PROFILE_HEADER and value not in (b"", b"0")
+                                         for name, value in scope["headers"])
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not (self.sample_rate or self.allow_header) or not self.wants_profile(scope):
+            return await self.app(scope, receive, send)
+
+        if not PROFILER_LOCK.acquire(blocking=False):
+            # Requests overlapping a profiled one are served without a profile of their own.
+            return await self.app(scope, receive, send)
+        try:
+            await self.profile(scope, receive, send)
+        finally:
+            PROFILER_LOCK.release()
+
+    async def profile(self, scope, receive, send):
+        try:
+            profiler = start_profiler()
+        except (RuntimeError, ValueError) as error:  # Another profiler, e.g. a debugger's, holds the thread.
+            logger.warning(f"Serving {scope['method']} {scope['path']} unprofiled: {str(error)}")
+            return await self.app(scope, receive, send)
+
+        stats = SqlStats()
+        token = current_sql.set(stats)
+        name = f"{time.strftime('%Y%m%dT%H%M%S')}-{scope['method']}-" \
+               f"{re.sub(r'[^A-Za-z0-9]+', '_', scope['path']).strip('_') or 'root'}-{random.randrange(16 ** 6):06x}"
+        profile_file = name + (".speedscope.json" if Profiler is not None else ".prof")
+        start = time.perf_counter()
+
+        async def send_with_headers(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"x-profile-sql-count", str(stats.count).encode()),
+                    (b"x-profile-sql-ms", f"{stats.seconds * 1000:.1f}".encode()),
+                    (b"x-profile-n-plus-one", str(len(stats.repeated())).encode()),
+                    (b"x-profile-file", profile_file.encode())
+                ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_headers)
+        finally:
+            if Profiler is None:
+                profiler.disable()
+            else:
+                profiler.stop()
+            current_sql.reset(token)
+            self.write(name, profile_file, profiler, scope, stats, time.perf_counter() - start)
+
+    def write(self, name: str, profile_file: str, profiler, scope, stats: SqlStats, seconds: float):
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            if Profiler is None:
+                profiler.dump_stats(self.directory / profile_file)
+            else:
+                (self.directory / profile_file).write_text(profiler.output(SpeedscopeRenderer()))
+            repeated = stats.repeated()
+            summary = {
+                "method": scope["method"],
+                "path": scope["path"],
+                "query_string": scope["query_string"].decode(),
+                "seconds": seconds,
+                "profile": profile_file,
+                "sql": {
+                    "count": stats.count,
+                    "seconds": stats.seconds,
+                    "statements": [{"statement": statement, "count": count}
+                                   for statement, count in stats.statements.most_common()],
+                    "n_plus_one": [{"statement": statement, "count": count} for statement, count in repeated.items()]
+                }
+            }
+            (self.directory / f"{name}.sql.json").write_text(json.dumps(summary, indent=2))
+        except OSError as error:
+            logger.error(f"Unable to write profile {name}: {str(error)}")
+            return
+        if repeated:
+            logger.warning(f"Possible N+1 in {scope['method']} {scope['path']}: "
+                           + "; ".join(f"{count}x {statement[:80]}" for statement, count in repeated.items()))
+        logger.info(f"Profiled {scope['method']} {scope['path']} in {seconds * 1000:.1f} ms with "
+                    f"{stats.count} SQL statements ({stats.seconds * 1000:.1f} ms), written to {profile_file}")
@@ -0,0 +1,239 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+import struct
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+from httpx import Request, Response
+
+from .metrics import REGISTRY, Counter, Gauge, Histogram
+
+try:
+    import fcntl
+except ImportError:  # Without fcntl (Windows) the budget is kept per process instead of per host.
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# arXiv asks API clients for at most one request every three seconds.
+REQUEST_INTERVAL = float(os.getenv("ARXIV_REQUEST_DELAY", "3"))
+RATE_LIMIT_BURST = float(os.getenv("ARXIV_RATE_LIMIT_BURST", "1"))
+RATE_LIMIT_MAX_WAIT = float(os.getenv("ARXIV_RATE_LIMIT_MAX_WAIT", "60"))
+RATE_LIMIT_FILE = Path(os.getenv("ARXIV_RATE_LIMIT_FILE", Path(tempfile.gettempdir()) / "arxiv-rate-limit"))
+
+# Lower values are served first.
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 1
+PRIORITY_NAMES = {PRIORITY_INTERACTIVE: "interactive", PRIORITY_BACKGROUND: "background"}
+PRIORITY_EXTENSION = "arxiv_priority"
+
+# tokens, time of the last refill, and until when interactive requests are waiting somewhere on the host.
+BUCKET_STATE = struct.Struct("ddd")
+
+RATE_LIMIT_WAIT_SECONDS = REGISTRY.register(Histogram(
+    "arxiv_rate_limit_wait_seconds", "Time an arXiv request waited for the shared request budget.", ("priority",)))
+RATE_LIMIT_REJECTIONS = REGISTRY.register(Counter(
+    "arxiv_rate_limit_rejections", "arXiv requests refused because the wait would exceed the maximum.",
+    ("priority",)))
+
+
+class RateLimited(Exception):
+    def __init__(self, retry_after: float):
+        super().__init__(f"arXiv request budget exhausted, retry in {retry_after:.0f} s")
+        self.retry_after = retry_after
+
+
+class SharedTokenBucket:
+    """A token bucket whose state lives in a small file, shared by every process on the host.
+
+    Each call locks the file with ``flock``, refills the bucket for the time passed and takes
+    a token if there is one. Interactive callers that find it empty mark the bucket as
+    wanted, and background callers wait until that mark expires, so priority holds across
+    processes too. The clock is ``time.monotonic``, which all processes on a host share.
+    """
+
+    def __init__(self, path: Path, rate: float, burst: float):
+        self.path = path
+        self.rate = rate
+        self.burst = max(burst, 1.0)
+        self._thread_lock = threading.Lock()
+        self._fd = None
+        if fcntl is None:
+            self._state = (self.burst, 0.0, 0.0)
+
+    def _read(self) -> tuple[float, float, float]:
+        if fcntl is None:
+            return self._state
+        data = os.pread(self._fd, BUCKET_STATE.size, 0)
+        return BUCKET_STATE.unpack(data) if len(data) == BUCKET_STATE.size else (self.burst, 0.0, 0.0)
+
+    def _write(self, state: tuple[float, float, float]):
+        if fcntl is None:
+            self._state = state
+        else:
+            os.pwrite(self._fd, BUCKET_STATE.pack(*state), 0)
+
+    def _update(self, change):
+        with self._thread_lock:
+            if fcntl is not None and self._fd is None:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            if fcntl is not None:
+                fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                now = time.monotonic()
+                tokens, updated, wanted_until = self._read()
+                if updated > now:  # Written before a reboot.
+                    tokens, updated, wanted_until = self.burst, now, 0.0
+                tokens = min(self.burst, tokens + (now - updated) * self.rate)
+                tokens, wanted_until, result = change(now, tokens, wanted_until)
+                self._write((tokens, now, wanted_until))
+                return result
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def take(self, priority: int) -> float:
+        """Take a token and return 0, or return the seconds to wait before trying again."""
+        def change(now: float, tokens: float, wanted_until: float):
+            if priority != PRIORITY_INTERACTIVE and wanted_until > now:
+                return tokens, wanted_until, wanted_until - now
+            if tokens >= 1:
+                return tokens - 1, wanted_until, 0.0
+            wait = (1 - tokens) / self.rate
+            if priority == PRIORITY_INTERACTIVE:
+                wanted_until = max(wanted_until, now + wait + 1 / self.rate)
+            return tokens, wanted_until, wait
+
+        return self._update(change)
+
+    def pause(self, seconds: float):
+        """Empty the bucket for ``seconds``, e.g. after arXiv answered 429 or 503."""
+        self._update(lambda now, tokens, wanted_until: (min(tokens, -seconds * self.rate), wanted_until, None))
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+
+class ArxivRateLimiter:
+    """Hands out the shared arXiv request budget to this process's requests, highest priority first.
+
+    Waiters are kept in a heap ordered by priority and arrival; one dispatcher task grants
+    tokens from the :class:`SharedTokenBucket` as they become available. An interactive
+    request whose expected wait exceeds ``max_wait`` is refused with :class:`RateLimited`
+    instead of queued; background work always waits its turn.
+    """
+
+    def __init__(self, bucket: SharedTokenBucket, max_wait: float = RATE_LIMIT_MAX_WAIT):
+        self.bucket = bucket
+        self.max_wait = max_wait
+        self.granted = 0
+        self.rejected = 0
+        self.throttled = 0
+        self._waiters: list[tuple[int, int, float, asyncio.Future]] = []
+        self._order = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._dispatcher: Optional[asyncio.Task] = None
+
+    def queue_length(self) -> int:
+        return sum(1 for *_, future in self._waiters if not future.done())
+
+    def oldest_wait(self) -> float:
+        """Seconds the longest waiting request has been queued so far."""
+        queued = [enqueued for _, _, enqueued, future in self._waiters if not future.done()]
+        return time.monotonic() - min(queued) if queued else 0.0
+
+    async def acquire(self, priority: int = PRIORITY_INTERACTIVE):
+        ahead = sum(1 for waiter_priority, *_, future in self._waiters
+                    if waiter_priority <= priority and not future.done())
+        expected = ahead / self.bucket.rate
+        if priority == PRIORITY_INTERACTIVE and expected > self.max_wait:
+            self.rejected += 1
+            RATE_LIMIT_REJECTIONS.inc(PRIORITY_NAMES[priority])
+            raise RateLimited(expected)
+
+        start = time.monotonic()
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._order), start, future))
+        self._wakeup.set()
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.create_task(self._dispatch())
+        await future
+        waited = time.monotonic() - start
+        RATE_LIMIT_WAIT_SECONDS.observe(waited, PRIORITY_NAMES[priority])
+        if waited >= 1:
+            logger.info(f"{PRIORITY_NAMES[priority].capitalize()} arXiv request waited {waited:.1f} s "
+                        f"for the rate limit, {self.queue_length()} still queued")
+
+    async def _dispatch(self):
+        while self._waiters:
+            priority, _, _, future = self._waiters[0]
+            if future.done():
+                heapq.heappop(self._waiters)
+                continue
+            wait = self.bucket.take(priority)
+            if wait == 0:
+                heapq.heappop(self._waiters)
+                future.set_result(None)
+                self.granted += 1
+                continue
+            # A request of higher priority arriving meanwhile is looked at right away.
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=wait)
+            except asyncio.TimeoutError:
+                pass
+
+    async def on_request(self, request: Request):
+        """httpx request hook: wait for budget before anything is sent."""
+        await self.acquire(request.extensions.get(PRIORITY_EXTENSION, PRIORITY_INTERACTIVE))
+
+    async def on_response(self, response: Response):
+        """httpx response hook: back off for everyone on the host when arXiv throttles us."""
+        if response.status_code not in (429, 503):
+            return
+        retry_after = response.headers.get("retry-after", "")
+        pause = float(retry_after) if retry_after.isdigit() else 1 / self.bucket.rate
+        self.throttled += 1
+        self.bucket.pause(pause)
+        logger.warning(f"arXiv answered {response.status_code}, pausing all arXiv requests for {pause:.0f} s")
+
+    async def close(self):
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            await asyncio.gather(self._dispatcher, return_exceptions=True)
+        for *_, future in self._waiters:
+            future.cancel()
+        self._waiters.clear()
+        self.bucket.close()
+
+    def stats(self) -> dict:
+        return {
+            "granted": self.granted,
+            "rejected": self.rejected,
+            "throttled": self.throttled,
+            "queued": self.queue_length(),
+            "oldest_wait": self.oldest_wait()
+        }
+
+
+def create_arxiv_rate_limiter() -> Optional[ArxivRateLimiter]:
+    """The limiter for this process, or None when ``ARXIV_REQUEST_DELAY`` is 0."""
+    if REQUEST_INTERVAL <= 0:
+        return None
+    limiter = ArxivRateLimiter(SharedTokenBucket(RATE_LIMIT_FILE, 1 / REQUEST_INTERVAL, RATE_LIMIT_BURST))
+    # Registered per limiter, so the gauges follow the one the running app uses.
+    REGISTRY.register(Gauge("arxiv_rate_limit_queue_length", "arXiv requests waiting for the request budget.",
+                            limiter.queue_length))
+    REGISTRY.register(Gauge("arxiv_rate_limit_oldest_wait_seconds",
+                            "How long the longest waiting arXiv request has been queued.", limiter.oldest_wait,
+                            mode="max"))
+    return limiter
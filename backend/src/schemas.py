@@ -1,7 +1,7 @@
 from datetime import datetime
-from typing import List
+from typing import List, Optional
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 
 class QueryResponse(BaseModel):
@@ -18,14 +18,38 @@ class ResultResponse(BaseModel):
 
 
 class PaginatedResponse(BaseModel):
-    total: int
-    page: int
+    total: Optional[int]
+    page: Optional[int]
     items_per_page: int
-    items: List[QueryResponse] | List[ResultResponse]
+    next_cursor: Optional[str] = None
+    prev_cursor: Optional[str] = None
+
+
+class QueryPage(PaginatedResponse):
+    items: List[QueryResponse]
+
+
+class ResultPage(PaginatedResponse):
+    items: List[ResultResponse]
 
 
 class ArxivSearchParams(BaseModel):
     author: str = ""
     title: str = ""
     journal: str = ""
-    max_results: int = 100
+    max_results: int = Field(100, ge=1)
+
+
+class HarvestResponse(BaseModel):
+    query_id: int
+    state: str
+    harvested: int
+    target: int
+
+
+class JobResponse(BaseModel):
+    job_id: str
+    status: str
+    query_id: Optional[int] = None
+    num_results: Optional[int] = None
+    error: Optional[str] = None
@@ -0,0 +1,35 @@
+from sqlalchemy import Select, column, func, literal_column, select, table
+
+from .models import Paper
+
+# Only the columns ResultResponse renders.
+RESULT_COLUMNS = (Paper.title, Paper.authors.label("author"), Paper.journal)
+
+# FTS5 bm25 column weights, in the column order of papers_fts (title, authors, journal).
+SQLITE_WEIGHTS = (10.0, 5.0, 1.0)
+
+
+def fts5_query(terms: str) -> str:
+    """Quote every word so user input is matched literally instead of parsed as FTS5 syntax."""
+    return " ".join('"' + word.replace('"', '""') + '"' for word in terms.split())
+
+
+def search_results_statement(dialect: str, terms: str) -> Select:
+    """Rank stored papers against ``terms``, best match first.
+
+    Postgres matches the generated ``search_vector`` column with ``websearch_to_tsquery``;
+    SQLite matches the ``papers_fts`` table and ranks with ``bm25``.
+    """
+    if dialect == "postgresql":
+        vector = literal_column("papers.search_vector")
+        ts_query = func.websearch_to_tsquery(literal_column("'english'::regconfig"), terms)
+        return (select(*RESULT_COLUMNS)
+                .where(vector.op("@@")(ts_query))
+                .order_by(func.ts_rank_cd(vector, ts_query).desc(), Paper.id.desc()))
+
+    fts = table("papers_fts", column("rowid"))
+    fts_table = literal_column(fts.name)
+    return (select(*RESULT_COLUMNS)
+            .join(fts, fts.c.rowid == Paper.id)
+            .where(fts_table.op("MATCH")(fts5_query(terms)))
+            .order_by(func.bm25(fts_table, *SQLITE_WEIGHTS), Paper.id.desc()))
@@ -0,0 +1,110 @@
+"""Run the backend in production: one uvicorn worker per CPU, within one database connection budget.
+
+The schema is migrated once here, before the workers start, so their startup skips it.
+``DB_MAX_CONNECTIONS`` is split evenly across the workers: each pool keeps at most
+``DB_POOL_SIZE`` connections and overflows up to its share, so all workers together never
+hold more than the budget. Keep it below Postgres ``max_connections``, minus what bulk
+imports and other clients need. With ``DB_PGBOUNCER=true`` the workers keep no pool and
+PgBouncer enforces the limit instead. Workers share their metrics through
+``METRICS_MULTIPROC_DIR``, so ``/metrics`` reports the whole server, and keep background jobs in
+the database, so any worker can report on them. Run from the repository root::
+
+    python -m backend.src.serve [--workers 4] [--host 0.0.0.0] [--port 8000]
+"""
+import argparse
+import asyncio
+import logging
+import os
+import tempfile
+from pathlib import Path
+
+import uvicorn
+from dotenv import load_dotenv
+from sqlalchemy.exc import SQLAlchemyError
+
+# Before .database, which reads the connection budget and pool settings on import.
+load_dotenv()
+
+from .database import MAX_CONNECTIONS, PGBOUNCER, async_engine, split_connection_budget
+from .migrations import migrate
+
+logger = logging.getLogger(__name__)
+
+
+def available_cpus() -> int:
+    """CPUs this process may run on, which in a container can be fewer than the host has."""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+SERVER_WORKERS = int(os.getenv("BACKEND_WORKERS", str(available_cpus())))
+
+
+def worker_count(requested: int) -> int:
+    """At most one worker per connection of the budget, so every worker gets at least one."""
+    if MAX_CONNECTIONS <= 0 or PGBOUNCER or requested <= MAX_CONNECTIONS:
+        return max(requested, 1)
+    logger.warning(f"Starting {MAX_CONNECTIONS} workers instead of {requested}: "
+                   f"DB_MAX_CONNECTIONS={MAX_CONNECTIONS} cannot give each of them a connection")
+    return MAX_CONNECTIONS
+
+
+async def migrate_schema():
+    try:
+        async with async_engine.begin() as connection:
+            await connection.run_sync(migrate)
+    except SQLAlchemyError as e:
+        logger.error(f"Failed to migrate the database schema: {str(e)}")
+        raise
+    finally:
+        await async_engine.dispose()
+
+
+def prepare_metrics_directory():
+    """Give the workers an empty directory to share their metrics through, so /metrics reports all of them."""
+    directory = Path(os.environ.get("METRICS_MULTIPROC_DIR") or tempfile.mkdtemp(prefix="backend-metrics-"))
+    directory.mkdir(parents=True, exist_ok=True)
+    # Samples of an earlier run would otherwise be added to this one's.
+    for stale in directory.glob("*.json"):
+        stale.unlink()
+    os.environ["METRICS_MULTIPROC_DIR"] = str(directory)
+
+
+def share_job_state(workers: int):
+    """Keep jobs in the database, since a job can be polled on another worker than the one that queued it."""
+    backend = os.getenv("JOB_BACKEND", "memory").lower()
+    if backend != "database":
+        logger.warning(f"Using JOB_BACKEND=database instead of {backend}: "
+                       f"jobs kept in one worker's memory would be unknown to the other {workers - 1}")
+        os.environ["JOB_BACKEND"] = "database"
+
+
+def main(host: str, port: int, workers: int):
+    workers = worker_count(workers)
+    if PGBOUNCER:
+        logger.info(f"Starting {workers} workers without a connection pool, behind PgBouncer")
+    else:
+        pool_size, max_overflow = split_connection_budget(MAX_CONNECTIONS, workers)
+        logger.info(f"Starting {workers} workers, each with a pool of {pool_size} connections "
+                    f"and up to {max_overflow} more")
+
+    # Workers are fresh processes that read their pool share and startup settings from the environment.
+    os.environ["WEB_CONCURRENCY"] = str(workers)
+    if workers > 1:
+        asyncio.run(migrate_schema())
+        os.environ["DB_MIGRATE_ON_STARTUP"] = "false"
+        prepare_metrics_directory()
+        share_job_state(workers)
+    uvicorn.run(f"{__package__}.main:app", host=host, port=port, workers=workers)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level="INFO")
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default=os.getenv("BACKEND_API_HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("BACKEND_API_PORT", "8000")))
+    parser.add_argument("--workers", type=int, default=SERVER_WORKERS,
+                        help="Worker processes (BACKEND_WORKERS, one per CPU by default)")
+    arguments = parser.parse_args()
+    main(arguments.host, arguments.port, arguments.workers)
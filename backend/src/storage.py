@@ -0,0 +1,129 @@
+import os
+import time
+from contextlib import aclosing
+from typing import Sequence
+
+from httpx import Response
+from sqlalchemy import Insert, Table, insert, or_, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .atom import AtomEntry, AtomStreamParser, iter_entry_batches
+from .metrics import FEED_INSERT_SECONDS, FEED_PARSE_SECONDS
+from .models import ArxivQuery, Author, Paper, PaperAuthor, QueryResult
+
+INSERT_BATCH_SIZE = int(os.getenv("ARXIV_INSERT_BATCH_SIZE", "500"))
+
+QUERY_RESULT_COLUMNS = ("query_id", "rank", "paper_id")
+PAPER_COLUMNS = ("title", "authors", "journal")
+
+# Below this many rows a single executemany beats the COPY round trips on Postgres.
+COPY_THRESHOLD = 500
+
+
+async def insert_query(db: AsyncSession, **values) -> int:
+    return await db.scalar(insert(ArxivQuery).values(**values).returning(ArxivQuery.id))
+
+
+def dialect_insert(dialect: str, table: Table) -> Insert:
+    return postgresql.insert(table) if dialect == "postgresql" else sqlite.insert(table)
+
+
+def insert_ignoring_duplicates(dialect: str, table: Table, *keys: str) -> Insert:
+    return dialect_insert(dialect, table).on_conflict_do_nothing(index_elements=keys)
+
+
+def upsert_papers(dialect: str) -> Insert:
+    """Insert papers by arXiv id, refreshing title, authors and journal only when they changed."""
+    statement = dialect_insert(dialect, Paper.__table__)
+    columns = Paper.__table__.c
+    return statement.on_conflict_do_update(
+        index_elements=["arxiv_id"],
+        set_={column: statement.excluded[column] for column in PAPER_COLUMNS},
+        where=or_(*(columns[column].is_distinct_from(statement.excluded[column]) for column in PAPER_COLUMNS))
+    )
+
+
+def paper_row(entry: AtomEntry) -> dict:
+    return {"arxiv_id": entry.arxiv_id, "title": entry.title, "authors": ", ".join(entry.authors),
+            "journal": entry.journal_ref}
+
+
+def author_links(paper_ids: dict[str, int], author_ids: dict[str, int],
+                 authors_by_paper: dict[str, Sequence[str]]) -> list[dict]:
+    return [{"paper_id": paper_ids[arxiv_id], "position": position, "author_id": author_ids[name]}
+            for arxiv_id, names in authors_by_paper.items() for position, name in enumerate(names)]
+
+
+async def store_papers(db: AsyncSession, entries: Sequence[AtomEntry]) -> dict[str, int]:
+    """Upsert ``entries`` and their authors; returns the paper id of every arXiv id.
+
+    Every statement is idempotent, so storing a paper that another query already stored
+    only costs the lookups.
+    """
+    dialect = (await db.connection()).dialect.name
+    papers = {entry.arxiv_id: entry for entry in entries}
+    await db.execute(upsert_papers(dialect), [paper_row(entry) for entry in papers.values()])
+    paper_ids = dict((await db.execute(select(Paper.arxiv_id, Paper.id).where(Paper.arxiv_id.in_(papers)))).all())
+
+    names = {name for entry in papers.values() for name in entry.authors}
+    if names:
+        await db.execute(insert_ignoring_duplicates(dialect, Author.__table__, "name"),
+                         [{"name": name} for name in names])
+        author_ids = dict((await db.execute(select(Author.name, Author.id).where(Author.name.in_(names)))).all())
+        await db.execute(insert_ignoring_duplicates(dialect, PaperAuthor.__table__, "paper_id", "position"),
+                         author_links(paper_ids, author_ids,
+                                      {arxiv_id: entry.authors for arxiv_id, entry in papers.items()}))
+    return paper_ids
+
+
+async def insert_query_results(db: AsyncSession, rows: Sequence[dict]):
+    """Write query-to-paper links in the session's current transaction.
+
+    Uses ``COPY`` on asyncpg for large batches and one executemany everywhere else.
+    """
+    if not rows:
+        return
+    connection = await db.connection()
+    if connection.dialect.driver == "asyncpg" and len(rows) >= COPY_THRESHOLD:
+        raw_connection = await connection.get_raw_connection()
+        await raw_connection.driver_connection.copy_records_to_table(
+            QueryResult.__tablename__,
+            records=[tuple(row[column] for column in QUERY_RESULT_COLUMNS) for row in rows],
+            columns=QUERY_RESULT_COLUMNS
+        )
+    else:
+        await db.execute(insert(QueryResult), list(rows))
+
+
+async def store_entries(db: AsyncSession, query_id: int, first_rank: int, entries: Sequence[AtomEntry]):
+    paper_ids = await store_papers(db, entries)
+    await insert_query_results(db, [
+        {"query_id": query_id, "rank": first_rank + offset, "paper_id": paper_ids[entry.arxiv_id]}
+        for offset, entry in enumerate(entries)
+    ])
+
+
+async def store_feed(db: AsyncSession, query_id: int, response: Response, parser: AtomStreamParser,
+                     limit: int, start: int = 0) -> int:
+    """Stream up to ``limit`` entries of an arXiv response into ``query_id``; returns the entries written.
+
+    ``start`` is the arXiv offset of the response, so entries keep their overall rank.
+    Parse and insert time of the whole response are recorded once it is stored.
+    """
+    stored = 0
+    insert_seconds = 0.0
+    parse_seconds = parser.parse_seconds
+    batches = iter_entry_batches(response.aiter_bytes(), parser, INSERT_BATCH_SIZE)
+    async with aclosing(batches):
+        async for entries in batches:
+            entries = entries[:limit - stored]
+            insert_start = time.perf_counter()
+            await store_entries(db, query_id, start + stored, entries)
+            insert_seconds += time.perf_counter() - insert_start
+            stored += len(entries)
+            if stored >= limit:
+                break
+    FEED_PARSE_SECONDS.observe(parser.parse_seconds - parse_seconds)
+    FEED_INSERT_SECONDS.observe(insert_seconds)
+    return stored
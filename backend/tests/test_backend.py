@@ -1,24 +1,80 @@
+import asyncio
+import gzip
+import io
+import json
 import logging
 import os
+import socket
+import subprocess
+import sys
+import threading
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
 
+import feedparser
+import httpx
 import pytest
+from fastapi import BackgroundTasks, FastAPI
 from fastapi.testclient import TestClient
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, inspect, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
 
-from backend.src.api.arxiv import get_db
-from backend.src.database import Base
+from backend.src import bulk_import, database, harvest
+from backend.src.api.arxiv import arxiv_endpoint, get_arxiv_client, get_session_factory
+from backend.src.arxiv_client import open_arxiv_stream
+from backend.src.atom import AtomEntry, AtomStreamParser, parse_arxiv_id
+from backend.src.breaker import CircuitBreaker, CircuitBreakerTransport, CircuitOpen
+from backend.src.cache import CachedSearch, LRUCache, ResponseCache, SearchCache, search_key
+from backend.src.database import Base, async_connect_args_for, split_connection_budget
+from backend.src.jobs import DatabaseJobStore, JobQueue, MemoryJobStore, QueueFull
+from backend.src.migrations import LATEST_VERSION, current_version, migrate
 from backend.src.main import app
-from backend.src.models import ArxivQuery, ArxivResult
+from backend.src.metrics import RETRIES, Counter, Gauge, Histogram, Registry
+from backend.src.models import ArxivQuery, Author, BulkImport, Paper, PaperAuthor, QueryResult
+from backend.src.profiling import RequestProfilerMiddleware
+from backend.src.ratelimit import (PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE, ArxivRateLimiter, RateLimited,
+                                   SharedTokenBucket)
+from backend.src.schemas import ArxivSearchParams
+from backend.src.singleflight import SingleFlight
 
 # Set up logging
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
+DATA_DIR = Path(__file__).parent / "data"
+
 # Set up test database
 SQLALCHEMY_DATABASE_URL = "sqlite:///./test.db"
 engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+async_engine = create_async_engine("sqlite+aiosqlite:///./test.db", poolclass=NullPool)
+TestingAsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
+
+ATOM_ENTRY = """
+  <entry>
+    <id>http://arxiv.org/abs/{arxiv_id}v1</id>
+    <title>Paper {index}</title>
+    <author><name>Author {index}</name></author>
+    <author><name>Coauthor {index}</name></author>
+    <arxiv:journal_ref>Journal {index}</arxiv:journal_ref>
+  </entry>"""
+
+
+def make_feed(count: int, total: int | None = None, start: int = 0) -> bytes:
+    entries = "".join(ATOM_ENTRY.format(arxiv_id=f"2401.{index:05d}", index=index)
+                      for index in range(start, start + count))
+    return f"""<?xml version="1.0" encoding="UTF-8"?>
+<feed xmlns="http://www.w3.org/2005/Atom" xmlns:opensearch="http://a9.com/-/spec/opensearch/1.1/"
+      xmlns:arxiv="http://arxiv.org/schemas/atom">
+  <title type="html">ArXiv Query: search_query=au:test</title>
+  <opensearch:totalResults>{count if total is None else total}</opensearch:totalResults>
+  <opensearch:startIndex>0</opensearch:startIndex>
+  <opensearch:itemsPerPage>{count}</opensearch:itemsPerPage>{entries}
+</feed>""".encode()
 
 
 def remove_db_file():
@@ -57,11 +113,23 @@ def db_session():
 
 
 @pytest.fixture(scope="function")
-def client(db_session):
-    # noinspection PyUnresolvedReferences
-    app.dependency_overrides[get_db] = db_session
+def arxiv_feed():
+    return {"content": make_feed(3), "requests": []}
+
+
+@pytest.fixture(scope="function")
+def client(arxiv_feed):
+    def handler(request: httpx.Request):
+        arxiv_feed["requests"].append(request)
+        return httpx.Response(200, content=arxiv_feed["content"])
+
+    arxiv_client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    app.dependency_overrides[get_session_factory] = lambda: TestingAsyncSessionLocal
+    app.dependency_overrides[get_arxiv_client] = lambda: arxiv_client
     with TestClient(app) as c:
+        app.state.arxiv_client = arxiv_client
         yield c
+    app.dependency_overrides.clear()
 
 
 def test_create_arxiv_query(db_session):
@@ -80,15 +148,973 @@ def test_create_arxiv_result(db_session):
     db_session.add(query)
     db_session.commit()
 
-    result = ArxivResult(query_id=query.id, author="Test Author", title="Test Title", journal="Test Journal")
+    paper = Paper(arxiv_id="test/0000001", title="Test Title", authors="Test Author", journal="Test Journal")
+    result = QueryResult(query=query, rank=0, paper=paper)
     db_session.add(result)
     db_session.commit()
 
-    assert result.id is not None
+    assert paper.id is not None
     assert result.query_id == query.id
-    assert result.author == "Test Author"
-    assert result.title == "Test Title"
-    assert result.journal == "Test Journal"
+    assert query.results[0].paper.authors == "Test Author"
+    assert query.results[0].paper.title == "Test Title"
+    assert query.results[0].paper.journal == "Test Journal"
+
+
+@pytest.mark.asyncio
+async def test_open_arxiv_stream_retries_transient_errors():
+    calls = []
+
+    def handler(request: httpx.Request):
+        calls.append(request)
+        if len(calls) < 3:
+            return httpx.Response(503)
+        return httpx.Response(200, content=b"<feed/>")
+
+    async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+        retries = RETRIES.value("open_arxiv_stream")
+        open_stream = open_arxiv_stream.retry_with(wait=lambda _: 0)
+        response = await open_stream(client, "http://arxiv.test/api/query")
+        content = await response.aread()
+
+    assert content == b"<feed/>"
+    assert len(calls) == 3
+    assert RETRIES.value("open_arxiv_stream") == retries + 2
+
+
+@pytest.mark.asyncio
+async def test_open_arxiv_stream_reraises_after_last_attempt():
+    async with httpx.AsyncClient(transport=httpx.MockTransport(lambda _: httpx.Response(500))) as client:
+        open_stream = open_arxiv_stream.retry_with(wait=lambda _: 0)
+        with pytest.raises(httpx.HTTPStatusError):
+            await open_stream(client, "http://arxiv.test/api/query")
+
+
+@pytest.mark.asyncio
+async def test_open_arxiv_stream_fails_fast_on_client_errors():
+    calls = []
+
+    def handler(request: httpx.Request):
+        calls.append(request)
+        return httpx.Response(400)
+
+    async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+        retries = RETRIES.value("open_arxiv_stream")
+        open_stream = open_arxiv_stream.retry_with(wait=lambda _: 0)
+        with pytest.raises(httpx.HTTPStatusError):
+            await open_stream(client, "http://arxiv.test/api/query")
+
+    assert len(calls) == 1
+    assert RETRIES.value("open_arxiv_stream") == retries
+
+
+@pytest.mark.asyncio
+async def test_open_arxiv_stream_retries_throttling_and_connection_errors():
+    calls = []
+
+    def handler(request: httpx.Request):
+        calls.append(request)
+        if len(calls) == 1:
+            raise httpx.ConnectError("connection refused", request=request)
+        if len(calls) == 2:
+            return httpx.Response(429)
+        return httpx.Response(200, content=b"<feed/>")
+
+    async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+        open_stream = open_arxiv_stream.retry_with(wait=lambda _: 0)
+        response = await open_stream(client, "http://arxiv.test/api/query")
+        content = await response.aread()
+
+    assert content == b"<feed/>"
+    assert len(calls) == 3
+
+
+def test_arxiv_endpoint_stores_results(client, arxiv_feed, db_session):
+    response = client.post("/arxiv", json={"author": "test"})
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["num_results"] == 3
+    assert len(arxiv_feed["requests"]) == 1
+    stored = db_session.get(ArxivQuery, body["query_id"]).results
+    assert [result.paper.title for result in stored] == ["Paper 0", "Paper 1", "Paper 2"]
+    assert stored[0].paper.authors == "Author 0, Coauthor 0"
+    assert [link.author.name for link in stored[0].paper.author_links] == ["Author 0", "Coauthor 0"]
+
+
+def test_short_feed_counts_only_the_results_it_stored(client, arxiv_feed, db_session):
+    arxiv_feed["content"] = make_feed(3, total=50)
+    body = client.post("/arxiv", json={"author": "Short Feed", "max_results": 20}).json()
+
+    assert body["num_results"] == 3
+    results = client.get(f"/queries/{body['query_id']}/results", params={"items_per_page": 2}).json()
+    assert results["total"] == 3
+    last_page = client.get(f"/queries/{body['query_id']}/results", params={"page": 1, "items_per_page": 2}).json()
+    assert [item["title"] for item in last_page["items"]] == ["Paper 2"]
+    assert db_session.get(ArxivQuery, body["query_id"]).num_results == 3
+
+
+def test_overlapping_searches_share_papers_and_authors(client, arxiv_feed, db_session):
+    arxiv_feed["content"] = make_feed(4, start=900)
+    first = client.post("/arxiv", json={"author": "Overlap One"}).json()["query_id"]
+    arxiv_feed["content"] = make_feed(4, start=902)
+    second = client.post("/arxiv", json={"author": "Overlap Two"}).json()["query_id"]
+
+    papers = db_session.scalars(select(Paper).where(Paper.arxiv_id.like("2401.009%"))).all()
+    authors = db_session.scalars(select(Author.name).where(Author.name.like("% 90_"))).all()
+    assert len(papers) == 6
+    assert len(authors) == 12
+    assert [result.rank for result in db_session.get(ArxivQuery, second).results] == [0, 1, 2, 3]
+    shared = {result.paper_id for result in db_session.get(ArxivQuery, first).results} & \
+        {result.paper_id for result in db_session.get(ArxivQuery, second).results}
+    assert len(shared) == 2
+    assert db_session.query(PaperAuthor).filter(PaperAuthor.paper_id.in_(shared)).count() == 4
+
+
+def test_arxiv_endpoint_returns_first_page_in_one_round_trip(client, arxiv_feed):
+    arxiv_feed["content"] = make_feed(3, start=500)
+    params = {"results_per_page": 2}
+
+    body = client.post("/arxiv", params=params, json={"author": "One Trip"}).json()
+    assert body["num_results"] == 3
+    assert [item["title"] for item in body["results"]["items"]] == ["Paper 500", "Paper 501"]
+    assert body["results"] == client.get(f"/queries/{body['query_id']}/results", params={"items_per_page": 2}).json()
+
+    cached = client.post("/arxiv", params=params, json={"author": "one trip"}).json()
+    assert cached["message"] == "Query results served from cache"
+    assert cached["results"] == body["results"]
+    assert "results" not in client.post("/arxiv", json={"author": "one trip"}).json()
+
+
+def test_arxiv_endpoint_requires_a_search_field(client):
+    assert client.post("/arxiv", json={}).status_code == 400
+
+
+def test_results_endpoint_serves_latest_query(client):
+    query_id = client.post("/arxiv", json={"title": "paper"}).json()["query_id"]
+
+    response = client.get("/results", params={"page": 0})
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["total"] == 3
+    assert {item["title"] for item in body["items"]} == {"Paper 0", "Paper 1", "Paper 2"}
+    assert query_id is not None
+
+
+def test_queries_endpoint_filters_by_time_range(client):
+    client.post("/arxiv", json={"journal": "journal"})
+    start = datetime.now(timezone.utc) - timedelta(days=1)
+
+    response = client.get("/queries", params={"query_start_time": start.isoformat(), "include_total": True})
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["total"] >= 1
+    assert body["items"][0]["status"] == 200
+    assert client.get("/queries", params={"query_start_time": start.isoformat()}).json()["total"] is None
+
+    future = datetime.now(timezone.utc) + timedelta(days=1)
+    assert client.get("/queries", params={"query_start_time": future.isoformat(),
+                                          "include_total": True}).json()["total"] == 0
+
+
+def test_search_key_normalizes_params():
+    assert search_key(ArxivSearchParams(author="  Albert   EINSTEIN ")) == search_key(
+        ArxivSearchParams(author="albert einstein"))
+    assert search_key(ArxivSearchParams(author="einstein")) != search_key(ArxivSearchParams(title="einstein"))
+
+
+def test_lru_cache_evicts_least_recently_used_and_expires():
+    cache = LRUCache(max_entries=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.stats()["evictions"] == 1
+
+    expiring = LRUCache(max_entries=2, ttl=-1)
+    expiring.set("a", 1)
+    assert expiring.get("a") is None
+
+
+def test_arxiv_endpoint_serves_repeated_search_from_cache(client, arxiv_feed):
+    first = client.post("/arxiv", json={"author": "Cached Author"}).json()
+    second = client.post("/arxiv", json={"author": " cached author "}).json()
+
+    assert second["query_id"] == first["query_id"]
+    assert len(arxiv_feed["requests"]) == 1
+    assert client.get("/cache").json()["search"]["hits"] == 1
+
+
+@pytest.mark.asyncio
+async def test_shared_search_cache_reads_queries_stored_by_other_workers():
+    key = search_key(ArxivSearchParams(title="shared"))
+    async with TestingAsyncSessionLocal() as db:
+        query = ArxivQuery(query="shared", search_key=key, status=200, num_results=7)
+        db.add(query)
+        await db.commit()
+
+        cached = await SearchCache(max_entries=8, ttl=60, shared=True).get(db, key)
+        assert cached == CachedSearch(query.id, 7)
+        assert await SearchCache(max_entries=8, ttl=60).get(db, key) is None
+
+
+@pytest.mark.asyncio
+async def test_single_flight_shares_one_execution():
+    flights = SingleFlight()
+    calls = []
+
+    async def work():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return len(calls)
+
+    results = await asyncio.gather(*(flights.do("key", work) for _ in range(5)))
+
+    assert results == [1] * 5
+    assert flights.stats() == {"in_flight": 0, "started": 1, "coalesced": 4}
+
+
+@pytest.mark.asyncio
+async def test_concurrent_identical_searches_are_coalesced():
+    requests = []
+
+    async def handler(request: httpx.Request):
+        requests.append(request)
+        await asyncio.sleep(0.05)
+        return httpx.Response(200, content=make_feed(2))
+
+    cache = SearchCache(max_entries=8, ttl=60)
+    flights = SingleFlight()
+    async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as arxiv_client:
+        async with TestingAsyncSessionLocal() as db:
+            responses = await asyncio.gather(*(
+                arxiv_endpoint(ArxivSearchParams(author="Popular"), mode="sync", results_per_page=None, db=db,
+                               session_factory=TestingAsyncSessionLocal, client=arxiv_client, cache=cache,
+                               pages=ResponseCache(max_entries=8, ttl=60), flights=flights, jobs=None,
+                               breaker=CircuitBreaker(), background_tasks=BackgroundTasks())
+                for _ in range(5)
+            ))
+
+    assert len(requests) == 1
+    assert len({response["query_id"] for response in responses}) == 1
+    assert flights.coalesced == 4
+
+
+@pytest.mark.asyncio
+async def test_searches_coalesced_behind_a_healthy_circuit_get_fresh_results():
+    async def handler(request: httpx.Request):
+        await asyncio.sleep(0.05)
+        return httpx.Response(200, content=make_feed(2))
+
+    flights = SingleFlight()
+    async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as arxiv_client:
+        async def search():
+            async with TestingAsyncSessionLocal() as db:
+                return await arxiv_endpoint(
+                    ArxivSearchParams(author="Refreshed"), mode="sync", results_per_page=None, db=db,
+                    session_factory=TestingAsyncSessionLocal, client=arxiv_client,
+                    cache=SearchCache(max_entries=8, ttl=60), pages=ResponseCache(max_entries=8, ttl=60),
+                    flights=flights, jobs=None, breaker=CircuitBreaker(), background_tasks=BackgroundTasks())
+
+        stored = await search()
+        responses = await asyncio.gather(search(), search())
+
+    assert all("stale" not in response for response in responses)
+    query_ids = {response["query_id"] for response in responses}
+    assert len(query_ids) == 1 and stored["query_id"] not in query_ids
+    assert flights.coalesced == 1
+
+
+@pytest.mark.asyncio
+async def test_circuit_breaker_fails_fast_until_a_trial_request_succeeds():
+    calls = []
+
+    def handler(request: httpx.Request):
+        calls.append(request)
+        if len(calls) <= 2:
+            raise httpx.ConnectTimeout("arXiv is down", request=request)
+        return httpx.Response(200)
+
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+    transport = CircuitBreakerTransport(httpx.MockTransport(handler), breaker)
+    async with httpx.AsyncClient(transport=transport, event_hooks={"request": [breaker.on_request]}) as arxiv_client:
+        for _ in range(2):
+            with pytest.raises(httpx.ConnectTimeout):
+                await arxiv_client.get("http://arxiv.test/api/query")
+        with pytest.raises(CircuitOpen):
+            await arxiv_client.get("http://arxiv.test/api/query")
+        assert (breaker.state, len(calls)) == ("open", 2)
+
+        await asyncio.sleep(0.06)
+        assert breaker.state == "half_open"
+        assert (await arxiv_client.get("http://arxiv.test/api/query")).status_code == 200
+    assert breaker.stats()["state"] == "closed"
+    assert breaker.rejected == 1
+
+
+def test_open_circuit_serves_the_stored_search_as_stale(client, arxiv_feed):
+    fresh = client.post("/arxiv", json={"author": "Outage"}).json()
+    app.state.search_cache.local.clear()
+    breaker = app.state.arxiv_breaker
+    for _ in range(breaker.failure_threshold):
+        breaker.record_failure()
+
+    response = client.post("/arxiv", params={"results_per_page": 2}, json={"author": "Outage"})
+    body = response.json()
+    assert body["stale"] is True and body["query_id"] == fresh["query_id"]
+    assert len(body["results"]["items"]) == 2
+    assert len(arxiv_feed["requests"]) == 1
+
+    unknown = client.post("/arxiv", json={"author": "Never searched"})
+    assert unknown.status_code == 503 and int(unknown.headers["retry-after"]) >= 1
+    assert len(arxiv_feed["requests"]) == 1
+    breaker.record_success()
+
+
+def test_parse_arxiv_id_strips_prefix_and_version():
+    assert parse_arxiv_id("http://arxiv.org/abs/2106.01234v2") == "2106.01234"
+    assert parse_arxiv_id("http://arxiv.org/abs/physics/0503066v1") == "physics/0503066"
+
+
+@pytest.mark.parametrize("feed_name", ["arxiv_feed.xml", "synthetic"])
+@pytest.mark.parametrize("chunk_size", [1, 64, 1 << 20])
+def test_atom_stream_parser_matches_feedparser(feed_name, chunk_size):
+    content = make_feed(25) if feed_name == "synthetic" else (DATA_DIR / feed_name).read_bytes()
+    parser = AtomStreamParser()
+    entries = []
+    for offset in range(0, len(content), chunk_size):
+        entries.extend(parser.feed(content[offset:offset + chunk_size]))
+    entries.extend(parser.close())
+
+    expected = feedparser.parse(content)
+    assert parser.total_results == int(expected.feed.opensearch_totalresults)
+    assert [(entry.arxiv_id, entry.title, list(entry.authors), entry.journal_ref) for entry in entries] == [
+        (parse_arxiv_id(entry.id), entry.title, [author.name for author in entry.authors],
+         entry.get("arxiv_journal_ref", ""))
+        for entry in expected.entries
+    ]
+
+
+def paged_arxiv_handler(total: int, fail_at: int | None = None):
+    requests = []
+
+    def handler(request: httpx.Request):
+        start = int(request.url.params["start"])
+        requests.append(start)
+        if start == fail_at:
+            return httpx.Response(400)
+        count = max(0, min(int(request.url.params["max_results"]), total - start))
+        return httpx.Response(200, content=make_feed(count, total=total, start=start))
+
+    return handler, requests
+
+
+@pytest.mark.asyncio
+async def test_harvest_pages_through_windows_and_resumes(monkeypatch):
+    monkeypatch.setattr(harvest, "HARVEST_PAGE_SIZE", 10)
+    monkeypatch.setattr(harvest, "open_arxiv_stream", open_arxiv_stream.retry_with(wait=lambda _: 0))
+    query = await harvest.start_harvest(TestingAsyncSessionLocal, "au:harvest", 1000)
+
+    failing, _ = paged_arxiv_handler(total=35, fail_at=20)
+    async with httpx.AsyncClient(transport=httpx.MockTransport(failing)) as client:
+        await harvest.run_harvest(query.id, TestingAsyncSessionLocal, client)
+
+    async with TestingAsyncSessionLocal() as db:
+        failed = await db.get(ArxivQuery, query.id)
+    assert (failed.harvest_state, failed.harvest_next_start, failed.harvest_target) == ("failed", 20, 35)
+
+    handler, requests = paged_arxiv_handler(total=35)
+    async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+        await harvest.run_harvest(query.id, TestingAsyncSessionLocal, client)
+
+    assert requests == [20, 30]
+    async with TestingAsyncSessionLocal() as db:
+        done = await db.get(ArxivQuery, query.id)
+        titles = (await db.scalars(select(Paper.title).join(QueryResult).where(QueryResult.query_id == query.id)
+                                   .order_by(QueryResult.rank))).all()
+    assert (done.harvest_state, done.harvest_next_start, done.num_results) == ("complete", 35, 35)
+    assert titles == [f"Paper {index}" for index in range(35)]
+
+
+@pytest.mark.asyncio
+async def test_bulk_import_resumes_after_the_last_committed_chunk(tmp_path, monkeypatch):
+    dump = tmp_path / "snapshot.json.gz"
+    with gzip.open(dump, "wt") as lines:
+        for index in range(7):
+            lines.write(json.dumps({"id": f"2402.{index:05d}", "title": f"Imported  paper {index}",
+                                    "authors": "ignored", "authors_parsed": [["Keyname", f"First {index}", ""]],
+                                    "journal-ref": None}) + "\n")
+        lines.write("not json\n")
+
+    store_chunk, calls = bulk_import.store_chunk, []
+
+    async def failing_store_chunk(*args):
+        calls.append(args)
+        if len(calls) == 3:
+            raise RuntimeError("connection lost")
+        await store_chunk(*args)
+
+    monkeypatch.setattr(bulk_import, "store_chunk", failing_store_chunk)
+    with pytest.raises(RuntimeError):
+        await bulk_import.import_dump(dump, TestingAsyncSessionLocal, workers=1, chunk_size=2)
+    async with TestingAsyncSessionLocal() as db:
+        failed = await db.scalar(select(BulkImport).where(BulkImport.source == bulk_import.dump_source(dump)))
+    assert (failed.state, failed.position, failed.stored) == ("failed", 4, 4)
+
+    monkeypatch.setattr(bulk_import, "store_chunk", store_chunk)
+    progress = await bulk_import.import_dump(dump, TestingAsyncSessionLocal, workers=1, chunk_size=2)
+    assert (progress.state, progress.position, progress.stored) == ("complete", 8, 7)
+    async with TestingAsyncSessionLocal() as db:
+        rows = (await db.execute(select(Paper.title, Paper.authors).join(QueryResult)
+                                 .where(QueryResult.query_id == progress.query_id).order_by(QueryResult.rank))).all()
+        query = await db.get(ArxivQuery, progress.query_id)
+    assert rows == [(f"Imported paper {index}", f"First {index} Keyname") for index in range(7)]
+    assert query.num_results == 7
+
+
+def test_bulk_import_parses_oai_records():
+    records = [
+        b'<record><header><identifier>oai:arXiv.org:0704.0001</identifier></header><metadata>'
+        b'<arXiv xmlns="http://arxiv.org/OAI/arXiv/"><id>0704.0001</id><title>Calculation of\n  spectra</title>'
+        b'<authors><author><keyname>Bal\xc3\xa1zs</keyname><forenames>C.</forenames></author></authors>'
+        b'<journal-ref>Phys.Rev.D76:013009,2007</journal-ref></arXiv></metadata></record>',
+        b'<record><header status="deleted"><identifier>oai:arXiv.org:0704.0002</identifier></header></record>',
+        b'<record><header><identifier>oai:arXiv.org:0704.0003</identifier></header><metadata>'
+        b'<oai_dc:dc><dc:title>A dc record</dc:title><dc:creator>Pan, Hongjun</dc:creator>'
+        b'<dc:identifier>http://arxiv.org/abs/0704.0003v2</dc:identifier></oai_dc:dc></metadata></record>'
+    ]
+    dump = b"<OAI-PMH><ListRecords>" + b"".join(records) + b"</ListRecords></OAI-PMH>"
+    raw = list(bulk_import.iter_records(io.BytesIO(dump), bulk_import.FORMAT_OAI))
+
+    assert bulk_import.parse_chunk(bulk_import.FORMAT_OAI, raw) == [
+        AtomEntry("0704.0001", "Calculation of spectra", ("C. Balázs",), "Phys.Rev.D76:013009,2007"),
+        AtomEntry("0704.0003", "A dc record", ("Hongjun Pan",), "")
+    ]
+
+
+def test_oai_record_buffer_stays_bounded_between_records(monkeypatch):
+    record = (b'<record><header><identifier>oai:arXiv.org:0704.0001</identifier></header>'
+              b'<metadata><arXiv><id>0704.0001</id></arXiv></metadata></record>')
+    page = b"<OAI-PMH><ListRecords>" + record + b"<resumptionToken>next</resumptionToken></ListRecords></OAI-PMH>"
+    # Small blocks cut tags in half at every boundary.
+    monkeypatch.setattr(bulk_import, "READ_SIZE", 7)
+    assert list(bulk_import.iter_records(io.BytesIO(page * 3), bulk_import.FORMAT_OAI)) == [record] * 3
+
+    monkeypatch.setattr(bulk_import, "READ_SIZE", 100)
+    monkeypatch.setattr(bulk_import, "OAI_MAX_RECORD_SIZE", 1000)
+    unclosed = b"<record><header>" + b"<setSpec>physics</setSpec>" * 100
+    assert list(bulk_import.iter_records(io.BytesIO(unclosed + record), bulk_import.FORMAT_OAI)) == [record]
+
+    monkeypatch.setattr(bulk_import, "READ_SIZE", 64 * 1024)
+    no_records = io.BytesIO(b"<OAI-PMH><ListRecords>" + b"<about>nothing to import</about>" * 400_000)
+    tracemalloc.start()
+    try:
+        assert list(bulk_import.iter_records(no_records, bulk_import.FORMAT_OAI)) == []
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    assert peak < 1024 * 1024
+
+
+def test_harvest_endpoint_reports_progress(client, arxiv_feed, monkeypatch):
+    arxiv_feed["content"] = make_feed(3, total=3)
+
+    started = client.post("/arxiv/harvest", json={"author": "harvest", "max_results": 5000})
+
+    assert started.status_code == 202
+    progress = client.get(f"/arxiv/harvest/{started.json()['query_id']}").json()
+    assert progress["state"] == "complete"
+    assert progress["harvested"] == 3
+    assert client.get("/arxiv/harvest/999999").status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_only_one_of_concurrent_harvest_claims_wins(monkeypatch):
+    query = await harvest.start_harvest(TestingAsyncSessionLocal, "au:claimed", 100)
+    assert not await harvest.claim_harvest(TestingAsyncSessionLocal, query.id)
+
+    await harvest.set_harvest_state(TestingAsyncSessionLocal, query.id, "failed")
+    claims = await asyncio.gather(*(harvest.claim_harvest(TestingAsyncSessionLocal, query.id) for _ in range(4)))
+    assert sorted(claims) == [False, False, False, True]
+
+    # A running harvest whose worker stopped committing windows can be taken over.
+    monkeypatch.setattr(harvest, "HARVEST_STALE_AFTER", -1)
+    assert await harvest.claim_harvest(TestingAsyncSessionLocal, query.id)
+    assert not await harvest.claim_harvest(TestingAsyncSessionLocal, 999999)
+
+
+def test_resuming_a_running_harvest_conflicts(client, arxiv_feed):
+    arxiv_feed["content"] = make_feed(3, total=3)
+    query_id = client.post("/arxiv/harvest", json={"author": "resumed", "max_results": 50}).json()["query_id"]
+    assert client.post(f"/arxiv/harvest/{query_id}/resume").json()["state"] == "complete"
+    assert len(arxiv_feed["requests"]) == 1
+
+    asyncio.run(harvest.set_harvest_state(TestingAsyncSessionLocal, query_id, "running"))
+    conflict = client.post(f"/arxiv/harvest/{query_id}/resume")
+    assert conflict.status_code == 409
+
+    asyncio.run(harvest.set_harvest_state(TestingAsyncSessionLocal, query_id, "failed"))
+    resumed = client.post(f"/arxiv/harvest/{query_id}/resume")
+    assert resumed.status_code == 202 and resumed.json()["state"] == "running"
+    assert client.get(f"/arxiv/harvest/{query_id}").json()["state"] == "complete"
+    assert client.post("/arxiv/harvest/999999/resume").status_code == 404
+
+
+def test_arxiv_endpoint_async_mode_returns_job(client, arxiv_feed):
+    response = client.post("/arxiv", params={"mode": "async"}, json={"author": "Queued Author"})
+
+    assert response.status_code == 202
+    job_url = response.headers["location"]
+    for _ in range(50):
+        job = client.get(job_url).json()
+        if job["status"] == "succeeded":
+            break
+    assert job["status"] == "succeeded"
+    assert job["num_results"] == 3
+    assert client.get("/arxiv/jobs/unknown").status_code == 404
+
+
+def test_shared_token_bucket_spends_one_budget_across_instances(tmp_path):
+    first = SharedTokenBucket(tmp_path / "bucket", rate=0.5, burst=1)
+    second = SharedTokenBucket(tmp_path / "bucket", rate=0.5, burst=1)
+
+    assert first.take(PRIORITY_INTERACTIVE) == 0
+    assert 1.5 < second.take(PRIORITY_INTERACTIVE) <= 2
+    # An interactive request is waiting, so background work stands back even once a token is due.
+    assert second.take(PRIORITY_BACKGROUND) > second.take(PRIORITY_INTERACTIVE)
+    first.close()
+    second.close()
+
+
+@pytest.mark.asyncio
+async def test_rate_limiter_serves_interactive_requests_first(tmp_path):
+    limiter = ArxivRateLimiter(SharedTokenBucket(tmp_path / "bucket", rate=20, burst=1), max_wait=0.2)
+    await limiter.acquire(PRIORITY_BACKGROUND)
+    granted = []
+
+    async def request(name: str, priority: int):
+        await limiter.acquire(priority)
+        granted.append(name)
+
+    background = [asyncio.create_task(request(f"background {index}", PRIORITY_BACKGROUND)) for index in range(2)]
+    await asyncio.sleep(0)
+    interactive = asyncio.create_task(request("interactive", PRIORITY_INTERACTIVE))
+    await asyncio.gather(interactive, *background)
+    assert granted == ["interactive", "background 0", "background 1"]
+
+    blocked = [asyncio.create_task(limiter.acquire(PRIORITY_INTERACTIVE)) for _ in range(5)]
+    await asyncio.sleep(0)
+    with pytest.raises(RateLimited):
+        await limiter.acquire(PRIORITY_INTERACTIVE)
+    await asyncio.gather(*blocked)
+
+    await limiter.on_response(httpx.Response(429, headers={"Retry-After": "30"}))
+    assert limiter.bucket.take(PRIORITY_INTERACTIVE) > 29
+    assert limiter.stats()["throttled"] == 1
+    await limiter.close()
+
+
+@pytest.mark.asyncio
+async def test_job_queue_rejects_when_full():
+    release = asyncio.Event()
+
+    async def handler(params):
+        await release.wait()
+        return CachedSearch(1, 1)
+
+    jobs = JobQueue(MemoryJobStore(max_jobs=10), handler, workers=1, max_depth=1)
+    await jobs.start()
+    try:
+        first = await jobs.submit(ArxivSearchParams(author="a"))
+        await asyncio.sleep(0)
+        await jobs.submit(ArxivSearchParams(author="b"))
+        with pytest.raises(QueueFull):
+            await jobs.submit(ArxivSearchParams(author="c"))
+
+        release.set()
+        await asyncio.sleep(0.01)
+        assert (await jobs.get(first))["status"] == "succeeded"
+        assert jobs.stats()["rejected"] == 1
+    finally:
+        await jobs.stop()
+
+
+@pytest.mark.asyncio
+async def test_memory_job_store_never_forgets_unfinished_jobs():
+    release = asyncio.Event()
+
+    async def handler(params: ArxivSearchParams) -> CachedSearch:
+        await release.wait()
+        return CachedSearch(1, 1)
+
+    jobs = JobQueue(MemoryJobStore(max_jobs=2), handler, workers=1, max_depth=10)
+    await jobs.start()
+    try:
+        burst = [await jobs.submit(ArxivSearchParams(author=name)) for name in ("a", "b")]
+        await asyncio.sleep(0.01)
+        with pytest.raises(QueueFull):
+            await jobs.submit(ArxivSearchParams(author="c"))
+        assert [(await jobs.get(job_id))["status"] for job_id in burst] == ["running", "queued"]
+
+        release.set()
+        await asyncio.sleep(0.01)
+        later = await jobs.submit(ArxivSearchParams(author="d"))
+        assert await jobs.get(burst[0]) is None
+        assert (await jobs.get(burst[1]))["status"] == "succeeded"
+        assert (await jobs.get(later)) is not None
+        assert jobs.stats()["rejected"] == 1
+    finally:
+        await jobs.stop()
+
+
+@pytest.mark.asyncio
+async def test_database_job_store_claims_once_and_recovers_queued_jobs():
+    store = DatabaseJobStore(TestingAsyncSessionLocal, stale_after=600)
+    await store.add("durable-1", ArxivSearchParams(author="durable"))
+    await store.add("durable-2", ArxivSearchParams(title="durable"))
+
+    assert await store.claim("durable-1")
+    assert not await store.claim("durable-1")
+    recovered = dict(await store.recover())
+    assert "durable-1" not in recovered
+    assert recovered["durable-2"].title == "durable"
+
+
+def free_port() -> int:
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+@pytest.fixture
+def arxiv_server():
+    class FeedHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            content = make_feed(3)
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FeedHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/api/query"
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.mark.asyncio
+async def test_jobs_can_be_polled_on_any_worker(tmp_path, arxiv_server):
+    port = free_port()
+    environment = {**os.environ, "DATABASE_URL": f"sqlite:///{tmp_path / 'workers.db'}", "JOB_BACKEND": "memory",
+                   "ARXIV_API_URL": arxiv_server, "ARXIV_REQUEST_DELAY": "0",
+                   "ARXIV_RATE_LIMIT_FILE": str(tmp_path / "rate-limit"), "DB_MAX_CONNECTIONS": "0",
+                   "METRICS_MULTIPROC_DIR": str(tmp_path / "metrics")}
+    server = subprocess.Popen([sys.executable, "-m", "backend.src.serve", "--host", "127.0.0.1", "--port", str(port),
+                               "--workers", "2"], env=environment)
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        async with httpx.AsyncClient(base_url=base_url) as api:
+            for _ in range(300):
+                try:
+                    if (await api.get("/arxiv/jobs")).status_code == 200:
+                        break
+                except httpx.TransportError:
+                    pass
+                await asyncio.sleep(0.1)
+            queued = await api.post("/arxiv", params={"mode": "async"}, json={"author": "workers"})
+        assert queued.status_code == 202
+
+        async def poll():
+            # A connection of its own, so the polls are spread over both workers.
+            async with httpx.AsyncClient(base_url=base_url) as poller:
+                return await poller.get(queued.headers["location"])
+
+        for _ in range(50):
+            polls = await asyncio.gather(*(poll() for _ in range(8)))
+            assert [response.status_code for response in polls] == [200] * len(polls)
+            if all(response.json()["status"] == "succeeded" for response in polls):
+                break
+            await asyncio.sleep(0.1)
+        assert polls[0].json()["num_results"] == 3
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+
+def collect_pages(client, path, params, direction="next_cursor"):
+    pages = []
+    body = client.get(path, params=params).json()
+    pages.append(body)
+    while body[direction]:
+        body = client.get(path, params={**params, "cursor": body[direction]}).json()
+        pages.append(body)
+    return pages
+
+
+def test_results_cursor_pagination_walks_forward_and_back(client, arxiv_feed):
+    arxiv_feed["content"] = make_feed(25)
+    client.post("/arxiv", json={"author": "Cursor Author"})
+
+    pages = collect_pages(client, "/results", {"items_per_page": 10})
+    titles = [item["title"] for page in pages for item in page["items"]]
+
+    assert [len(page["items"]) for page in pages] == [10, 10, 5]
+    assert sorted(titles) == sorted(f"Paper {index}" for index in range(25))
+    assert pages[0]["prev_cursor"] is None
+
+    back = client.get("/results", params={"items_per_page": 10, "cursor": pages[2]["prev_cursor"]}).json()
+    assert back["items"] == pages[1]["items"]
+    assert client.get("/results", params={"page": 2}).json()["items"] == pages[2]["items"][:10]
+
+
+def test_queries_cursor_pagination_has_no_page_ceiling(client, arxiv_feed):
+    start = datetime.now(timezone.utc)
+    for index in range(12):
+        client.post("/arxiv", json={"title": f"Ceiling {index}"})
+
+    params = {"query_start_time": start.isoformat(), "items_per_page": 1}
+    pages = collect_pages(client, "/queries", params)
+
+    assert len(pages) == 12
+    assert all(page["total"] is None for page in pages)
+    assert client.get("/queries", params={**params, "page": 11}).json()["items"] == pages[11]["items"]
+    assert client.get("/queries", params={**params, "cursor": "not-a-cursor"}).status_code == 400
+
+
+def test_results_search_ranks_stored_results(client, arxiv_feed):
+    arxiv_feed["content"] = make_feed(3).replace(b"Paper 1<", b"Quantum Paper 1<").replace(
+        b"Journal 2<", b"Quantum Letters 2<")
+    client.post("/arxiv", json={"author": "Full Text Author"})
+
+    body = client.get("/results/search", params={"q": "quantum"}).json()
+    assert [item["title"] for item in body["items"]][:2] == ["Quantum Paper 1", "Paper 2"]
+    assert client.get("/results/search", params={"q": 'quantum "paper 1" OR'}).status_code == 200
+    assert client.get("/results/search", params={"q": "   "}).status_code == 400
+
+
+def test_query_results_are_addressable_and_cacheable(client, arxiv_feed):
+    arxiv_feed["content"] = make_feed(3, start=700)
+    query_id = client.post("/arxiv", json={"author": "Addressed"}).json()["query_id"]
+    arxiv_feed["content"] = make_feed(2, start=800)
+    client.post("/arxiv", json={"author": "Someone Else"})
+
+    response = client.get(f"/queries/{query_id}/results", params={"items_per_page": 2})
+    assert [item["title"] for item in response.json()["items"]] == ["Paper 700", "Paper 701"]
+    assert "immutable" in response.headers["cache-control"]
+    assert client.get("/results", params={"query_id": query_id, "items_per_page": 2}).json() == response.json()
+
+    revalidated = client.get(f"/queries/{query_id}/results", params={"items_per_page": 2},
+                             headers={"If-None-Match": response.headers["etag"]})
+    assert revalidated.status_code == 304
+    assert revalidated.headers["etag"] == response.headers["etag"]
+
+    assert client.get("/results").headers["cache-control"] == "no-cache"
+    assert client.get("/queries/999999/results").status_code == 404
+    other_cursor = client.get("/results", params={"items_per_page": 1}).json()["next_cursor"]
+    assert client.get(f"/queries/{query_id}/results", params={"cursor": other_cursor}).status_code == 400
+
+
+def test_response_cache_serves_hot_pages_until_a_query_is_committed(client, arxiv_feed):
+    pages = app.state.response_cache
+    arxiv_feed["content"] = make_feed(2, start=600)
+    query_id = client.post("/arxiv", json={"author": "Hot Page"}).json()["query_id"]
+    params = {"query_start_time": (datetime.now(timezone.utc) - timedelta(days=1)).isoformat(), "include_total": True}
+
+    first = client.get("/queries", params=params).json()
+    client.get(f"/queries/{query_id}/results")
+    hits = pages.hits
+    assert client.get("/queries", params=params).json() == first
+    assert client.get(f"/queries/{query_id}/results").status_code == 200
+    assert pages.hits == hits + 2
+
+    arxiv_feed["content"] = make_feed(1, start=650)
+    client.post("/arxiv", json={"author": "Hot Page Writer"})
+    assert client.get("/queries", params=params).json()["total"] == first["total"] + 1
+    assert client.get(f"/queries/{query_id}/results").status_code == 200
+    assert pages.hits == hits + 3
+    assert client.get("/cache").json()["responses"]["invalidations"] >= 2
+
+
+def test_response_cache_drops_pages_read_before_an_invalidation():
+    pages = ResponseCache(max_entries=2, ttl=60)
+    generation = pages.generation
+    pages.invalidate()
+    pages.set("stale", "page", pinned=False, generation=generation)
+    pages.set("pinned", "page", pinned=True, generation=generation)
+
+    assert pages.get("stale") is None
+    assert pages.get("pinned") == "page"
+
+
+def test_read_endpoints_document_concrete_page_models(client):
+    paths = client.get("/openapi.json").json()["paths"]
+
+    def schema(path):
+        return paths[path]["get"]["responses"]["200"]["content"]["application/json"]["schema"]["$ref"]
+
+    assert schema("/queries").endswith("/QueryPage")
+    assert schema("/results").endswith("/ResultPage")
+    assert schema("/results/search").endswith("/ResultPage")
+
+
+def test_metrics_endpoint_exposes_hot_path_series(client, arxiv_feed):
+    arxiv_feed["content"] = make_feed(2, start=400)
+    query_id = client.post("/arxiv", json={"author": "Measured"}).json()["query_id"]
+    client.get(f"/queries/{query_id}/results")
+
+    response = client.get("/metrics")
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    lines = response.text.splitlines()
+    assert 'arxiv_responses_total{status="200"}' in "\n".join(lines)
+    for series in ("arxiv_request_duration_seconds_count", "arxiv_feed_parse_seconds_count",
+                   "arxiv_feed_insert_seconds_count", "db_pool_wait_seconds_count", "db_pool_checked_out",
+                   "db_pool_overflow"):
+        assert any(line.startswith(series) for line in lines), series
+    assert any(line.startswith('http_request_duration_seconds_count{method="GET",'
+                               'route="/queries/{query_id}/results",status="200"}') for line in lines)
+
+
+def test_histogram_renders_cumulative_buckets():
+    histogram = Histogram("latency_seconds", "Latency.", ("route",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 5.0):
+        histogram.observe(value, "/a")
+
+    assert histogram.render().splitlines()[2:] == [
+        'latency_seconds_bucket{route="/a",le="0.1"} 1.0',
+        'latency_seconds_bucket{route="/a",le="1.0"} 2.0',
+        'latency_seconds_bucket{route="/a",le="+Inf"} 3.0',
+        'latency_seconds_sum{route="/a"} 5.55',
+        'latency_seconds_count{route="/a"} 3.0'
+    ]
+
+
+def test_connection_budget_is_split_across_workers(monkeypatch):
+    assert split_connection_budget(80, 4, pool_size=10, max_overflow=20) == (10, 10)
+    assert split_connection_budget(80, 16, pool_size=10, max_overflow=20) == (5, 0)
+    assert split_connection_budget(90, 1, pool_size=10, max_overflow=20) == (10, 20)
+    assert split_connection_budget(0, 16, pool_size=10, max_overflow=20) == (10, 20)
+
+    assert async_connect_args_for("postgresql://postgres@db/arxivdb") == {}
+    monkeypatch.setattr(database, "PGBOUNCER", True)
+    pgbouncer_args = async_connect_args_for("postgresql://postgres@db/arxivdb")
+    assert pgbouncer_args["statement_cache_size"] == 0 and pgbouncer_args["prepared_statement_cache_size"] == 0
+    assert pgbouncer_args["prepared_statement_name_func"]() != pgbouncer_args["prepared_statement_name_func"]()
+    assert async_connect_args_for("sqlite:///./test.db") == {}
+
+
+def test_multiprocess_registry_adds_up_the_metrics_of_all_workers(tmp_path):
+    exited = subprocess.Popen([sys.executable, "-c", "pass"])
+    exited.wait()
+    workers = []
+    for pid, (requests, queued, state) in ((os.getpid(), (2, 1, 0)), (os.getppid(), (3, 4, 2)),
+                                           (exited.pid, (4, 8, 3))):
+        registry = Registry(tmp_path, pid=pid)
+        registry.register(Counter("searches", "Searches.")).inc(amount=requests)
+        registry.register(Gauge("queued", "Queued.", lambda queued=queued: queued))
+        registry.register(Gauge("state", "State.", lambda state=state: state, mode="max"))
+        registry.flush()
+        workers.append(registry)
+
+    samples = workers[0].render().splitlines()
+    # Counters of the exited worker still count; its gauges no longer describe anything running.
+    assert "searches_total 9.0" in samples
+    assert "queued 5.0" in samples and "state 2.0" in samples
+
+
+def test_profiler_counts_sql_and_flags_repeated_statements(tmp_path):
+    profiled_engine = create_engine(f"sqlite:///{tmp_path / 'profiled.db'}")
+    profiled = FastAPI()
+
+    @profiled.get("/papers")
+    def list_papers():
+        with profiled_engine.connect() as connection:
+            for paper_id in range(6):
+                connection.exec_driver_sql(f"SELECT {paper_id}")
+        return {}
+
+    profiled.add_middleware(RequestProfilerMiddleware, sample_rate=0, allow_header=True, directory=tmp_path)
+    profiled_client = TestClient(profiled)
+
+    assert "x-profile-sql-count" not in profiled_client.get("/papers").headers
+    response = profiled_client.get("/papers", headers={"X-Profile": "1"})
+    assert response.headers["x-profile-sql-count"] == "6"
+    assert response.headers["x-profile-n-plus-one"] == "1"
+    assert (tmp_path / response.headers["x-profile-file"]).exists()
+    summary = json.loads(next(tmp_path.glob("*.sql.json")).read_text())
+    assert summary["sql"]["n_plus_one"] == [{"statement": "SELECT ?", "count": 6}]
+    profiled_engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_profiler_serves_overlapping_requests_unprofiled(tmp_path):
+    overlapping = FastAPI()
+    both_arrived = asyncio.Event()
+    arrived = []
+
+    @overlapping.get("/slow")
+    async def slow():
+        arrived.append(1)
+        if len(arrived) == 2:
+            both_arrived.set()
+        await both_arrived.wait()
+        return {}
+
+    overlapping.add_middleware(RequestProfilerMiddleware, sample_rate=1, allow_header=False, directory=tmp_path)
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=overlapping), base_url="http://test") as client:
+        responses = await asyncio.gather(client.get("/slow"), client.get("/slow"))
+
+    assert [response.status_code for response in responses] == [200, 200]
+    assert sorted("x-profile-file" in response.headers for response in responses) == [False, True]
+    assert len(list(tmp_path.glob("*.sql.json"))) == 1
+
+
+def test_migrate_upgrades_a_schema_created_by_create_all_without_versions(tmp_path):
+    legacy = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    with legacy.begin() as connection:
+        connection.exec_driver_sql("CREATE TABLE arxiv_queries (id INTEGER PRIMARY KEY, query VARCHAR, "
+                                   "timestamp DATETIME, status INTEGER, num_results INTEGER)")
+        connection.exec_driver_sql("CREATE INDEX ix_arxiv_queries_query ON arxiv_queries (query)")
+        connection.exec_driver_sql("CREATE TABLE arxiv_results (id INTEGER PRIMARY KEY, query_id INTEGER "
+                                   "REFERENCES arxiv_queries (id), author VARCHAR, title VARCHAR, journal VARCHAR)")
+        connection.exec_driver_sql("CREATE INDEX ix_arxiv_results_query_id ON arxiv_results (query_id)")
+        connection.exec_driver_sql("INSERT INTO arxiv_queries (query, status, num_results) VALUES ('old', 200, 2)")
+        connection.exec_driver_sql("INSERT INTO arxiv_queries (query, status, num_results) VALUES ('new', 200, 1)")
+        connection.exec_driver_sql("INSERT INTO arxiv_results (query_id, author, title, journal) VALUES "
+                                   "(1, 'Ada, Grace', 'Old Paper', 'J'), (1, 'Alan', 'Other Paper', NULL), "
+                                   "(2, 'Ada, Grace', 'Old Paper', 'J')")
+
+    with legacy.begin() as connection:
+        migrate(connection)
+    with legacy.begin() as connection:
+        migrate(connection)
+        inspector = inspect(connection)
+        columns = {column["name"] for column in inspector.get_columns("arxiv_queries")}
+        query_indexes = {index["name"] for index in inspector.get_indexes("arxiv_queries")}
+        ranked = connection.exec_driver_sql(
+            "SELECT query_results.query_id, query_results.rank, papers.title, papers.authors FROM query_results "
+            "JOIN papers ON papers.id = query_results.paper_id ORDER BY query_results.query_id, query_results.rank"
+        ).all()
+
+        assert current_version(connection) == LATEST_VERSION
+        assert {"search_key", "search_query", "harvest_state", "harvest_next_start", "harvest_updated_at"} <= columns
+        assert inspector.has_table("arxiv_jobs")
+        assert query_indexes == {"ix_arxiv_queries_search_key", "ix_arxiv_queries_timestamp_id"}
+        assert connection.exec_driver_sql("SELECT query FROM arxiv_queries").scalar() == "old"
+        assert [tuple(row) for row in ranked] == [(1, 0, "Old Paper", "Ada, Grace"), (1, 1, "Other Paper", "Alan"),
+                                                  (2, 0, "Old Paper", "Ada, Grace")]
+        assert connection.exec_driver_sql("SELECT count(*) FROM papers").scalar() == 2
+        assert connection.exec_driver_sql("SELECT count(*) FROM paper_authors").scalar() == 3
+        assert not inspector.has_table("arxiv_results")
+        assert inspector.has_table("papers_fts")
+    legacy.dispose()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,78 @@
+import itertools
+import os
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import create_engine, func, insert, select
+
+from backend.src.api.queries import QUERY_COLUMNS, QUERY_KEY, select_queries
+from backend.src.api.results import results_statement
+from backend.src.migrations import migrate
+from backend.src.models import ArxivQuery, Paper, QueryResult
+from backend.src.pagination import NEXT, PREV, Cursor, seek
+
+# After ANALYZE, SQLite already prefers the indexes at this size; set QUERY_PLAN_ROWS to check a production-sized table.
+PLAN_ROWS = int(os.getenv("QUERY_PLAN_ROWS", "20000"))
+RESULTS_PER_QUERY = 100
+SEED_BATCH_SIZE = 100000
+
+PLAN_DATABASE_PATH = "./query_plans.db"
+START = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+@pytest.fixture(scope="module")
+def plan_engine():
+    if os.path.exists(PLAN_DATABASE_PATH):
+        os.remove(PLAN_DATABASE_PATH)
+    engine = create_engine(f"sqlite:///{PLAN_DATABASE_PATH}")
+    with engine.begin() as connection:
+        migrate(connection)
+        connection.execute(insert(ArxivQuery), [
+            {"query": f"query {index}", "timestamp": START + timedelta(seconds=index), "status": 200,
+             "num_results": RESULTS_PER_QUERY}
+            for index in range(PLAN_ROWS // RESULTS_PER_QUERY)
+        ])
+        papers = ({"arxiv_id": f"plan/{index:07d}", "authors": f"Author {index}", "title": f"Paper {index}",
+                   "journal": f"Journal {index}"} for index in range(PLAN_ROWS))
+        while batch := list(itertools.islice(papers, SEED_BATCH_SIZE)):
+            connection.execute(insert(Paper), batch)
+        results = ({"query_id": index // RESULTS_PER_QUERY + 1, "rank": index % RESULTS_PER_QUERY,
+                    "paper_id": index + 1} for index in range(PLAN_ROWS))
+        while batch := list(itertools.islice(results, SEED_BATCH_SIZE)):
+            connection.execute(insert(QueryResult), batch)
+        connection.exec_driver_sql("ANALYZE")
+    yield engine
+    engine.dispose()
+    os.remove(PLAN_DATABASE_PATH)
+
+
+def explain(engine, statement) -> str:
+    sql = statement.compile(engine, compile_kwargs={"literal_binds": True})
+    with engine.connect() as connection:
+        return "\n".join(row[-1] for row in connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {sql}"))
+
+
+def assert_index_range(plan: str, index_name: str):
+    assert f"INDEX {index_name}" in plan, plan
+    assert "SCAN" not in plan, plan
+    assert "TEMP B-TREE" not in plan, plan
+
+
+@pytest.mark.parametrize("cursor", [None, Cursor(NEXT, (START + timedelta(hours=1), 3600)),
+                                    Cursor(PREV, (START + timedelta(hours=1), 3600))])
+def test_queries_page_is_an_index_range_in_key_order(plan_engine, cursor):
+    statement = seek(select_queries(START, START + timedelta(days=1), *QUERY_COLUMNS), QUERY_KEY, cursor, 10)
+    assert_index_range(explain(plan_engine, statement), "ix_arxiv_queries_timestamp_id")
+
+
+def test_queries_count_reads_only_the_index(plan_engine):
+    statement = select(func.count()).select_from(select_queries(START, START + timedelta(days=1)).subquery())
+    assert "COVERING INDEX ix_arxiv_queries_timestamp_id" in explain(plan_engine, statement)
+
+
+@pytest.mark.parametrize("cursor", [None, Cursor(NEXT, (42, 50)), Cursor(PREV, (42, 50))])
+def test_results_page_is_an_index_range_in_key_order(plan_engine, cursor):
+    plan = explain(plan_engine, results_statement(42, 0, 10, cursor))
+    # The composite primary key of query_results is the (query_id, rank) index SQLite names itself.
+    assert_index_range(plan, "sqlite_autoindex_query_results_1")
+    assert "USING INTEGER PRIMARY KEY" in plan
@@ -0,0 +1,87 @@
+"""Serve synthetic arXiv Atom feeds locally, so searches can be benchmarked without arXiv.
+
+Every search matches ``--entries`` papers; ``start`` and ``max_results`` page through them
+the way the arXiv API does. Paper ids depend on the search, so distinct searches store
+distinct papers. Point the backend at it with ``ARXIV_API_URL``. Run from the repository
+root::
+
+    python -m benchmarks.arxiv_stub [--port 8081] [--entries 1000] [--latency 0.2] [--jitter 0.05]
+"""
+import argparse
+import asyncio
+import random
+import zlib
+from typing import Iterator
+from xml.sax.saxutils import escape
+
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import Response, StreamingResponse
+from starlette.routing import Route
+
+# Entries rendered per streamed chunk.
+CHUNK_ENTRIES = 500
+
+FEED_HEADER = """<?xml version="1.0" encoding="UTF-8"?>
+<feed xmlns="http://www.w3.org/2005/Atom" xmlns:opensearch="http://a9.com/-/spec/opensearch/1.1/"
+      xmlns:arxiv="http://arxiv.org/schemas/atom">
+  <title type="html">ArXiv Query: search_query={query}</title>
+  <opensearch:totalResults>{total}</opensearch:totalResults>
+  <opensearch:startIndex>{start}</opensearch:startIndex>
+  <opensearch:itemsPerPage>{count}</opensearch:itemsPerPage>"""
+
+ATOM_ENTRY = """
+  <entry>
+    <id>http://arxiv.org/abs/{arxiv_id}v1</id>
+    <title>Synthetic paper {index} on {query}</title>
+    <author><name>Author {index}</name></author>
+    <author><name>Coauthor {index}</name></author>
+    <author><name>Shared Author {group}</name></author>
+    <arxiv:journal_ref>Journal {group} ({index})</arxiv:journal_ref>
+  </entry>"""
+
+
+def atom_feed(query: str, start: int, count: int, total: int) -> Iterator[bytes]:
+    """The feed for entries ``start`` to ``start + count`` of a ``total``-entry search, in chunks."""
+    prefix = zlib.crc32(query.encode()) % 10_000
+    escaped = escape(query)
+    yield FEED_HEADER.format(query=escaped, total=total, start=start, count=count).encode()
+    for chunk_start in range(start, start + count, CHUNK_ENTRIES):
+        yield "".join(ATOM_ENTRY.format(arxiv_id=f"{prefix:04d}.{index:05d}", index=index, group=index % 100,
+                                        query=escaped)
+                      for index in range(chunk_start, min(chunk_start + CHUNK_ENTRIES, start + count))).encode()
+    yield b"\n</feed>"
+
+
+def create_stub_app(entries: int, latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0) -> Starlette:
+    """An app answering ``GET /api/query`` like arXiv, after ``latency`` plus up to ``jitter`` seconds.
+
+    A share ``error_rate`` of the requests is answered with ``503`` instead.
+    """
+    async def query(request: Request):
+        delay = latency + random.uniform(0, jitter)
+        if delay:
+            await asyncio.sleep(delay)
+        if error_rate and random.random() < error_rate:
+            return Response("Service Unavailable", status_code=503)
+        search_query = request.query_params.get("search_query", "")
+        start = max(int(request.query_params.get("start", "0")), 0)
+        count = max(min(int(request.query_params.get("max_results", "10")), entries - start), 0)
+        return StreamingResponse(atom_feed(search_query, start, count, entries), media_type="application/atom+xml")
+
+    return Starlette(routes=[Route("/api/query", query)])
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--entries", type=int, default=1000, help="Entries every search matches (10 to 50000)")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds before every response")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Up to this many extra seconds, uniformly")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests answered with 503")
+    arguments = parser.parse_args()
+    uvicorn.run(create_stub_app(arguments.entries, arguments.latency, arguments.jitter, arguments.error_rate),
+                host=arguments.host, port=arguments.port, log_level="warning")
@@ -0,0 +1,90 @@
+"""Compare the per-object ORM insert path with the bulk upsert path.
+
+Run from the repository root::
+
+    python -m benchmarks.bench_insert [--sizes 100 1000 10000] [--database-url sqlite:///./bench.db] [--output insert.json]
+"""
+import argparse
+import asyncio
+import itertools
+import os
+import time
+
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from backend.src.database import Base, to_async_url
+from backend.src.atom import AtomEntry
+from backend.src.models import ArxivQuery, Author, Paper, PaperAuthor, QueryResult
+from backend.src.storage import insert_query, store_entries
+from benchmarks.report import write_report
+
+# Every run stores papers no other run has seen, so both paths measure first-time inserts.
+run_ids = itertools.count()
+
+
+def make_entries(count: int) -> list[AtomEntry]:
+    run = next(run_ids)
+    return [AtomEntry(f"bench/{run:04d}.{index:06d}", f"Paper {index}",
+                      (f"Author {run}.{index}", f"Coauthor {run}.{index}"), f"Journal {index}")
+            for index in range(count)]
+
+
+async def orm_path(session_factory: async_sessionmaker, entries: list[AtomEntry]):
+    async with session_factory() as db:
+        query = ArxivQuery(query="bench", status=200, num_results=len(entries))
+        db.add(query)
+        await db.commit()
+        await db.refresh(query)
+        authors = {}
+        for rank, entry in enumerate(entries):
+            paper = Paper(arxiv_id=entry.arxiv_id, title=entry.title, authors=", ".join(entry.authors),
+                          journal=entry.journal_ref)
+            for position, name in enumerate(entry.authors):
+                author = authors.setdefault(name, Author(name=name))
+                db.add(PaperAuthor(paper=paper, position=position, author=author))
+            db.add(QueryResult(query_id=query.id, rank=rank, paper=paper))
+        await db.commit()
+
+
+async def bulk_path(session_factory: async_sessionmaker, entries: list[AtomEntry]):
+    async with session_factory() as db, db.begin():
+        query_id = await insert_query(db, query="bench", status=200, num_results=len(entries))
+        await store_entries(db, query_id, 0, entries)
+
+
+async def measure(path, session_factory: async_sessionmaker, size: int, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        entries = make_entries(size)
+        start = time.perf_counter()
+        await path(session_factory, entries)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+async def main(database_url: str, sizes: list[int], repeat: int, output: str | None):
+    engine = create_async_engine(to_async_url(database_url))
+    session_factory = async_sessionmaker(bind=engine, expire_on_commit=False)
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.create_all)
+
+    results = []
+    print(f"{'rows':>8} {'orm (ms)':>12} {'bulk (ms)':>12} {'speedup':>8}")
+    for size in sizes:
+        orm = await measure(orm_path, session_factory, size, repeat)
+        bulk = await measure(bulk_path, session_factory, size, repeat)
+        results.append({"rows": size, "orm_ms": orm * 1000, "bulk_ms": bulk * 1000})
+        print(f"{size:>8} {orm * 1000:>12.1f} {bulk * 1000:>12.1f} {orm / bulk:>7.1f}x")
+
+    await engine.dispose()
+    write_report(output, "insert", {"database": engine.dialect.name, "repeat": repeat}, results)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database-url", default=os.getenv("BENCH_DATABASE_URL", "sqlite:///./bench.db"))
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1_000, 10_000])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    arguments = parser.parse_args()
+    asyncio.run(main(arguments.database_url, arguments.sizes, arguments.repeat, arguments.output))
@@ -0,0 +1,205 @@
+"""Load-test the running services end to end and report latency percentiles and requests per second.
+
+For every ``--database-url`` this starts the arXiv stand-in, the backend and the frontend as
+separate uvicorn processes, then drives ``POST /arxiv``, ``/queries``, ``/results`` and the
+frontend ``/search`` over real HTTP. ``--backend-url``/``--frontend-url`` drive services that
+are already running instead. Run from the repository root::
+
+    python -m benchmarks.bench_load [--database-url sqlite:///./bench_load.db postgresql://...]
+                                    [--requests 500] [--concurrency 16] [--output load.json]
+"""
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+from contextlib import ExitStack, contextmanager
+from datetime import datetime, timedelta, timezone
+from itertools import count
+from pathlib import Path
+from typing import Awaitable, Callable, Iterator, NamedTuple, Optional
+
+import httpx
+from sqlalchemy.engine import make_url
+
+from benchmarks.report import summarize, write_report
+
+ROOT = Path(__file__).resolve().parent.parent
+PAGE_SIZE = 10
+STARTUP_TIMEOUT = 60.0
+# Every run searches for something new, so POST /arxiv always reaches the stand-in.
+run_ids = count()
+
+
+class Scenario(NamedTuple):
+    name: str
+    client: httpx.AsyncClient
+    request: Callable[[httpx.AsyncClient, int], Awaitable[httpx.Response]]
+
+
+class Target(NamedTuple):
+    database: str
+    backend_url: str
+    frontend_url: Optional[str]
+
+
+def free_port() -> int:
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+def wait_until_ready(url: str, process: Optional[subprocess.Popen] = None):
+    deadline = time.monotonic() + STARTUP_TIMEOUT
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f"Process serving {url} exited with {process.returncode}")
+        try:
+            if httpx.get(url, timeout=1.0).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"{url} did not become ready within {STARTUP_TIMEOUT:.0f} s")
+
+
+@contextmanager
+def serve(arguments: list[str], ready_url: str, cwd: Path = ROOT, env: Optional[dict] = None):
+    process = subprocess.Popen([sys.executable, *arguments], cwd=cwd, env={**os.environ, **(env or {})},
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_until_ready(ready_url, process)
+        yield process
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+@contextmanager
+def local_services(database_url: str, entries: int, latency: float, jitter: float) -> Iterator[Target]:
+    stub_port, backend_port, frontend_port = free_port(), free_port(), free_port()
+    stub_url, backend_url, frontend_url = (f"http://127.0.0.1:{port}" for port in (stub_port, backend_port,
+                                                                                   frontend_port))
+    with ExitStack() as stack:
+        stack.enter_context(serve(["-m", "benchmarks.arxiv_stub", "--port", str(stub_port), "--entries", str(entries),
+                                   "--latency", str(latency), "--jitter", str(jitter)],
+                                  f"{stub_url}/api/query?max_results=1"))
+        stack.enter_context(serve(
+            ["-m", "uvicorn", "backend.src.main:app", "--port", str(backend_port), "--log-level", "warning"],
+            f"{backend_url}/queries",
+            # The stand-in is local, so the arXiv rate limit would only measure itself.
+            env={"DATABASE_URL": database_url, "ARXIV_API_URL": f"{stub_url}/api/query", "ARXIV_REQUEST_DELAY": "0"}))
+        stack.enter_context(serve(
+            ["-m", "uvicorn", "main:app", "--port", str(frontend_port), "--log-level", "warning"],
+            f"{frontend_url}/", cwd=ROOT / "frontend" / "src",
+            env={"BACKEND_API_URL_BASE": "http://127.0.0.1", "BACKEND_API_PORT": str(backend_port)}))
+        yield Target(make_url(database_url).get_backend_name(), backend_url, frontend_url)
+
+
+async def drive(scenario: Scenario, requests: int, concurrency: int) -> dict:
+    pending = iter(range(requests))
+    latencies = []
+    errors = 0
+
+    async def worker():
+        nonlocal errors
+        for index in pending:
+            start = time.perf_counter()
+            try:
+                response = await scenario.request(scenario.client, index)
+                failed = response.status_code >= 400
+            except httpx.HTTPError:
+                failed = True
+            latencies.append(time.perf_counter() - start)
+            errors += failed
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(latencies, time.perf_counter() - start, errors)
+
+
+def search_payload(max_results: int) -> dict:
+    return {"author": f"Load {os.getpid()} {next(run_ids)}", "max_results": max_results}
+
+
+async def run_target(target: Target, requests: int, concurrency: int, max_results: int) -> list[dict]:
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    timeout = httpx.Timeout(120.0)
+    async with httpx.AsyncClient(base_url=target.backend_url, limits=limits, timeout=timeout) as backend, \
+            httpx.AsyncClient(base_url=target.frontend_url or "", limits=limits, timeout=timeout) as frontend:
+        # One search every read scenario pages through.
+        seeded = await backend.post("/arxiv", json=search_payload(max_results))
+        seeded.raise_for_status()
+        query_id = seeded.json()["query_id"]
+        pages = max(1, (max_results + PAGE_SIZE - 1) // PAGE_SIZE)
+        since = (datetime.now(timezone.utc) - timedelta(days=1)).isoformat()
+
+        scenarios = [
+            Scenario("POST /arxiv", backend,
+                     lambda client, index: client.post("/arxiv", json=search_payload(max_results))),
+            Scenario("GET /queries", backend,
+                     lambda client, index: client.get("/queries", params={"query_start_time": since,
+                                                                          "items_per_page": PAGE_SIZE,
+                                                                          "page": index % 10})),
+            Scenario("GET /results", backend,
+                     lambda client, index: client.get("/results", params={"query_id": query_id,
+                                                                          "items_per_page": PAGE_SIZE,
+                                                                          "page": index % pages}))
+        ]
+        if target.frontend_url:
+            scenarios += [
+                Scenario("POST frontend /search", frontend,
+                         lambda client, index: client.post("/search", data=search_payload(max_results))),
+                Scenario("GET frontend /search", frontend,
+                         lambda client, index: client.get("/search", params={"query_id": query_id,
+                                                                             "page": index % pages + 1}))
+            ]
+
+        results = []
+        print(f"{target.database}:")
+        print(f"{'scenario':>24} {'requests/s':>11} {'p50 (ms)':>9} {'p95 (ms)':>9} {'p99 (ms)':>9} {'errors':>7}")
+        for scenario in scenarios:
+            await drive(scenario, min(requests, concurrency * 5), concurrency)
+            summary = await drive(scenario, requests, concurrency)
+            results.append({"database": target.database, "scenario": scenario.name, **summary})
+            print(f"{scenario.name:>24} {summary['requests_per_second']:>11.0f} {summary['p50_ms']:>9.1f} "
+                  f"{summary['p95_ms']:>9.1f} {summary['p99_ms']:>9.1f} {summary['errors']:>7}")
+        return results
+
+
+def main(arguments: argparse.Namespace):
+    results = []
+    if arguments.backend_url:
+        target = Target("external", arguments.backend_url.rstrip("/"),
+                        arguments.frontend_url.rstrip("/") if arguments.frontend_url else None)
+        results += asyncio.run(run_target(target, arguments.requests, arguments.concurrency, arguments.max_results))
+    else:
+        for database_url in arguments.database_url:
+            with local_services(database_url, arguments.entries, arguments.latency, arguments.jitter) as target:
+                results += asyncio.run(run_target(target, arguments.requests, arguments.concurrency,
+                                                  arguments.max_results))
+
+    config = {key: value for key, value in vars(arguments).items() if key not in ("output", "database_url")}
+    write_report(arguments.output, "load", config, results)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database-url", nargs="+",
+                        default=[os.getenv("BENCH_DATABASE_URL", "sqlite:///./bench_load.db")],
+                        help="Start the services once per database, e.g. a SQLite and a Postgres URL")
+    parser.add_argument("--backend-url", help="Drive an already running backend instead of starting one")
+    parser.add_argument("--frontend-url", help="With --backend-url, also drive this running frontend")
+    parser.add_argument("--requests", type=int, default=500, help="Requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--max-results", type=int, default=100, help="max_results of every search")
+    parser.add_argument("--entries", type=int, default=1000, help="Entries the arXiv stand-in has per search")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds the arXiv stand-in waits per request")
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    main(parser.parse_args())
@@ -0,0 +1,114 @@
+"""Time the stages of a search on their own: parsing a feed, inserting its entries, serializing a page.
+
+Feeds come from the arXiv stand-in in ``benchmarks.arxiv_stub``. Each stage reports the
+best of ``--repeat`` runs and entries per second. Run from the repository root::
+
+    python -m benchmarks.bench_micro [--sizes 10 1000 50000] [--database-url sqlite:///./bench.db] [--output micro.json]
+"""
+import argparse
+import asyncio
+import itertools
+import os
+import time
+from typing import NamedTuple
+
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from backend.src.api.utils import json_page
+from backend.src.atom import AtomEntry, AtomStreamParser
+from backend.src.database import Base, to_async_url
+from backend.src.schemas import ResultPage
+from backend.src.storage import INSERT_BATCH_SIZE, insert_query, store_entries
+from benchmarks.arxiv_stub import atom_feed
+from benchmarks.report import write_report
+
+# httpx hands the response body to the parser in chunks of about this size.
+CHUNK_SIZE = 64 * 1024
+
+# Every run searches for something new, so inserts store papers no earlier run has seen.
+run_ids = itertools.count()
+
+
+class ResultRow(NamedTuple):
+    title: str
+    author: str
+    journal: str
+
+
+def feed_chunks(size: int) -> list[bytes]:
+    body = b"".join(atom_feed(f"au:micro {next(run_ids)} {time.time_ns()}", 0, size, size))
+    return [body[offset:offset + CHUNK_SIZE] for offset in range(0, len(body), CHUNK_SIZE)]
+
+
+def parse(chunks: list[bytes]) -> list[AtomEntry]:
+    parser = AtomStreamParser()
+    entries = []
+    for chunk in chunks:
+        entries.extend(parser.feed(chunk))
+    entries.extend(parser.close())
+    return entries
+
+
+async def insert(session_factory: async_sessionmaker, entries: list[AtomEntry]):
+    async with session_factory() as db, db.begin():
+        query_id = await insert_query(db, query="micro", status=200, num_results=len(entries))
+        for first in range(0, len(entries), INSERT_BATCH_SIZE):
+            await store_entries(db, query_id, first, entries[first:first + INSERT_BATCH_SIZE])
+
+
+def serialize(rows: list[ResultRow]) -> bytes:
+    page = ResultPage.model_validate({"total": len(rows), "page": 0, "items_per_page": len(rows), "items": rows},
+                                     from_attributes=True)
+    return json_page(page, "no-cache").body
+
+
+async def measure_size(session_factory: async_sessionmaker, size: int, repeat: int) -> dict:
+    timings = {"parse": [], "insert": [], "serialize": []}
+    for _ in range(repeat):
+        chunks = feed_chunks(size)
+        start = time.perf_counter()
+        entries = parse(chunks)
+        timings["parse"].append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await insert(session_factory, entries)
+        timings["insert"].append(time.perf_counter() - start)
+
+        rows = [ResultRow(entry.title, ", ".join(entry.authors), entry.journal_ref) for entry in entries]
+        start = time.perf_counter()
+        serialize(rows)
+        timings["serialize"].append(time.perf_counter() - start)
+
+    result = {"entries": size}
+    for stage, stage_timings in timings.items():
+        best = min(stage_timings)
+        result[f"{stage}_ms"] = best * 1000
+        result[f"{stage}_entries_per_second"] = size / best
+    return result
+
+
+async def main(database_url: str, sizes: list[int], repeat: int, output: str | None):
+    engine = create_async_engine(to_async_url(database_url))
+    session_factory = async_sessionmaker(bind=engine, expire_on_commit=False)
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.create_all)
+
+    results = []
+    print(f"{'entries':>8} {'parse (ms)':>12} {'insert (ms)':>12} {'serialize (ms)':>15}")
+    for size in sizes:
+        result = await measure_size(session_factory, size, repeat)
+        results.append(result)
+        print(f"{size:>8} {result['parse_ms']:>12.1f} {result['insert_ms']:>12.1f} {result['serialize_ms']:>15.1f}")
+
+    await engine.dispose()
+    write_report(output, "micro", {"database": engine.dialect.name, "repeat": repeat}, results)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database-url", default=os.getenv("BENCH_DATABASE_URL", "sqlite:///./bench.db"))
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1_000, 10_000, 50_000])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    arguments = parser.parse_args()
+    asyncio.run(main(arguments.database_url, arguments.sizes, arguments.repeat, arguments.output))
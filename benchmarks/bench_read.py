@@ -0,0 +1,96 @@
+"""Measure requests per second of the /queries and /results read path.
+
+The app runs in process behind ``httpx.ASGITransport``; the response cache is disabled
+unless ``--response-cache`` is given, so every request goes through the database.
+Run from the repository root::
+
+    python -m benchmarks.bench_read [--requests 2000] [--concurrency 8] [--database-url sqlite:///./bench.db]
+                                    [--output read.json]
+"""
+import argparse
+import asyncio
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from urllib.parse import quote
+
+import httpx
+
+from benchmarks.report import write_report
+
+QUERY_COUNT = 500
+RESULT_COUNT = 1000
+PAGE_SIZE = 50
+
+
+async def seed(session_factory) -> int:
+    from backend.src.atom import AtomEntry
+    from backend.src.storage import insert_query, store_entries
+
+    async with session_factory() as db, db.begin():
+        for index in range(QUERY_COUNT - 1):
+            await insert_query(db, query=f"bench query {index}", status=200, num_results=0)
+        query_id = await insert_query(db, query="bench results", status=200, num_results=RESULT_COUNT)
+        await store_entries(db, query_id, 0, [
+            AtomEntry(f"bench/{index:06d}", f"Paper {index}", (f"Author {index}", f"Coauthor {index}"),
+                      f"Journal {index}")
+            for index in range(RESULT_COUNT)
+        ])
+    return query_id
+
+
+async def drive(client: httpx.AsyncClient, urls: list[str], concurrency: int) -> float:
+    pending = iter(urls)
+
+    async def worker():
+        for url in pending:
+            response = await client.get(url)
+            response.raise_for_status()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return len(urls) / (time.perf_counter() - start)
+
+
+async def main(requests: int, concurrency: int, output: str | None):
+    from backend.src.database import AsyncSessionLocal
+    from backend.src.main import app
+
+    async with app.router.lifespan_context(app):
+        query_id = await seed(AsyncSessionLocal)
+        since = quote((datetime.now(timezone.utc) - timedelta(days=1)).isoformat())
+        pages = RESULT_COUNT // PAGE_SIZE
+        scenarios = {
+            "/queries": [f"/queries?query_start_time={since}&items_per_page={PAGE_SIZE}&page={index % 10}"
+                         for index in range(requests)],
+            "/results": [f"/results?query_id={query_id}&items_per_page={PAGE_SIZE}&page={index % pages}"
+                         for index in range(requests)]
+        }
+        results = []
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            print(f"{'endpoint':>10} {'requests/s':>12}")
+            for name, urls in scenarios.items():
+                await drive(client, urls[:concurrency * 10], concurrency)
+                requests_per_second = await drive(client, urls, concurrency)
+                results.append({"endpoint": name, "requests_per_second": requests_per_second})
+                print(f"{name:>10} {requests_per_second:>12.0f}")
+    write_report(output, "read", {"database": os.environ["DATABASE_URL"], "requests": requests,
+                                  "concurrency": concurrency,
+                                  "response_cache": os.getenv("RESPONSE_CACHE_MAX_ENTRIES") != "0"}, results)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database-url", default=os.getenv("BENCH_DATABASE_URL", "sqlite:///./bench.db"))
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--response-cache", action="store_true", help="Keep the in-process page cache enabled")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    arguments = parser.parse_args()
+
+    # The backend reads its configuration at import time.
+    os.environ["DATABASE_URL"] = arguments.database_url
+    if not arguments.response_cache:
+        os.environ["RESPONSE_CACHE_MAX_ENTRIES"] = "0"
+    asyncio.run(main(arguments.requests, arguments.concurrency, arguments.output))
@@ -0,0 +1,54 @@
+"""Shared helpers for summarizing benchmark timings and writing them as JSON."""
+import json
+import platform
+import subprocess
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Optional, Sequence
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def percentile(ordered: Sequence[float], fraction: float) -> float:
+    """Nearest-rank percentile of already sorted values."""
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, max(0, round(fraction * len(ordered)) - 1))]
+
+
+def summarize(latencies: Sequence[float], seconds: float, errors: int = 0) -> dict:
+    """Latency percentiles in milliseconds and throughput of one load run lasting ``seconds``."""
+    ordered = sorted(latencies)
+    return {
+        "requests": len(ordered),
+        "errors": errors,
+        "requests_per_second": len(ordered) / seconds if seconds else 0.0,
+        "p50_ms": percentile(ordered, 0.50) * 1000,
+        "p95_ms": percentile(ordered, 0.95) * 1000,
+        "p99_ms": percentile(ordered, 0.99) * 1000,
+        "max_ms": (ordered[-1] if ordered else 0.0) * 1000
+    }
+
+
+def write_report(path: Optional[str], benchmark: str, config: dict, results: list[dict]):
+    """Write ``results`` with enough context (commit, interpreter, settings) to compare runs."""
+    if path is None:
+        return
+    report = {
+        "benchmark": benchmark,
+        "commit": git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "config": config,
+        "results": results
+    }
+    Path(path).write_text(json.dumps(report, indent=2) + "\n")
+    print(f"Wrote {path}")
@@ -34,7 +34,13 @@ def check_inputs():
     """)
 
 
-def results_list(results_data):
+def page_count(results_data):
+    if not results_data or not results_data['total']:
+        return 0
+    return min(math.ceil(results_data['total'] / results_data['items_per_page']), 10)  # Maximum 10 pages
+
+
+def results_list(results_data, query_id=None):
     if not results_data or results_data['total'] == 0:
         return P("No results", cls="error-message")
 
@@ -51,13 +57,13 @@ def results_list(results_data):
         ) for result in results
     ])
 
-    total_pages = min(math.ceil(total_results / items_per_page), 10)  # Maximum 10 pages
+    total_pages = page_count(results_data)
 
     pagination = Div(
         *(
             A(
                 str(i),
-                hx_get=f"/search?page={i}",
+                hx_get=f"/search?page={i}&query_id={query_id}" if query_id else f"/search?page={i}",
                 hx_target="#results",
                 cls="page-link active" if i == current_page else "page-link"
             )
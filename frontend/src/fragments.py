@@ -0,0 +1,91 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Hashable, NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class Fragment(NamedTuple):
+    html: str
+    total_pages: int
+
+
+class FragmentCache:
+    """Rendered HTML fragments of result pages, keyed on ``(query_id, page)``.
+
+    Bounded by ``max_entries`` with least recently used eviction; entries also expire after
+    ``ttl`` seconds. :meth:`prefetch` renders pages in the background so a later page flip
+    is a hit, and never starts two renders of the same page at once.
+    """
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.prefetched = 0
+        self.prefetch_errors = 0
+        self._entries: OrderedDict[Hashable, tuple[float, Fragment]] = OrderedDict()
+        self._pending: dict[Hashable, asyncio.Task] = {}
+
+    def __contains__(self, key) -> bool:
+        entry = self._entries.get(key)
+        return entry is not None and entry[0] >= time.monotonic()
+
+    def get(self, key) -> Optional[Fragment]:
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            self._entries.pop(key, None)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, key, fragment: Fragment):
+        if self.max_entries <= 0:
+            return
+        self._entries[key] = (time.monotonic() + self.ttl, fragment)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def prefetch(self, key, render: Callable[[], Awaitable[Fragment]]):
+        if self.max_entries <= 0 or key in self or key in self._pending:
+            return
+        self._pending[key] = asyncio.create_task(self._warm(key, render))
+
+    async def _warm(self, key, render: Callable[[], Awaitable[Fragment]]):
+        try:
+            self.set(key, await render())
+            self.prefetched += 1
+        except Exception as error:
+            self.prefetch_errors += 1
+            logger.warning(f"Prefetching page {key} failed: {error}")
+        finally:
+            del self._pending[key]
+
+    async def close(self):
+        tasks = list(self._pending.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._pending.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "prefetched": self.prefetched,
+            "prefetch_errors": self.prefetch_errors,
+            "prefetching": len(self._pending)
+        }
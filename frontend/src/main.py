@@ -1,34 +1,118 @@
+import hashlib
 import logging
+from contextlib import asynccontextmanager
+from typing import NamedTuple
 
 from dotenv import load_dotenv
 from fasthtml.common import *
-from httpx import AsyncClient, HTTPStatusError, RequestError
+from httpx import AsyncClient, HTTPStatusError, Limits, RequestError, Timeout
 
-from components import query_form, results_list, check_inputs
+from components import query_form, results_list, check_inputs, page_count
+from fragments import Fragment, FragmentCache
+from static import StaticAssets
 
 logging.basicConfig(level="INFO")
 logger = logging.getLogger(__name__)
 load_dotenv()
 
-app, rt = fast_app()
-
-Favicon("assets/favicon.ico", "assets/favicon.ico")
-
 BACKEND_API_BASE = os.getenv("BACKEND_API_URL_BASE", "http://api")
 BACKEND_API_PORT = os.getenv("BACKEND_API_PORT", "8000")
 API_URL = f"{BACKEND_API_BASE}:{BACKEND_API_PORT}"
+ITEMS_PER_PAGE = 10
+FRAGMENT_CACHE_MAX_ENTRIES = int(os.getenv("FRAGMENT_CACHE_MAX_ENTRIES", "512"))
+FRAGMENT_CACHE_TTL = float(os.getenv("FRAGMENT_CACHE_TTL", "300"))
+# One worker per CPU this process may run on; the frontend holds no database connections.
+AVAILABLE_CPUS = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+FRONTEND_WORKERS = int(os.getenv("FRONTEND_WORKERS", str(AVAILABLE_CPUS)))
+ASSETS_DIR = Path("assets")
+# Fonts come before the stylesheet that references them, so it is built with their hashed names.
+STATIC_ASSETS = ("vendor/pico.min.css", "vendor/fonts/roboto-light.woff2", "vendor/fonts/roboto-regular.woff2",
+                 "vendor/fonts/roboto-bold.woff2", "vendor/roboto.css", "vendor/htmx.min.js", "styles.css",
+                 "favicon.ico")
+
+
+class Index(NamedTuple):
+    html: str
+    etag: str
+
+
+def create_backend_client() -> AsyncClient:
+    timeout = Timeout(
+        float(os.getenv("BACKEND_TIMEOUT", "60")),
+        connect=float(os.getenv("BACKEND_CONNECT_TIMEOUT", "5"))
+    )
+    limits = Limits(
+        max_connections=int(os.getenv("BACKEND_MAX_CONNECTIONS", "20")),
+        max_keepalive_connections=int(os.getenv("BACKEND_MAX_KEEPALIVE_CONNECTIONS", "10")),
+        keepalive_expiry=float(os.getenv("BACKEND_KEEPALIVE_EXPIRY", "30"))
+    )
+    return AsyncClient(base_url=API_URL, timeout=timeout, limits=limits)
 
 
-@rt("/")
-def get():
+@asynccontextmanager
+async def lifespan(app_instance):
+    assets = StaticAssets(ASSETS_DIR, STATIC_ASSETS)
+    html = to_xml(index_page(assets))
+    app_instance.state.assets = assets
+    app_instance.state.index = Index(html, f'"{hashlib.sha256(html.encode()).hexdigest()[:32]}"')
+    app_instance.state.backend_client = create_backend_client()
+    app_instance.state.fragments = FragmentCache(FRAGMENT_CACHE_MAX_ENTRIES, FRAGMENT_CACHE_TTL)
+    yield
+    await app_instance.state.fragments.close()
+    await app_instance.state.backend_client.aclose()
+
+
+def render_fragment(results, query_id) -> Fragment:
+    return Fragment(to_xml(results_list(results, query_id)), page_count(results))
+
+
+async def fetch_fragment(client: AsyncClient, query_id: int | None, page: int) -> Fragment:
+    results_url = f"/queries/{query_id}/results" if query_id else "/results"
+    results_response = await client.get(results_url, params={"page": page - 1, "items_per_page": ITEMS_PER_PAGE})
+    results_response.raise_for_status()
+    results = results_response.json()
+    logger.info(f"Fetched {len(results['items'])} results for page {page} of query {query_id}")
+    return render_fragment(results, query_id)
+
+
+def serve_fragment(request: Request, query_id: int | None, page: int, fragment: Fragment) -> HTMLResponse:
+    """Answer with ``fragment`` and warm the pages next to it.
+
+    Only pages of a known query are cached; the latest-query view changes with every search.
+    """
+    if query_id:
+        fragments: FragmentCache = request.app.state.fragments
+        client: AsyncClient = request.app.state.backend_client
+        if (query_id, page) not in fragments:
+            fragments.set((query_id, page), fragment)
+        for neighbour in (page + 1, page - 1):
+            if 1 <= neighbour <= fragment.total_pages:
+                fragments.prefetch((query_id, neighbour),
+                                   lambda neighbour=neighbour: fetch_fragment(client, query_id, neighbour))
+        stats = fragments.stats()
+        logger.info(f"Fragment cache: hit_ratio={stats['hit_ratio']:.2f}, size={stats['size']}, "
+                    f"evictions={stats['evictions']}, prefetched={stats['prefetched']}")
+    return HTMLResponse(fragment.html)
+
+
+async def static_asset(request: Request):
+    assets: StaticAssets = request.app.state.assets
+    return assets.response(request.path_params["name"], request.headers.get("accept-encoding"))
+
+
+# Registered ahead of FastHTML's catch-all file route, which would otherwise claim every *.css and *.js path.
+app, rt = fast_app(lifespan=lifespan, default_hdrs=False, routes=[Route("/static/{name}", static_asset)])
+
+
+def index_page(assets: StaticAssets):
     return Html(
         Head(
             Title("ZEISS Coding Challenge | Bence Papp"),
-            Link(rel="stylesheet", href="https://unpkg.com/@picocss/pico@latest/css/pico.min.css"),
-            Link(rel="stylesheet",
-                 href="https://fonts.googleapis.com/css2?family=Roboto:wght@300;400;700&display=swap"),
-            Style(styles_css),
-            Script(src="https://unpkg.com/htmx.org@1.9.10"),
+            Link(rel="icon", href=assets.url("favicon.ico")),
+            Link(rel="stylesheet", href=assets.url("vendor/pico.min.css")),
+            Link(rel="stylesheet", href=assets.url("vendor/roboto.css")),
+            Link(rel="stylesheet", href=assets.url("styles.css")),
+            Script(src=assets.url("vendor/htmx.min.js")),
             check_inputs()
         ),
         Body(
@@ -45,62 +129,73 @@ def get():
     )
 
 
+@rt("/")
+def get(request: Request):
+    index: Index = request.app.state.index
+    headers = {"ETag": index.etag, "Cache-Control": "no-cache"}
+    if request.headers.get("if-none-match") == index.etag:
+        return Response(status_code=304, headers=headers)
+    return HTMLResponse(index.html, headers=headers)
+
+
 @rt("/search")
-async def post(author: str = "", title: str = "", journal: str = ""):
+async def post(request: Request, author: str = "", title: str = "", journal: str = ""):
     logger.info(f"Received search request: author={author}, title={title}, journal={journal}")
 
-    async with AsyncClient() as client:
-        try:
-            payload = {
-                "author": author,
-                "title": title,
-                "journal": journal,
-                "max_results": 100  # Request maximum results to populate cache
-            }
-            response = await client.post(f"{API_URL}/arxiv", json=payload)
-            response.raise_for_status()
-            logger.info(f"arXiv query response: {response.status_code}")
-
-            results_response = await client.get(f"{API_URL}/results?page=0&items_per_page=10")
-            results_response.raise_for_status()
-            results = results_response.json()
-            logger.info(f"Fetched {len(results['items'])} results out of {results['total']}")
-
-            return results_list(results)
-
-        except HTTPStatusError as error:
-            logger.error(f"HTTP error occurred: {error}")
-            return P(f"Error: {error.response.status_code} - {error.response.text}", cls="error-message")
-        except RequestError as error:
-            logger.error(f"Request error occurred: {error}")
-            return P(f"Error: Unable to connect to the API. Please check if the backend is running.",
-                     cls="error-message")
+    client: AsyncClient = request.app.state.backend_client
+    try:
+        payload = {
+            "author": author,
+            "title": title,
+            "journal": journal,
+            "max_results": 100  # Request maximum results to populate cache
+        }
+        # The backend answers with the first page of results, so rendering needs no second call.
+        response = await client.post("/arxiv", params={"results_per_page": ITEMS_PER_PAGE}, json=payload)
+        response.raise_for_status()
+        body = response.json()
+        query_id, results = body["query_id"], body["results"]
+        logger.info(f"arXiv query response: {response.status_code}, query_id={query_id}, "
+                    f"fetched {len(results['items'])} results out of {results['total']}")
+
+        return serve_fragment(request, query_id, 1, render_fragment(results, query_id))
+
+    except HTTPStatusError as error:
+        logger.error(f"HTTP error occurred: {error}")
+        return P(f"Error: {error.response.status_code} - {error.response.text}", cls="error-message")
+    except RequestError as error:
+        logger.error(f"Request error occurred: {error}")
+        return P(f"Error: Unable to connect to the API. Please check if the backend is running.",
+                 cls="error-message")
 
 
 @rt("/search")
-async def get(page: int = 1):
-    async with AsyncClient() as client:
-        try:
-            results_response = await client.get(f"{API_URL}/results?page={page - 1}&items_per_page=10")
-            results_response.raise_for_status()
-            results = results_response.json()
-            logger.info(f"Fetched {len(results['items'])} results for page {page}")
-            return results_list(results)
-        except HTTPStatusError as error:
-            logger.error(f"HTTP error occurred: {error}")
-            return P(f"Error: {error.response.status_code} - {error.response.text}", cls="error-message")
-        except RequestError as error:
-            logger.error(f"Request error occurred: {error}")
-            return P(f"Error: Unable to connect to the API. Please check if the backend is running.",
-                     cls="error-message")
-
-
-try:
-    with open("assets/styles.css", 'r') as file:
-        styles_css = file.read()
-except (FileNotFoundError, IOError) as io_error:
-    logger.error(f"Error reading CSS file: {io_error}")
-    styles_css = ""
+async def get(request: Request, page: int = 1, query_id: int | None = None):
+    cached = request.app.state.fragments.get((query_id, page)) if query_id else None
+    if cached is not None:
+        logger.info(f"Serving page {page} of query {query_id} from the fragment cache")
+        return serve_fragment(request, query_id, page, cached)
+    try:
+        fragment = await fetch_fragment(request.app.state.backend_client, query_id, page)
+        return serve_fragment(request, query_id, page, fragment)
+    except HTTPStatusError as error:
+        logger.error(f"HTTP error occurred: {error}")
+        return P(f"Error: {error.response.status_code} - {error.response.text}", cls="error-message")
+    except RequestError as error:
+        logger.error(f"Request error occurred: {error}")
+        return P(f"Error: Unable to connect to the API. Please check if the backend is running.",
+                 cls="error-message")
+
+
+@rt("/cache")
+def get(request: Request):
+    return request.app.state.fragments.stats()
+
 
 if __name__ == "__main__":
-    serve(host=os.getenv("FRONTEND_HOST", "0.0.0.0"), port=int(os.getenv("FRONTEND_PORT", "5001")))
+    import uvicorn
+
+    # fast_app() read the session secret from .sesskey in the working directory, or wrote a new one there, when this
+    # module was loaded. The file exists before the workers start, so the workers all load the same secret.
+    uvicorn.run("main:app", host=os.getenv("FRONTEND_HOST", "0.0.0.0"), port=int(os.getenv("FRONTEND_PORT", "5001")),
+                workers=FRONTEND_WORKERS)
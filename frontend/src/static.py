@@ -0,0 +1,114 @@
+import gzip
+import hashlib
+import logging
+import mimetypes
+import re
+from pathlib import Path, PurePosixPath
+from typing import NamedTuple, Optional, Sequence
+
+from starlette.responses import Response
+
+try:
+    import brotli
+except ImportError:  # brotli is a dependency; without it (e.g. a bare dev setup) only gzip variants are built.
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+mimetypes.add_type("font/woff2", ".woff2")
+COMPRESSIBLE_TYPES = ("text/", "application/javascript", "image/svg+xml", "image/x-icon", "image/vnd.microsoft.icon")
+CSS_URL = re.compile(r"url\((['\"]?)([^'\")]+)\1\)")
+
+
+class Asset(NamedTuple):
+    content_type: str
+    # Content-Encoding ("identity", "br", "gzip") to body, smallest first.
+    variants: dict[str, bytes]
+
+
+def accepted_encodings(header: Optional[str]) -> set[str]:
+    accepted = {"identity"}
+    for part in (header or "").split(","):
+        coding, *params = part.split(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params:
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if quality > 0:
+            accepted.add(coding)
+    return accepted
+
+
+class StaticAssets:
+    """Files served from memory under content-hashed names with immutable cache headers.
+
+    Every file is read, hashed and compressed to gzip (and brotli when available) once,
+    when the set is built. Stylesheets have their ``url(...)`` references rewritten to the
+    hashed names of files listed before them, so a changed font also changes the CSS name.
+    """
+
+    def __init__(self, root: Path, names: Sequence[str], prefix: str = "/static/"):
+        self.prefix = prefix
+        self._urls: dict[str, str] = {}
+        self._assets: dict[str, Asset] = {}
+        for name in names:
+            self._add(name, (root / name).read_bytes())
+
+    def _add(self, name: str, content: bytes):
+        content_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+        if content_type == "text/css":
+            content = self._rewrite_urls(name, content)
+        digest = hashlib.sha256(content).hexdigest()
+        path = PurePosixPath(name)
+        hashed = f"{path.stem}.{digest[:12]}{path.suffix}"
+
+        variants = {"identity": content}
+        if content_type.startswith(COMPRESSIBLE_TYPES):
+            variants["gzip"] = gzip.compress(content, compresslevel=9, mtime=0)
+            if brotli is not None:
+                variants["br"] = brotli.compress(content, quality=11)
+        variants = {encoding: body for encoding, body in sorted(variants.items(), key=lambda item: len(item[1]))
+                    if encoding == "identity" or len(body) < len(content)}
+
+        self._urls[name] = self.prefix + hashed
+        self._assets[hashed] = Asset(content_type, variants)
+        logger.info(f"Static asset {name} -> {hashed}: "
+                    + ", ".join(f"{encoding} {len(body)} B" for encoding, body in variants.items()))
+
+    def _rewrite_urls(self, name: str, content: bytes) -> bytes:
+        directory = PurePosixPath(name).parent
+
+        def replace(match: re.Match) -> str:
+            target = str(directory / match.group(2)) if directory.parts else match.group(2)
+            return f"url({self._urls[target]})" if target in self._urls else match.group(0)
+
+        return CSS_URL.sub(replace, content.decode()).encode()
+
+    def url(self, name: str) -> str:
+        return self._urls[name]
+
+    def response(self, hashed: str, accept_encoding: Optional[str]) -> Response:
+        """The smallest variant of ``hashed`` the client accepts.
+
+        The name changes with the content, so caches may keep the answer forever.
+        """
+        asset = self._assets.get(hashed)
+        if asset is None:
+            return Response(status_code=404)
+        headers = {"Cache-Control": IMMUTABLE_CACHE_CONTROL}
+        if len(asset.variants) > 1:
+            headers["Vary"] = "Accept-Encoding"
+
+        accepted = accepted_encodings(accept_encoding)
+        encoding, body = next((encoding, body) for encoding, body in asset.variants.items() if encoding in accepted)
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+        return Response(content=body, media_type=asset.content_type, headers=headers)
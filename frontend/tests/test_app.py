@@ -0,0 +1,250 @@
+import asyncio
+import gzip
+import hashlib
+import sys
+import time
+from pathlib import Path
+
+import brotli
+import httpx
+import pytest
+from starlette.testclient import TestClient
+
+# The frontend runs from frontend/src and imports its modules by their bare names.
+SRC_DIR = Path(__file__).parents[1] / "src"
+sys.path.insert(0, str(SRC_DIR))
+
+import fragments  # noqa: E402
+import main  # noqa: E402
+from fragments import Fragment, FragmentCache  # noqa: E402
+from static import IMMUTABLE_CACHE_CONTROL, StaticAssets, accepted_encodings  # noqa: E402
+
+
+def results_page(page: int, total: int = 30) -> dict:
+    first = page * main.ITEMS_PER_PAGE
+    return {
+        "items": [{"title": f"Paper {index}", "author": f"Author {index}", "journal": f"Journal {index}"}
+                  for index in range(first, min(first + main.ITEMS_PER_PAGE, total))],
+        "total": total,
+        "page": page,
+        "items_per_page": main.ITEMS_PER_PAGE
+    }
+
+
+@pytest.fixture
+def backend():
+    """Requests the frontend sent to the stubbed backend API."""
+    return {"requests": []}
+
+
+@pytest.fixture
+def client(backend, monkeypatch):
+    def handler(request: httpx.Request):
+        backend["requests"].append(request)
+        if request.method == "POST":
+            return httpx.Response(200, json={"query_id": 7, "results": results_page(0)})
+        return httpx.Response(200, json=results_page(int(request.url.params["page"])))
+
+    monkeypatch.setattr(main, "ASSETS_DIR", SRC_DIR / "assets")
+    monkeypatch.setattr(main, "create_backend_client",
+                        lambda: httpx.AsyncClient(base_url="http://api", transport=httpx.MockTransport(handler)))
+    with TestClient(main.app) as c:
+        yield c
+
+
+def wait_for_prefetches(cache: FragmentCache, timeout: float = 5):
+    # Prefetches run on the test client's event loop, in another thread.
+    deadline = time.monotonic() + timeout
+    while cache.stats()["prefetching"] and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def test_fragment_cache_counts_hits_and_misses():
+    cache = FragmentCache(max_entries=4, ttl=60)
+
+    assert cache.get((1, 1)) is None
+    cache.set((1, 1), Fragment("<ul></ul>", 3))
+
+    assert cache.get((1, 1)) == Fragment("<ul></ul>", 3)
+    assert (1, 1) in cache and (1, 2) not in cache
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["size"], stats["hit_ratio"]) == (1, 1, 1, 0.5)
+
+
+def test_fragment_cache_expires_entries_after_the_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(fragments.time, "monotonic", lambda: now[0])
+    cache = FragmentCache(max_entries=4, ttl=30)
+    cache.set((1, 1), Fragment("page 1", 1))
+
+    now[0] += 30
+    assert cache.get((1, 1)) == Fragment("page 1", 1)
+    now[0] += 1
+    assert (1, 1) not in cache
+    assert cache.get((1, 1)) is None
+    assert cache.stats()["size"] == 0
+
+
+def test_fragment_cache_evicts_the_least_recently_used_page():
+    cache = FragmentCache(max_entries=2, ttl=60)
+    cache.set((1, 1), Fragment("page 1", 3))
+    cache.set((1, 2), Fragment("page 2", 3))
+    cache.get((1, 1))
+    cache.set((1, 3), Fragment("page 3", 3))
+
+    assert (1, 1) in cache and (1, 3) in cache
+    assert (1, 2) not in cache
+    assert cache.stats()["evictions"] == 1
+
+
+@pytest.mark.asyncio
+async def test_concurrent_prefetches_of_a_page_render_it_once():
+    cache = FragmentCache(max_entries=4, ttl=60)
+    release = asyncio.Event()
+    renders = []
+
+    async def render():
+        renders.append(1)
+        await release.wait()
+        return Fragment("page 2", 3)
+
+    for _ in range(3):
+        cache.prefetch((1, 2), render)
+    await asyncio.sleep(0)
+    assert cache.stats()["prefetching"] == 1
+    release.set()
+    await asyncio.sleep(0.01)
+
+    assert len(renders) == 1
+    assert cache.get((1, 2)) == Fragment("page 2", 3)
+    cache.prefetch((1, 2), render)
+    assert cache.stats()["prefetching"] == 0
+    assert cache.stats()["prefetched"] == 1
+
+
+@pytest.mark.asyncio
+async def test_failed_prefetch_is_counted_and_leaves_no_entry():
+    cache = FragmentCache(max_entries=4, ttl=60)
+
+    async def render():
+        raise RuntimeError("backend down")
+
+    cache.prefetch((1, 2), render)
+    await asyncio.sleep(0.01)
+
+    assert (1, 2) not in cache
+    assert cache.stats()["prefetch_errors"] == 1 and cache.stats()["prefetching"] == 0
+
+
+def test_page_flip_warms_the_neighbouring_pages(client, backend):
+    response = client.get("/search", params={"page": 2, "query_id": 7})
+    assert response.status_code == 200
+    assert "Paper 10" in response.text
+    wait_for_prefetches(client.app.state.fragments)
+
+    # The requested page, then both neighbours; the backend counts pages from 0.
+    assert sorted(int(request.url.params["page"]) for request in backend["requests"]) == [0, 1, 2]
+    assert all(request.url.path == "/queries/7/results" for request in backend["requests"])
+
+    backend["requests"].clear()
+    for page in (1, 3):
+        assert f"Paper {(page - 1) * 10}" in client.get("/search", params={"page": page, "query_id": 7}).text
+    wait_for_prefetches(client.app.state.fragments)
+    assert backend["requests"] == []
+
+
+def test_search_caches_the_first_page_it_embeds(client, backend):
+    response = client.post("/search", data={"author": "Einstein"})
+    assert "Paper 0" in response.text
+    wait_for_prefetches(client.app.state.fragments)
+
+    assert [request.method for request in backend["requests"]] == ["POST", "GET"]
+    assert (7, 1) in client.app.state.fragments and (7, 2) in client.app.state.fragments
+
+
+def test_cache_endpoint_reports_fragment_cache_stats(client):
+    client.get("/search", params={"page": 1, "query_id": 7})
+    wait_for_prefetches(client.app.state.fragments)
+    client.get("/search", params={"page": 2, "query_id": 7})
+    wait_for_prefetches(client.app.state.fragments)
+
+    stats = client.get("/cache").json()
+    assert stats["max_entries"] == client.app.state.fragments.max_entries
+    assert (stats["hits"], stats["misses"], stats["prefetched"], stats["size"]) == (1, 1, 2, 3)
+
+
+def test_accepted_encodings_drop_codings_refused_with_q_zero():
+    assert accepted_encodings(None) == {"identity"}
+    assert accepted_encodings("gzip, deflate, br") == {"identity", "gzip", "deflate", "br"}
+    assert accepted_encodings("br;q=0, GZIP;q=0.5") == {"identity", "gzip"}
+    assert accepted_encodings("br;q=oops") == {"identity"}
+
+
+def test_static_assets_rewrite_stylesheets_to_hashed_names(tmp_path):
+    (tmp_path / "fonts").mkdir()
+    (tmp_path / "fonts" / "body.woff2").write_bytes(b"font bytes")
+    (tmp_path / "site.css").write_text("@font-face { src: url('fonts/body.woff2') } .logo { background: url(x.png) }")
+    assets = StaticAssets(tmp_path, ["fonts/body.woff2", "site.css"])
+
+    font_url = assets.url("fonts/body.woff2")
+    assert font_url == f"/static/body.{hashlib.sha256(b'font bytes').hexdigest()[:12]}.woff2"
+    css = assets.response(assets.url("site.css").removeprefix("/static/"), None).body
+    # Files listed before the stylesheet get their hashed name; anything else is left alone.
+    assert css == f"@font-face {{ src: url({font_url}) }} .logo {{ background: url(x.png) }}".encode()
+    assert assets.url("site.css") == f"/static/site.{hashlib.sha256(css).hexdigest()[:12]}.css"
+
+
+def test_static_assets_serve_the_smallest_accepted_variant(tmp_path):
+    content = b"body { color: black; }\n" * 200
+    (tmp_path / "site.css").write_bytes(content)
+    (tmp_path / "font.woff2").write_bytes(b"already compressed")
+    assets = StaticAssets(tmp_path, ["site.css", "font.woff2"])
+    name = assets.url("site.css").removeprefix("/static/")
+
+    served = assets.response(name, "gzip, br")
+    assert served.headers["content-encoding"] == "br"
+    assert brotli.decompress(served.body) == content
+    served = assets.response(name, "gzip, br;q=0")
+    assert served.headers["content-encoding"] == "gzip"
+    assert gzip.decompress(served.body) == content
+    served = assets.response(name, None)
+    assert "content-encoding" not in served.headers and served.body == content
+    assert served.headers["cache-control"] == IMMUTABLE_CACHE_CONTROL
+    assert served.headers["vary"] == "Accept-Encoding"
+    assert served.headers["content-type"].startswith("text/css")
+
+    # Fonts are compressed already: one variant, nothing to vary on.
+    font = assets.response(assets.url("font.woff2").removeprefix("/static/"), "gzip, br")
+    assert "content-encoding" not in font.headers and "vary" not in font.headers
+    assert font.body == b"already compressed" and font.headers["content-type"] == "font/woff2"
+    assert assets.response("site.css", None).status_code == 404
+
+
+def test_static_route_serves_vendored_assets_under_hashed_names(client):
+    assets: StaticAssets = client.app.state.assets
+    original = (SRC_DIR / "assets" / "vendor" / "htmx.min.js").read_bytes()
+
+    response = client.get(assets.url("vendor/htmx.min.js"), headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["cache-control"] == IMMUTABLE_CACHE_CONTROL
+    assert response.content == original
+    stylesheet = client.get(assets.url("vendor/roboto.css"), headers={"Accept-Encoding": "br"})
+    assert stylesheet.headers["content-encoding"] == "br"
+    assert f"url({assets.url('vendor/fonts/roboto-regular.woff2')})" in stylesheet.text
+    assert client.get("/static/htmx.min.js").status_code == 404
+
+
+def test_index_page_is_revalidated_with_its_etag(client):
+    assets: StaticAssets = client.app.state.assets
+    page = client.get("/")
+    assert page.status_code == 200
+    assert page.headers["cache-control"] == "no-cache"
+    for name in ("vendor/pico.min.css", "vendor/roboto.css", "styles.css", "vendor/htmx.min.js", "favicon.ico"):
+        assert assets.url(name) in page.text
+    etag = page.headers["etag"]
+
+    revalidated = client.get("/", headers={"If-None-Match": etag})
+    assert revalidated.status_code == 304
+    assert revalidated.content == b"" and revalidated.headers["etag"] == etag
+    assert client.get("/", headers={"If-None-Match": '"stale"'}).status_code == 200